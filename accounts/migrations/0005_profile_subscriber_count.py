@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_profile_sub_journalist_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='subscriber_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -21,6 +21,8 @@ class Profile(models.Model):
     sub_journalist = models.ManyToManyField(User, null=True, blank=True, default=None , related_name="subscribers")
     sub_publisher = models.ManyToManyField("bronewsapp.Publisher", null=True, blank=True, default=None, related_name="subscribers") 
     publisher = models.ForeignKey("bronewsapp.Publisher", on_delete=models.CASCADE, null=True, blank=True, default=None)
+    # Readers subscribed to this user as a journalist; maintained by bronewsapp.subscriptions.
+    subscriber_count = models.PositiveIntegerField(default=0, editable=False)
 # limit choices
     def __str__(self):
         return f"{self.user.username} ({self.role})"
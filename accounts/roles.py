@@ -0,0 +1,110 @@
+"""
+Request-scoped role context and the checks built on it.
+
+``RoleMiddleware`` attaches ``request.role`` to every request. It is
+resolved lazily from ``request.user`` (whose profile the
+:class:`~accounts.backends.ProfileBackend` already loaded), so checking a
+role never issues a query of its own.
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.shortcuts import redirect
+from django.utils.functional import SimpleLazyObject
+
+from .models import Profile
+
+
+class RoleContext:
+    """The profile and role of a user, or ``None`` for both if they have none."""
+
+    __slots__ = ("user", "profile", "role")
+
+    def __init__(self, user):
+        self.user = user
+        self.profile = getattr(user, "profile", None) if user.is_authenticated else None
+        self.role = self.profile.role if self.profile else None
+
+    def has(self, *roles):
+        return self.role is not None and self.role in roles
+
+    @property
+    def is_reader(self):
+        return self.role == Profile.Role.READER
+
+    @property
+    def is_journalist(self):
+        return self.role == Profile.Role.JOURNALIST
+
+    @property
+    def is_editor(self):
+        return self.role == Profile.Role.EDITOR
+
+    @property
+    def is_admin(self):
+        return self.role == Profile.Role.ADMIN
+
+
+class RoleMiddleware:
+    """Sets ``request.role``. Must come after AuthenticationMiddleware."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Returns the view's coroutine as-is when the chain is async.
+        request.role = SimpleLazyObject(lambda: RoleContext(request.user))
+        return self.get_response(request)
+
+
+async def arole_context(user):
+    """
+    :class:`RoleContext` for async code. Users not loaded through
+    :class:`~accounts.backends.ProfileBackend` (sessions created with the
+    plain ``ModelBackend``, say) get their profile with the async ORM
+    first, since reading it lazily would be a synchronous query.
+    """
+    if user.is_authenticated and not User.profile.is_cached(user):
+        # Cached even when missing, so templates reading it never query.
+        User.profile.related.set_cached_value(user, await Profile.objects.filter(user_id=user.pk).afirst())
+    return RoleContext(user)
+
+
+async def aload_role(request):
+    """
+    Resolves ``request.user`` and ``request.role`` without blocking, for
+    async views. Lazy ``request.user`` would otherwise query the database
+    synchronously the first time a template touches it.
+    """
+    request.user = await request.auser()
+    request.role = await arole_context(request.user)
+    return request.role
+
+
+def role_required(*roles, message, login_message="You must be logged in to do that.", redirect_to="home"):
+    """
+    Restricts a view to users with one of ``roles``.
+
+    Anonymous users are sent to the login page with ``login_message``;
+    users without the role get ``message`` and are redirected to the
+    ``redirect_to`` URL name, reversed with the view's own URL kwargs.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                messages.error(request, login_message)
+                return redirect("login")
+            if not request.role.has(*roles):
+                messages.error(request, message)
+                return redirect(redirect_to, **kwargs)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,3 +1,74 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from bronewsapp.models import Article
+
+from .models import Profile
+from .roles import RoleContext
+
+
+def make_user(username, role):
+    user = User.objects.create_user(username=username, password='pwd')
+    user.profile.role = role
+    user.profile.save()
+    return user
+
+
+class RoleContextTest(TestCase):
+
+    """Tests for the profile-loading backend and request.role."""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = make_user('reader', Profile.Role.READER)
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.editor = make_user('editor', Profile.Role.EDITOR)
+
+    def test_user_and_profile_load_in_one_query(self):
+        """A logged-in page costs the session plus one user/profile query, whatever the checks."""
+        self.client.login(username='reader', password='pwd')
+        url = reverse('journalist_detail', args=[self.journalist.pk])
+        with self.assertNumQueries(5):  # session, user with profile, journalist with profile, subscriptions
+            response = self.client.get(url)
+        self.assertContains(response, 'Subscribe')
+        with self.assertNumQueries(3):  # subscriptions now cached
+            self.client.get(url)
+
+    def test_role_context(self):
+        role = RoleContext(User.objects.select_related('profile').get(pk=self.editor.pk))
+        self.assertTrue(role.is_editor)
+        self.assertTrue(role.has(Profile.Role.EDITOR, Profile.Role.ADMIN))
+        self.assertFalse(role.has(Profile.Role.READER))
+
+        no_profile = User.objects.create(username='bare')
+        Profile.objects.filter(user=no_profile).delete()
+        role = RoleContext(User.objects.select_related('profile').get(pk=no_profile.pk))
+        self.assertIsNone(role.role)
+        self.assertFalse(role.has(Profile.Role.READER))
+
+    def test_role_required_redirects(self):
+        url = reverse('article_create')
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('login'))
+
+        self.client.login(username='reader', password='pwd')
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('home'))
+
+        self.client.login(username='journalist', password='pwd')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_role_required_redirects_with_view_kwargs(self):
+        article = Article.objects.create(title='Story', content='Body.', author=self.journalist)
+        self.client.login(username='journalist', password='pwd')
+        response = self.client.post(reverse('article_approve', args=[article.pk]))
+        self.assertRedirects(response, reverse('article_detail', args=[article.pk]))
+        article.refresh_from_db()
+        self.assertFalse(article.is_approved)
+
+        self.client.login(username='editor', password='pwd')
+        self.client.post(reverse('article_approve', args=[article.pk]))
+        article.refresh_from_db()
+        self.assertTrue(article.is_approved)
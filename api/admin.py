@@ -1,3 +1,22 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ApiToken
+from .tokens import revoke
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ("prefix", "user", "name", "created_at", "revoked_at")
+    list_filter = ("revoked_at",)
+    search_fields = ("user__username", "prefix", "name")
+    readonly_fields = ("user", "prefix", "created_at", "revoked_at")
+    actions = ["revoke_tokens"]
+
+    def has_add_permission(self, request):
+        # Tokens are issued through the API, which shows the token once.
+        return False
+
+    @admin.action(description="Revoke selected tokens")
+    def revoke_tokens(self, request, queryset):
+        for api_token in queryset.filter(revoked_at=None):
+            revoke(api_token)
@@ -0,0 +1,84 @@
+"""
+Authentication for the API.
+
+:class:`ApiTokenAuthentication` accepts ``Authorization: Bearer <token>``
+with a token from :mod:`api.tokens`; it is the recommended scheme for
+machine clients, as HTTP Basic hashes the password on every request.
+
+DRF views run synchronously, so the async endpoints are plain Django views
+that accept the same credentials as the DRF ones: the session first, then
+a bearer token or HTTP Basic.
+"""
+import base64
+import binascii
+
+from django.contrib.auth import aauthenticate
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, BasicAuthentication
+
+from .tokens import auser_for, user_for
+
+INVALID_TOKEN = "Invalid or revoked token."
+
+
+def _credentials(request, scheme):
+    """The credentials of an ``Authorization: <scheme> ...`` header, or ``None``."""
+    given, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if given.lower() != scheme or not credentials.strip():
+        return None
+    return credentials.strip()
+
+
+class ApiTokenAuthentication(BaseAuthentication):
+    """Authenticates ``Authorization: Bearer <token>`` requests."""
+
+    def authenticate(self, request):
+        token = _credentials(request, "bearer")
+        if token is None:
+            return None
+        user = user_for(token)
+        if user is None:
+            raise exceptions.AuthenticationFailed(INVALID_TOKEN)
+        return user, token
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+
+def _failed(message, authentication):
+    """An ``AuthenticationFailed`` carrying the challenge of the scheme that was tried."""
+    exc = exceptions.AuthenticationFailed(message)
+    exc.auth_header = authentication().authenticate_header(None)
+    return exc
+
+
+async def aget_api_user(request):
+    """
+    The active user of a session, bearer token or HTTP Basic request, or
+    ``None`` if the request carries no credentials. Invalid credentials
+    raise ``AuthenticationFailed`` with the message the DRF classes use and
+    the ``WWW-Authenticate`` challenge in its ``auth_header``.
+    """
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+
+    token = _credentials(request, "bearer")
+    if token is not None:
+        user = await auser_for(token)
+        if user is None:
+            raise _failed(INVALID_TOKEN, ApiTokenAuthentication)
+        return user
+    credentials = _credentials(request, "basic")
+    if credentials is None:
+        return None
+    try:
+        username, separator, password = base64.b64decode(credentials).decode().partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        separator = ""
+    if not separator:
+        raise _failed("Invalid basic header. Credentials not correctly base64 encoded.", BasicAuthentication)
+    user = await aauthenticate(request, username=username, password=password)
+    if user is None:
+        raise _failed("Invalid username/password.", BasicAuthentication)
+    return user
@@ -0,0 +1,20 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class ApiToken(models.Model):
+    """
+    A bearer token for machine clients of the API. Only the SHA-256 digest
+    of the token is stored; the token itself is shown once, when issued.
+    See :mod:`api.tokens`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="api_tokens")
+    name = models.CharField(max_length=100, blank=True, default="")
+    # The start of the token, so its owner can tell their tokens apart.
+    prefix = models.CharField(max_length=12, editable=False)
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    revoked_at = models.DateTimeField(null=True, blank=True, default=None)
+
+    def __str__(self):
+        return f"{self.prefix}… ({self.user.username})"
@@ -0,0 +1,119 @@
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from bronewsapp import feed
+from bronewsapp.conditional import make_etag
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination on ``id``, newest first.
+
+    Clients pass ``?limit=`` and the ``next_cursor`` of the previous page
+    as ``?cursor=``. Each page is a single ``WHERE id < cursor ... LIMIT``
+    query, so its cost does not depend on how deep into the results the
+    client is or how large the full result set is.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+
+    def _int_param(self, request, name, default=None):
+        value = request.query_params.get(name)
+        if value in (None, ''):
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({name: "Must be an integer."})
+        if value < 1:
+            raise ValidationError({name: "Must be a positive integer."})
+        return value
+
+    def get_limit(self, request):
+        return min(
+            self._int_param(request, self.limit_query_param, settings.API_PAGE_SIZE),
+            settings.API_MAX_PAGE_SIZE,
+        )
+
+    def _window(self, queryset, request):
+        """The requested page plus one extra row, to learn whether another page exists."""
+        self.request = request
+        self.limit = self.get_limit(request)
+        cursor = self._int_param(request, self.cursor_query_param)
+
+        queryset = queryset.order_by('-id')
+        if cursor is not None:
+            queryset = queryset.filter(id__lt=cursor)
+        return queryset[:self.limit + 1]
+
+    def page_etag(self, queryset, request, *extra):
+        """
+        Returns the ETag of the page ``paginate_queryset`` would return, from
+        the ids and ``updated_at`` of its rows only. List pages get no
+        ``Last-Modified``: when a newer row leaves the page, the newest
+        ``updated_at`` goes backwards although the contents changed.
+        """
+        rows = list(self._window(queryset, request).values_list('id', 'updated_at'))
+        return self._etag(rows, extra)
+
+    async def apage_etag(self, queryset, request, *extra):
+        """Async version of :meth:`page_etag`."""
+        rows = [row async for row in self._window(queryset, request).values_list('id', 'updated_at')]
+        return self._etag(rows, extra)
+
+    def _etag(self, rows, extra):
+        return make_etag(self.limit, *extra, *(f"{pk}@{updated_at.isoformat()}" for pk, updated_at in rows))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._page(list(self._window(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """Async version of :meth:`paginate_queryset`."""
+        return self._page([item async for item in self._window(queryset, request)])
+
+    def _page(self, rows):
+        self.next_cursor = rows[self.limit - 1].id if len(rows) > self.limit else None
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next_cursor': self.next_cursor,
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Keyset pagination over a reader's materialized feed.
+
+    The cursor is an opaque token for the last ``(published_at, type, id)``
+    row of the previous page.
+    """
+
+    def paginate_feed(self, profile, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                cursor = feed.decode_cursor(cursor)
+            except ValueError:
+                raise ValidationError({self.cursor_query_param: "Invalid cursor."})
+
+        rows = feed.read_feed(profile, self.limit + 1, cursor)
+        self.next_cursor = feed.encode_cursor(rows[self.limit - 1]) if len(rows) > self.limit else None
+        return feed.hydrate(rows[:self.limit])
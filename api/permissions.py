@@ -0,0 +1,26 @@
+from rest_framework.permissions import BasePermission
+
+from accounts.models import Profile
+from accounts.roles import RoleContext
+
+
+class HasRole(BasePermission):
+    """
+    Allows users whose profile has one of ``roles``. Also sets
+    ``request.role`` for the view, from the user DRF authenticated.
+    """
+    roles = ()
+
+    def has_permission(self, request, view):
+        request.role = RoleContext(request.user)
+        return request.role.has(*self.roles)
+
+
+class IsReader(HasRole):
+    roles = (Profile.Role.READER,)
+    message = "Access denied. Only authenticated readers can use this endpoint."
+
+
+class IsEditor(HasRole):
+    roles = (Profile.Role.EDITOR,)
+    message = "Access denied. Only editors can use this endpoint."
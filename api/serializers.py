@@ -1,8 +1,58 @@
+from django.conf import settings
 from rest_framework import serializers
 from bronewsapp.models import Article
+from .models import ApiToken
 
 
 class ArticleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Article
-        fields = ['id', 'title', 'content', 'author', 'publisher', 'is_approved'] 
\ No newline at end of file
+        fields = ['id', 'title', 'content', 'author', 'publisher', 'is_approved']
+
+
+class FeedItemSerializer(serializers.Serializer):
+    """Listing fields of an article or newsletter in a reader's feed."""
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    author = serializers.IntegerField()
+    publisher = serializers.IntegerField(allow_null=True)
+    published_at = serializers.DateTimeField()
+
+
+class SearchResultSerializer(serializers.Serializer):
+    """An article or newsletter search hit, best match first."""
+    type = serializers.CharField(source='item_type')
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    author = serializers.IntegerField(source='author_id')
+    publisher = serializers.IntegerField(source='publisher_id', allow_null=True)
+    rank = serializers.FloatField(source='search_rank')
+
+
+class BulkApprovalSerializer(serializers.Serializer):
+    """The articles or newsletters an editor wants approved."""
+    type = serializers.ChoiceField(choices=['article', 'newsletter'])
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.APPROVAL_BULK_MAX,
+    )
+
+
+class ApiTokenSerializer(serializers.ModelSerializer):
+    """An API token as its owner sees it: everything but the token and its digest."""
+    class Meta:
+        model = ApiToken
+        fields = ['id', 'name', 'prefix', 'created_at', 'revoked_at']
+        read_only_fields = ['prefix', 'created_at', 'revoked_at']
+
+
+class SubscriptionImportSerializer(serializers.Serializer):
+    """The journalist (user) ids and publisher ids a reader wants to subscribe to."""
+    journalists = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), default=list, max_length=settings.SUBSCRIPTION_IMPORT_MAX,
+    )
+    publishers = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), default=list, max_length=settings.SUBSCRIPTION_IMPORT_MAX,
+    )
@@ -1,15 +1,29 @@
 # api/tests.py
 
+import base64
+import csv
+import io
+import json
+import time
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
-from bronewsapp.models import Profile, Article, Publisher 
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from datetime import timedelta
+from unittest import mock
+from api import tokens
+from api.models import ApiToken
+from bronewsapp.models import Profile, Article, Newsletter, Publisher 
+from bronewsapp.testing import QueryBudgetMixin
 
 User = get_user_model()
 
 
-class SubscribedJournalistArticlesAPITest(APITestCase):
+class SubscribedJournalistArticlesAPITest(QueryBudgetMixin, APITestCase):
 
     """Test for Journalist Articles, only subscribed."""
     
@@ -52,30 +66,404 @@ class SubscribedJournalistArticlesAPITest(APITestCase):
 
     def test_reader_gets_subscribed_articles(self):
         """Test reader gets articles from subscription"""
-        self.client.force_authenticate(user=self.reader)
+        self.client.force_login(self.reader)
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['title'], self.article_approved.title)
+        results = response.json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['title'], self.article_approved.title)
+        self.assertIsNone(response.json()['next_cursor'])
         
-        self.assertNotIn(self.article_unapproved.title, [a['title'] for a in response.data])
-        self.assertNotIn(self.article_other_jrnlst.title, [a['title'] for a in response.data])
+        self.assertNotIn(self.article_unapproved.title, [a['title'] for a in results])
+        self.assertNotIn(self.article_other_jrnlst.title, [a['title'] for a in results])
 
     def test_no_subscriptions_gets_empty_list(self):
         """Test no empty list in subscruortions"""
         self.reader.profile.sub_journalist.clear()
-        self.client.force_authenticate(user=self.reader)
+        self.client.force_login(self.reader)
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(len(response.json()['results']), 0)
+
+    def test_keyset_pages_cover_all_articles_once(self):
+        """Test following next_cursor walks every article newest first, without repeats."""
+        pub = Publisher.objects.get(name='Simple Pub')
+        for i in range(4):
+            Article.objects.create(
+                title=f'More {i}', content='.', author=self.journalist, publisher=pub, is_approved=True
+            )
+        self.client.force_login(self.reader)
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2} if cursor is None else {'limit': 2, 'cursor': cursor}
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.json()['results']), 2)
+            seen += [a['id'] for a in response.json()['results']]
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                break
+
+        expected = list(Article.objects.filter(author=self.journalist, is_approved=True)
+                        .order_by('-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    @override_settings(API_MAX_PAGE_SIZE=1)
+    def test_limit_is_capped_and_validated(self):
+        """Test limit above the maximum is capped and a bad cursor is rejected."""
+        Article.objects.create(title='Second', content='.', author=self.journalist, is_approved=True)
+        self.client.force_login(self.reader)
+
+        response = self.client.get(self.url, {'limit': 50})
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNotNone(response.json()['next_cursor'])
+
+        response = self.client.get(self.url, {'cursor': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unchanged_page_is_not_modified(self):
+        """Conditional requests get 304 until an article on the page changes."""
+        self.client.force_login(self.reader)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(3):  # session, user with profile, page validators
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.article_approved.title = 'Retitled'
+        self.article_approved.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_page_has_no_last_modified(self):
+        """A newer article leaving the page moves the newest update back, so only the ETag validates."""
+        newer = Article.objects.create(title='Newer', content='.', author=self.journalist, is_approved=True)
+        self.client.force_login(self.reader)
+        self.client.get(self.url)
+
+        newer.is_approved = False
+        newer.save()
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_basic_auth_loads_profile_with_user(self):
+        """Basic auth plus the reader check cost one query before the page itself."""
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'reader:pwd').decode())
+        with self.assertNumQueries(3):  # user with profile, page validators, page
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_basic_credentials_are_unauthorized(self):
+        """Wrong credentials are told apart from missing ones, as by DRF's BasicAuthentication."""
+        for credentials, detail in ((base64.b64encode(b'reader:wrong').decode(), 'Invalid username/password.'),
+                                    ('not-base64', 'Invalid basic header. Credentials not correctly base64 encoded.')):
+            self.client.credentials(HTTP_AUTHORIZATION='Basic ' + credentials)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(response.json(), {'detail': detail})
+            self.assertEqual(response['WWW-Authenticate'], 'Basic realm="api"')
+
+        self.client.credentials()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertNotIn('WWW-Authenticate', response)
+
+    def test_query_budget(self):
+        """Session, user, validators and one page query, however many articles there are."""
+        for i in range(10):
+            Article.objects.create(title=f'Extra {i}', content='.', author=self.journalist, is_approved=True)
+        self.client.force_login(self.reader)
+        with self.assertQueryBudget(4):
+            self.client.get(self.url)
 
     def test_non_reader_forbidden(self):
         "Testing if the non reader is forbidden access."
-        self.client.force_authenticate(user=self.editor)
+        self.client.force_login(self.editor)
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
     def test_unauthenticated_unauthorized(self):
         """testing unauthenticated and unauthorized."""
         response = self.client.get(self.url)
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ReaderFeedAPITest(APITestCase):
+
+    """Test for the reader feed API."""
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader', password='pwd')
+        self.journalist = User.objects.create_user(username='journalist', password='pwd')
+        self.journalist.profile.role = Profile.Role.JOURNALIST
+        self.journalist.profile.save()
+
+        self.reader.profile.sub_journalist.add(self.journalist)
+        self.url = reverse('api_reader_feed')
+
+    def test_feed_pages_through_articles_and_newsletters(self):
+        """Test cursor pages cover every feed item once, newest first."""
+        now = timezone.now()
+        created = []
+        for i in range(3):
+            for model in (Article, Newsletter):
+                item = model.objects.create(
+                    title=f'{model.__name__} {i}', content='.', author=self.journalist,
+                    is_approved=True, approved_at=now - timedelta(minutes=i),
+                )
+                created.append(item)
+        # Same timestamp for both types: the cursor must still not skip or repeat items.
+        self.reader.profile.sub_journalist.remove(self.journalist)
+        self.reader.profile.sub_journalist.add(self.journalist)
+
+        self.client.force_authenticate(user=self.reader)
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 4} if cursor is None else {'limit': 4, 'cursor': cursor}
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [(item['type'], item['title']) for item in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+        self.assertEqual(seen[:2], [('newsletter', 'Newsletter 0'), ('article', 'Article 0')])
+        self.assertNotIn('content', response.data['results'][0])
+
+    def test_bad_cursor_rejected(self):
+        """Test a malformed cursor is a 400."""
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.get(self.url, {'cursor': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkApproveAPITest(APITestCase):
+
+    """Tests for the editors' bulk approval endpoint."""
+
+    def setUp(self):
+        self.editor = User.objects.create_user(username='editor', password='pwd')
+        self.editor.profile.role = Profile.Role.EDITOR
+        self.editor.profile.save()
+        self.journalist = User.objects.create_user(username='journalist', password='pwd')
+        self.journalist.profile.role = Profile.Role.JOURNALIST
+        self.journalist.profile.save()
+        self.pending = [
+            Newsletter.objects.create(title=f'Issue {i}', content='.', author=self.journalist) for i in range(3)
+        ]
+        self.pending[0].is_approved = True
+        self.pending[0].save()
+        self.url = reverse('api_bulk_approve')
+
+    def test_editor_approves_pending_ids(self):
+        self.client.force_authenticate(user=self.editor)
+        ids = [n.pk for n in self.pending] + [999]
+        response = self.client.post(self.url, {'type': 'newsletter', 'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'approved': ids[1:3], 'skipped': [ids[0], 999]})
+        self.assertFalse(Newsletter.objects.filter(is_approved=False).exists())
+
+    def test_validation_and_permissions(self):
+        self.client.force_authenticate(user=self.editor)
+        response = self.client.post(self.url, {'type': 'article', 'ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=self.journalist)
+        response = self.client.post(self.url, {'type': 'newsletter', 'ids': [self.pending[1].pk]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Newsletter.objects.get(pk=self.pending[1].pk).is_approved)
+
+
+class ApiTokenTest(APITestCase):
+
+    """Tests for issuing, using and revoking API tokens."""
+
+    def setUp(self):
+        tokens._verified.clear()
+        self.reader = User.objects.create_user(username='reader', password='pwd')
+        self.other = User.objects.create_user(username='other', password='pwd')
+        self.editor = User.objects.create_user(username='editor', password='pwd')
+        self.editor.profile.role = Profile.Role.EDITOR
+        self.editor.profile.save()
+        self.journalist = User.objects.create_user(username='journalist', password='pwd')
+        self.journalist.profile.role = Profile.Role.JOURNALIST
+        self.journalist.profile.save()
+        Article.objects.create(title='Approved', content='.', author=self.journalist, is_approved=True)
+        self.reader.profile.sub_journalist.add(self.journalist)
+        self.url = reverse('api_subscribed_journalist_articles')
+
+    def bearer(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_reader_issues_and_lists_tokens(self):
+        self.client.force_login(self.reader)
+        response = self.client.post(reverse('api_tokens'), {'name': 'laptop'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        token = response.data['token']
+        self.assertTrue(token.startswith(response.data['prefix']))
+
+        api_token = ApiToken.objects.get()
+        self.assertEqual(api_token.digest, tokens.digest(token))
+        self.assertNotIn(token, api_token.digest)
+
+        listed = self.client.get(reverse('api_tokens')).data
+        self.assertEqual([t['name'] for t in listed], ['laptop'])
+        self.assertNotIn('token', listed[0])
+        self.assertNotIn('digest', listed[0])
+
+        self.client.force_login(self.editor)
+        self.assertEqual(self.client.post(reverse('api_tokens')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_token_authenticates_without_hashing_the_password(self):
+        _, token = tokens.issue(self.reader)
+        self.client.logout()
+        self.bearer(token)
+        with mock.patch('django.contrib.auth.hashers.PBKDF2PasswordHasher.verify') as verify:
+            with self.assertNumQueries(4):  # token, user with profile, page validators, page
+                response = self.client.get(self.url)
+            self.assertEqual([a['title'] for a in response.json()['results']], ['Approved'])
+            with self.assertNumQueries(3):  # the token is verified from the cache
+                self.client.get(self.url)
+            self.assertEqual(self.client.get(reverse('api_reader_feed')).status_code, status.HTTP_200_OK)
+        verify.assert_not_called()
+
+    def test_unknown_and_revoked_tokens_are_rejected(self):
+        api_token, token = tokens.issue(self.reader)
+        self.bearer('bnt_unknown')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json(), {'detail': 'Invalid or revoked token.'})
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        self.assertEqual(self.client.get(reverse('api_reader_feed')).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.bearer(token)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.client.force_login(self.other)
+        revoke_url = reverse('api_revoke_token', args=[api_token.pk])
+        self.assertEqual(self.client.delete(revoke_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.delete(revoke_url).status_code, status.HTTP_204_NO_CONTENT)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_revocation_elsewhere_applies_when_the_cache_expires(self):
+        _, token = tokens.issue(self.reader)
+        self.bearer(token)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        # Revoked by another process: this one still trusts its cached check.
+        ApiToken.objects.update(revoked_at=timezone.now())
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        later = tokens.time.monotonic() + settings.API_TOKEN_CACHE_SECONDS + 1
+        with mock.patch('api.tokens.time.monotonic', return_value=later):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_users_are_rejected_at_once(self):
+        _, token = tokens.issue(self.reader)
+        self.bearer(token)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        User.objects.filter(pk=self.reader.pk).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class SubscriptionImportAPITest(APITestCase):
+
+    """Tests for the bulk subscription import endpoint."""
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader', password='pwd')
+        self.journalist = User.objects.create_user(username='journalist', password='pwd')
+        self.journalist.profile.role = Profile.Role.JOURNALIST
+        self.journalist.profile.save()
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        self.url = reverse('api_import_subscriptions')
+
+    def test_reader_imports_subscriptions(self):
+        self.client.force_authenticate(user=self.reader)
+        data = {'journalists': [self.journalist.pk, self.reader.pk], 'publishers': [self.publisher.pk, 999]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'journalists': {'subscribed': [self.journalist.pk], 'skipped': [self.reader.pk]},
+            'publishers': {'subscribed': [self.publisher.pk], 'skipped': [999]},
+        })
+        self.assertEqual(Publisher.objects.get(pk=self.publisher.pk).subscriber_count, 1)
+
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.data['publishers'], {'subscribed': [], 'skipped': [self.publisher.pk, 999]})
+
+    def test_validation_and_permissions(self):
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.post(self.url, {'journalists': ['x']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=self.journalist)
+        response = self.client.post(self.url, {'publishers': [self.publisher.pk]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PublisherArchiveAPITest(APITestCase):
+
+    """Tests for the streaming publisher archive."""
+
+    def setUp(self):
+        self.journalist = User.objects.create_user(username='journalist', password='pwd')
+        self.journalist.profile.role = Profile.Role.JOURNALIST
+        self.journalist.profile.save()
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        other = Publisher.objects.create(name='Other', admin=self.journalist)
+        self.article = Article.objects.create(title='Story', content='Body.', author=self.journalist,
+                                              publisher=self.publisher, is_approved=True)
+        Newsletter.objects.create(title='Weekly', content='Issue.', author=self.journalist,
+                                  publisher=self.publisher, is_approved=True)
+        Article.objects.create(title='Draft', content='.', author=self.journalist, publisher=self.publisher)
+        Article.objects.create(title='Elsewhere', content='.', author=self.journalist, publisher=other,
+                               is_approved=True)
+        self.url = reverse('api_publisher_archive', args=[self.publisher.pk])
+
+    def body(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_streams_approved_items_as_ndjson(self):
+        with self.assertNumQueries(1):  # the publisher; rows are read as the response is sent
+            response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn(f'publisher-{self.publisher.pk}-archive.ndjson', response['Content-Disposition'])
+        rows = [json.loads(line) for line in self.body(response).splitlines()]
+        self.assertEqual([(row['type'], row['title'], row['publisher']) for row in rows],
+                         [('article', 'Story', 'Daily'), ('newsletter', 'Weekly', 'Daily')])
+
+    def test_csv_and_since(self):
+        since = self.client.get(self.url)['X-Archive-As-Of']
+        self.article.title = 'Updated story'
+        self.article.save()
+
+        response = self.client.get(self.url, {'format': 'csv', 'since': since})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.body(response))))
+        self.assertEqual([row['title'] for row in rows], ['Updated story'])
+        self.assertEqual(rows[0]['author'], 'journalist')
+
+    @override_settings(ARCHIVE_STREAM_BUFFER=1, ARCHIVE_CHUNK_SIZE=1)
+    async def test_asgi_streams_an_async_iterator(self):
+        """Under ASGI the rows are read as they are sent, not collected into a list first."""
+        response = await self.async_client.get(self.url, {'format': 'csv'})
+        self.assertTrue(response.is_async)
+
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)  # header, then one chunk per row
+        rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual([row['title'] for row in rows], ['Story', 'Weekly'])
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+        missing = reverse('api_publisher_archive', args=[999])
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,118 @@
+"""
+API tokens for machine clients.
+
+Tokens are long random strings, so unlike passwords they are safe to
+store as a fast SHA-256 digest: checking one costs a hash and an indexed
+lookup instead of a PBKDF2 run per request.
+
+Verified digests are kept in an in-process cache for
+``API_TOKEN_CACHE_SECONDS``, mapped to their user's id (or to ``None`` for
+unknown and revoked tokens), so a busy client costs no token query at all.
+:func:`revoke` drops the token from this process's cache; other processes
+stop accepting it once their entry expires. The user is still loaded on
+every request, so deactivating a user takes effect at once.
+"""
+import hashlib
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .models import ApiToken
+
+UserModel = get_user_model()
+
+PREFIX = "bnt_"
+# Characters of the token kept in ``ApiToken.prefix``.
+SHOWN_LENGTH = len(PREFIX) + 6
+
+
+def digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue(user, name=""):
+    """
+    Creates a token for ``user``. Returns ``(api_token, token)``; ``token``
+    is not stored anywhere, so it must be handed to the client now.
+    """
+    token = PREFIX + secrets.token_urlsafe(32)
+    api_token = ApiToken.objects.create(user=user, name=name, prefix=token[:SHOWN_LENGTH], digest=digest(token))
+    return api_token, token
+
+
+def revoke(api_token):
+    """Stops ``api_token`` from authenticating."""
+    ApiToken.objects.filter(pk=api_token.pk, revoked_at=None).update(revoked_at=timezone.now())
+    _verified.discard(api_token.digest)
+
+
+_MISSING = object()
+
+
+class _TTLCache:
+    """A small thread-safe dict whose entries expire; the oldest are dropped when it is full."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value, or ``_MISSING``."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return _MISSING
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= settings.API_TOKEN_CACHE_SIZE:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (time.monotonic() + settings.API_TOKEN_CACHE_SECONDS, value)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_verified = _TTLCache()
+
+
+def _valid(token_digest):
+    return ApiToken.objects.filter(digest=token_digest, revoked_at=None).values_list("user_id", flat=True)
+
+
+def _users():
+    return UserModel._default_manager.select_related("profile").filter(is_active=True)
+
+
+def user_for(token):
+    """The active user ``token`` was issued to, with their profile, or ``None``."""
+    token_digest = digest(token)
+    user_id = _verified.get(token_digest)
+    if user_id is _MISSING:
+        user_id = _valid(token_digest).first()
+        _verified.set(token_digest, user_id)
+    if user_id is None:
+        return None
+    return _users().filter(pk=user_id).first()
+
+
+async def auser_for(token):
+    """Async version of :func:`user_for`."""
+    token_digest = digest(token)
+    user_id = _verified.get(token_digest)
+    if user_id is _MISSING:
+        user_id = await _valid(token_digest).afirst()
+        _verified.set(token_digest, user_id)
+    if user_id is None:
+        return None
+    return await _users().filter(pk=user_id).afirst()
@@ -1,6 +1,16 @@
 from django.urls import path
-from .views import subscribed_journalist_articles_api
+from .views import (
+    api_tokens_api, bulk_approve_api, import_subscriptions_api, publisher_archive_api, reader_feed_api,
+    revoke_api_token_api, search_api, subscribed_journalist_articles_api,
+)
 
 urlpatterns = [
     path("sub-articles/", subscribed_journalist_articles_api, name='api_subscribed_journalist_articles'),
+    path("feed/", reader_feed_api, name='api_reader_feed'),
+    path("publishers/<int:publisher_id>/archive/", publisher_archive_api, name='api_publisher_archive'),
+    path("search/", search_api, name='api_search'),
+    path("approve/", bulk_approve_api, name='api_bulk_approve'),
+    path("subscriptions/import/", import_subscriptions_api, name='api_import_subscriptions'),
+    path("tokens/", api_tokens_api, name='api_tokens'),
+    path("tokens/<int:pk>/", revoke_api_token_api, name='api_revoke_token'),
 ]
\ No newline at end of file
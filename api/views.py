@@ -1,34 +1,264 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import ArticleSerializer
-from bronewsapp.models import Profile, Article
+from accounts.roles import arole_context
+from .authentication import ApiTokenAuthentication, aget_api_user
+from .models import ApiToken
+from .permissions import IsEditor, IsReader
+from .pagination import FeedPagination, KeysetPagination
+from .serializers import (
+    ApiTokenSerializer, ArticleSerializer, BulkApprovalSerializer, FeedItemSerializer, SearchResultSerializer,
+    SubscriptionImportSerializer,
+)
+from .tokens import issue, revoke
+from bronewsapp.approval import approve
+from bronewsapp.content_io import (
+    FORMATS, MODELS, abuffered, aencode_rows, buffered, encode_rows, export_queryset, export_row,
+)
+from bronewsapp.feed import JOURNALIST, PUBLISHER
+from bronewsapp.models import Article, Newsletter, Publisher
+from bronewsapp.search import load_results, search
+from bronewsapp.subscriptions import subscribe, valid_sources
 
 
-@api_view(['GET'])
-@authentication_classes([SessionAuthentication, BasicAuthentication])
-@permission_classes([IsAuthenticated])
-def subscribed_journalist_articles_api(request):
+@require_safe
+async def subscribed_journalist_articles_api(request):
     """
     API endpoint for retrieving articles from journalists that the
     authenticated client (reader) has subscribed to.
-    """
-    if not (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.READER):
-        return Response(
-            {"detail": "Access denied. Only authenticated readers can retrieve subscribed articles via this API."},
-            status=status.HTTP_403_FORBIDDEN
-        )
 
-    user_profile = request.user.profile
-    subscribed_journalists = user_profile.sub_journalist.all()
+    Results are newest first and keyset paginated: pass ``?limit=`` and
+    the ``next_cursor`` of the previous page as ``?cursor=``. Pages carry
+    an ``ETag`` and unchanged pages are answered with 304.
+
+    This is an async view, so it authenticates (session, bearer token or
+    Basic) and checks the role itself rather than through DRF.
+    """
+    try:
+        user = await aget_api_user(request)
+    except AuthenticationFailed as exc:
+        response = JsonResponse({"detail": exc.detail}, status=exc.status_code)
+        response["WWW-Authenticate"] = exc.auth_header
+        return response
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."},
+                            status=status.HTTP_403_FORBIDDEN)
+    request.user = user
+    request.role = await arole_context(user)
+    if not request.role.is_reader:
+        return JsonResponse({"detail": IsReader.message}, status=status.HTTP_403_FORBIDDEN)
 
     articles = Article.objects.filter(
-        author__in=subscribed_journalists,
+        author__subscribers=request.role.profile,
         is_approved=True
     )
 
-    serializer = ArticleSerializer(articles, many=True)
+    paginator = KeysetPagination()
+    api_request = Request(request)
+    try:
+        etag = await paginator.apage_etag(articles, api_request, user.pk)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        page = await paginator.apaginate_queryset(articles, api_request)
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, status=status.HTTP_400_BAD_REQUEST)
+    serializer = ArticleSerializer(page, many=True)
+
+    response = JsonResponse(paginator.get_paginated_data(serializer.data))
+    response['ETag'] = etag
+    return response
+
+
+ARCHIVE_CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _archive_rows(publisher_id, since, db):
+    for type_name, model in MODELS.items():
+        items = export_queryset(model, approved_only=True, publisher_id=publisher_id, since=since).using(db)
+        for values in items.iterator(chunk_size=settings.ARCHIVE_CHUNK_SIZE):
+            yield export_row(type_name, values)
+
+
+async def _aarchive_rows(publisher_id, since, db):
+    """:func:`_archive_rows` for ASGI, a chunk at a time from the ORM's thread (as ``.aiterator()`` does)."""
+    rows = _archive_rows(publisher_id, since, db)
+    next_chunk = sync_to_async(lambda: list(islice(rows, settings.ARCHIVE_CHUNK_SIZE)))
+    while chunk := await next_chunk():
+        for row in chunk:
+            yield row
+
+
+@require_safe
+def publisher_archive_api(request, publisher_id):
+    """
+    API endpoint that streams every approved article and newsletter of a
+    publisher, in the ``export_content`` row format. ``?format=ndjson``
+    (the default) or ``csv``; ``?since=<ISO 8601>`` limits it to items
+    changed after that time. ``X-Archive-As-Of`` is the time the archive
+    was taken, to pass as ``since`` on the next incremental pull.
+
+    Rows are read with ``.iterator()`` (a server-side cursor where the
+    database has them) while the response is sent, so the first bytes go
+    out at once and memory does not grow with the archive. Under ASGI the
+    stream is an async iterator fetching a chunk of rows at a time: Django
+    would read a synchronous one into a list before sending anything.
+    """
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return JsonResponse({"detail": f"format must be one of {', '.join(FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+    since = request.GET.get('since')
+    if since:
+        since = parse_datetime(since.replace(' ', '+'))  # an unescaped + in the offset arrives as a space
+        if since is None:
+            return JsonResponse({"detail": "since must be an ISO 8601 datetime."}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+    publisher = get_object_or_404(Publisher.objects.only('pk'), pk=publisher_id)
+
+    as_of = timezone.now()
+    # Chosen now: the rows are read after the view returns, outside the request's routing.
+    db = router.db_for_read(Article)
+    if isinstance(request, ASGIRequest):
+        lines = aencode_rows(_aarchive_rows(publisher.pk, since or None, db), fmt)
+        content = abuffered(lines, settings.ARCHIVE_STREAM_BUFFER)
+    else:
+        lines = encode_rows(_archive_rows(publisher.pk, since or None, db), fmt)
+        content = buffered(lines, settings.ARCHIVE_STREAM_BUFFER)
+    response = StreamingHttpResponse(content, content_type=ARCHIVE_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="publisher-{publisher.pk}-archive.{fmt}"'
+    response['X-Archive-As-Of'] = as_of.isoformat()
+    return response
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, ApiTokenAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated, IsReader])
+def reader_feed_api(request):
+    """
+    API endpoint for the authenticated reader's feed: approved articles and
+    newsletters from every journalist and publisher they subscribe to,
+    newest first. Paginated like ``sub-articles/`` with ``?cursor=``/``?limit=``.
+    """
+    paginator = FeedPagination()
+    items = paginator.paginate_feed(request.role.profile, request)
+    serializer = FeedItemSerializer(items, many=True)
+
+    return paginator.get_paginated_response(serializer.data)
+
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_api(request):
+    """
+    API endpoint for ranked full-text search across approved articles and
+    newsletters. Takes ``?q=`` plus optional ``?limit=`` and ``?offset=``.
+    """
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = min(int(request.query_params.get('limit', settings.SEARCH_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+        offset = int(request.query_params.get('offset', 0))
+    except ValueError:
+        return Response({"detail": "limit and offset must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1 or offset < 0:
+        return Response({"detail": "limit must be positive and offset non-negative."}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = load_results(search(query, limit=limit, offset=offset))
+    serializer = SearchResultSerializer(results, many=True)
+
+    return Response({'query': query, 'results': serializer.data}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication, ApiTokenAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated, IsEditor])
+def bulk_approve_api(request):
+    """
+    API endpoint for editors to approve many articles or newsletters at
+    once. Takes ``{"type": "article" | "newsletter", "ids": [...]}``.
+
+    The pending items are approved in one statement and their notifications
+    are batched per journalist. ``approved`` lists the ids this request
+    approved; ids that were already approved or do not exist are ``skipped``.
+    """
+    serializer = BulkApprovalSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    model = Article if serializer.validated_data['type'] == 'article' else Newsletter
+    ids = set(serializer.validated_data['ids'])
+
+    approved = [item.pk for item in approve(model, ids)]
+    return Response(
+        {'approved': approved, 'skipped': sorted(ids - set(approved))},
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication, ApiTokenAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated, IsReader])
+def import_subscriptions_api(request):
+    """
+    API endpoint for a reader to subscribe to many journalists and
+    publishers at once, e.g. when moving from another platform. Takes
+    ``{"journalists": [...], "publishers": [...]}`` (user and publisher ids).
+
+    The subscriptions are inserted in batches, skipping existing ones.
+    Per kind, ``subscribed`` lists the new subscriptions and ``skipped``
+    the ids that were already subscribed or are not journalists/publishers.
+    """
+    serializer = SubscriptionImportSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    profile_id = request.role.profile.pk
+
+    result = {}
+    for field, kind in (('journalists', JOURNALIST), ('publishers', PUBLISHER)):
+        ids = set(serializer.validated_data[field])
+        subscribed = subscribe(kind, profile_id, valid_sources(kind, ids)) if ids else set()
+        result[field] = {'subscribed': sorted(subscribed), 'skipped': sorted(ids - subscribed)}
+    return Response(result, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'POST'])
+@authentication_classes([SessionAuthentication, ApiTokenAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated, IsReader])
+def api_tokens_api(request):
+    """
+    API endpoint for the authenticated reader's API tokens. ``GET`` lists
+    them; ``POST`` with an optional ``name`` issues a new one. The token
+    itself is only ever returned by the ``POST`` that created it.
+    """
+    if request.method == 'POST':
+        serializer = ApiTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        api_token, token = issue(request.user, serializer.validated_data.get('name', ''))
+        return Response({**ApiTokenSerializer(api_token).data, 'token': token}, status=status.HTTP_201_CREATED)
+
+    tokens = ApiToken.objects.filter(user=request.user).order_by('-id')
+    return Response(ApiTokenSerializer(tokens, many=True).data, status=status.HTTP_200_OK)
+
 
-    return Response(serializer.data, status=status.HTTP_200_OK)
+@api_view(['DELETE'])
+@authentication_classes([SessionAuthentication, ApiTokenAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated, IsReader])
+def revoke_api_token_api(request, pk):
+    """API endpoint for a reader to revoke one of their API tokens."""
+    revoke(get_object_or_404(ApiToken, pk=pk, user=request.user))
+    return Response(status=status.HTTP_204_NO_CONTENT)
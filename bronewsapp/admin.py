@@ -1,7 +1,21 @@
 from django.contrib import admin
-from .models import Publisher, Article, Newsletter
+from .models import Publisher, Article, Newsletter, OutboxMessage, ViewCount
 
 # Register your models here.
 admin.site.register(Publisher)
 admin.site.register(Article)
-admin.site.register(Newsletter)
\ No newline at end of file
+admin.site.register(Newsletter)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "attempts", "available_at", "created_at")
+    list_filter = ("kind", "status")
+    readonly_fields = ("created_at", "processed_at")
+
+
+@admin.register(ViewCount)
+class ViewCountAdmin(admin.ModelAdmin):
+    list_display = ("kind", "object_id", "views")
+    list_filter = ("kind",)
+    ordering = ("-views",)
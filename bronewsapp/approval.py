@@ -0,0 +1,84 @@
+"""
+Approving articles and newsletters.
+
+Approval is a single conditional ``UPDATE ... WHERE NOT is_approved``
+that returns the rows it changed, so when two editors approve the same
+item at once exactly one of them flips it, and only that one queues the
+notifications. Bulk approval is the same statement over a list of ids.
+
+The statement bypasses ``save()``, so ``updated_at`` is set here and the
+cached publisher fragments and pages are invalidated explicitly.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .caching import bump_publisher_version
+from .mailer import chunked
+from .models import Article, Newsletter
+from .outbox import queue_articles_approved, queue_newsletters_approved
+from .pagecache import purge_on_commit
+
+QUEUE_APPROVED = {
+    Article: queue_articles_approved,
+    Newsletter: queue_newsletters_approved,
+}
+RETURNED_FIELDS = ("id", "title", "author_id", "publisher_id")
+
+
+def supports_returning():
+    """Whether ``INSERT``/``UPDATE``/``DELETE ... RETURNING`` can be used on the default database."""
+    return connection.vendor == "postgresql" or (
+        connection.vendor == "sqlite" and connection.features.can_return_columns_from_insert
+    )
+
+
+def _approve_rows(model, ids, now):
+    """Flips the pending rows among ``ids``; returns ``RETURNED_FIELDS`` tuples of those it changed."""
+    if supports_returning():
+        quote = connection.ops.quote_name
+        sql = (
+            f"UPDATE {quote(model._meta.db_table)} "
+            f"SET is_approved = %s, approved_at = %s, updated_at = %s "
+            f"WHERE id IN ({', '.join(['%s'] * len(ids))}) AND NOT is_approved "
+            f"RETURNING {', '.join(quote(field) for field in RETURNED_FIELDS)}"
+        )
+        stamp = connection.ops.adapt_datetimefield_value(now)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [True, stamp, stamp, *ids])
+            return cursor.fetchall()
+
+    # Without UPDATE ... RETURNING, lock the pending rows first so the
+    # rows we report are exactly the rows we flip.
+    pending = list(
+        model.objects.select_for_update().filter(pk__in=ids, is_approved=False).values_list("pk", flat=True)
+    )
+    model.objects.filter(pk__in=pending).update(is_approved=True, approved_at=now, updated_at=now)
+    return list(model.objects.filter(pk__in=pending).values_list(*RETURNED_FIELDS))
+
+
+def approve(model, ids):
+    """
+    Approves the pending items of ``model`` among ``ids`` and queues their
+    notifications in the same transaction. Returns the items this call
+    approved (with only ``RETURNED_FIELDS`` loaded), in id order; ids
+    that do not exist or were already approved are left out.
+    """
+    ids = sorted({int(pk) for pk in ids})
+    now = timezone.now()
+    approved = []
+    with transaction.atomic():
+        for chunk in chunked(ids, settings.APPROVAL_BATCH_SIZE):
+            approved += [
+                model(**dict(zip(RETURNED_FIELDS, row)), is_approved=True, approved_at=now, updated_at=now)
+                for row in _approve_rows(model, chunk, now)
+            ]
+        if approved:
+            approved.sort(key=lambda item: item.pk)
+            QUEUE_APPROVED[model](approved)
+            publisher_ids = {item.publisher_id for item in approved}
+            transaction.on_commit(lambda: [bump_publisher_version(pk) for pk in publisher_ids])
+            name = model._meta.model_name
+            purge_on_commit(f"{name}s", *(f"{name}:{item.pk}" for item in approved),
+                            *(f"publisher:{pk}" for pk in publisher_ids if pk is not None))
+    return approved
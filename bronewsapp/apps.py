@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BronewsappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bronewsapp'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        import bronewsapp.signals
+
+        post_migrate.connect(bronewsapp.signals.reinstall_search_triggers, sender=self)
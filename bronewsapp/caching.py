@@ -0,0 +1,107 @@
+"""
+Versioned fragment caching for publisher pages.
+
+Every publisher has a version number in the cache. Cached fragments are
+keyed by it, so invalidating a publisher's pages is a single ``incr``:
+old fragments are never read again and simply expire.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+
+from . import metrics
+from .models import Article, Newsletter, Publisher
+
+
+def _version_key(publisher_id):
+    return f"publisher:{publisher_id}:version"
+
+
+def publisher_version(publisher_id):
+    """
+    Returns the current cache version of a publisher. A missing version
+    starts from the current time in milliseconds, so a version lost to
+    eviction can never collide with fragments cached under an older one.
+    """
+    key = _version_key(publisher_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+async def apublisher_version(publisher_id):
+    """Async version of :func:`publisher_version`."""
+    key = _version_key(publisher_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time() * 1000), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_publisher_version(publisher_id):
+    """Invalidates every cached fragment of a publisher."""
+    if publisher_id is None:
+        return
+    try:
+        cache.incr(_version_key(publisher_id))
+    except ValueError:
+        cache.set(_version_key(publisher_id), int(time.time() * 1000), None)
+
+
+def _render_publisher_listing(publisher_id):
+    publisher = get_object_or_404(Publisher.objects.select_related("admin"), pk=publisher_id)
+    listing = {
+        "articles": Article.objects.filter(publisher=publisher)
+        .select_related("author__profile").only("title", "author__username", "author__profile__role"),
+        "newsletters": Newsletter.objects.filter(publisher=publisher)
+        .select_related("author__profile").only("title", "author__username", "author__profile__role"),
+        "publisher": publisher,
+    }
+    return {
+        "pk": publisher.pk,
+        "name": publisher.name,
+        "subscriber_count": publisher.subscriber_count,
+        "header_html": render_to_string("publisher_header.html", listing),
+        "items_html": render_to_string("publisher_items.html", listing),
+    }
+
+
+def _render_and_store(key, publisher_id):
+    metrics.incr("cache.publisher_detail.misses")
+    listing = _render_publisher_listing(publisher_id)
+    cache.set(key, listing, settings.PUBLISHER_CACHE_TIMEOUT)
+    return listing
+
+
+def publisher_listing(publisher_id):
+    """
+    Returns the cached, request-independent part of a publisher page: its
+    name plus the rendered header and article/newsletter listings. Raises
+    Http404 for unknown publishers.
+    """
+    key = f"publisher:{publisher_id}:listing:{publisher_version(publisher_id)}"
+    listing = cache.get(key)
+    if listing is not None:
+        metrics.incr("cache.publisher_detail.hits")
+        return listing
+    return _render_and_store(key, publisher_id)
+
+
+async def apublisher_listing(publisher_id):
+    """
+    Async version of :func:`publisher_listing`. Hits only touch the cache;
+    a miss renders the listing in a worker thread.
+    """
+    key = f"publisher:{publisher_id}:listing:{await apublisher_version(publisher_id)}"
+    listing = await cache.aget(key)
+    if listing is not None:
+        await sync_to_async(metrics.incr)("cache.publisher_detail.hits")
+        return listing
+    return await sync_to_async(_render_and_store)(key, publisher_id)
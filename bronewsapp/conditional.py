@@ -0,0 +1,86 @@
+"""
+Validators for conditional GET (``ETag`` / ``Last-Modified``).
+
+They are computed from ``updated_at`` columns with ``values_list``, so
+answering ``304 Not Modified`` never loads or renders ``content``.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.views.decorators.http import condition
+
+from accounts.roles import aload_role
+
+
+def make_etag(*parts):
+    """
+    Returns a weak ETag over ``parts``. Pages are only semantically
+    identical between renders (CSRF tokens are re-masked every time).
+    """
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=16)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _viewer(request):
+    """The part of the request a rendered page depends on besides the item."""
+    if not request.user.is_authenticated:
+        return "anonymous"
+    return f"{request.user.pk}:{request.role.role or ''}"
+
+
+def has_pending_messages(request):
+    # len() does not mark the messages as used, so they are still shown.
+    return bool(len(messages.get_messages(request)))
+
+
+def _timestamps(model, pk):
+    return model.objects.filter(pk=pk).values_list("updated_at", "publisher__updated_at")
+
+
+def item_validators(model):
+    """
+    Returns ``(etag_func, last_modified_func)`` for a ``pk`` detail view of
+    ``model``, for use with :func:`django.views.decorators.http.condition`.
+
+    Both look at the item's and its publisher's ``updated_at`` (loaded once
+    per request). Pages with pending flash messages are never 304'd.
+    """
+    def timestamps(request, pk):
+        if not hasattr(request, "_item_timestamps"):
+            request._item_timestamps = _timestamps(model, pk).first()
+        return request._item_timestamps
+
+    def etag(request, pk):
+        row = timestamps(request, pk)
+        if row is None or has_pending_messages(request):
+            return None
+        return make_etag(model._meta.label, pk, *(t.isoformat() if t else "" for t in row), _viewer(request))
+
+    def last_modified(request, pk):
+        row = timestamps(request, pk)
+        if row is None or has_pending_messages(request):
+            return None
+        return max(t for t in row if t)
+
+    return etag, last_modified
+
+
+def async_item_condition(model):
+    """
+    :func:`~django.views.decorators.http.condition` with
+    :func:`item_validators` for an async ``pk`` detail view of ``model``.
+
+    The validators are synchronous, so the user, role and timestamps they
+    read are loaded with the async ORM before they run.
+    """
+    def decorator(view):
+        conditional_view = condition(*item_validators(model))(view)
+
+        @wraps(view)
+        async def wrapper(request, pk):
+            await aload_role(request)
+            request._item_timestamps = await _timestamps(model, pk).afirst()
+            return await conditional_view(request, pk=pk)
+        return wrapper
+    return decorator
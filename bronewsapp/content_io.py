@@ -0,0 +1,216 @@
+"""
+The row format of ``import_content`` and ``export_content``.
+
+Each article or newsletter is one row with :data:`FIELDS`; authors are
+referred to by username and publishers by name, so content can move
+between databases whose ids differ. Rows are NDJSON objects (one per
+line) or CSV records with a header.
+
+Imports bypass ``save()`` and the approval flow: ``excerpt`` is computed
+here, ``created_at``/``updated_at`` are the time of the import, and no
+notifications or feed entries are produced (run ``rebuild_feeds`` after
+importing approved content).
+"""
+import csv
+import json
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Article, Newsletter, Profile, Publisher, make_excerpt
+
+FORMATS = ("ndjson", "csv")
+MODELS = {"article": Article, "newsletter": Newsletter}
+# ``id`` and ``created_at`` are exported for reference; imports assign their own.
+FIELDS = ("type", "id", "title", "content", "author", "publisher", "is_approved", "approved_at", "created_at")
+
+TITLE_MAX_LENGTH = Article._meta.get_field("title").max_length
+_TRUE = {"1", "true", "yes", "y", "t"}
+_FALSE = {"", "0", "false", "no", "n", "f"}
+
+
+def format_for(path, given=None):
+    """The format named by ``given``, or guessed from ``path``'s extension (NDJSON by default)."""
+    if given:
+        return given
+    return "csv" if str(path).lower().endswith(".csv") else "ndjson"
+
+
+def read_rows(fh, fmt):
+    """Yields ``(line_number, row_dict)`` from ``fh`` without reading it all; bad JSON yields an error string."""
+    if fmt == "csv":
+        reader = csv.DictReader(fh)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(fh, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, f"invalid JSON: {exc}"
+            continue
+        yield number, row if isinstance(row, dict) else "expected a JSON object"
+
+
+class Lookups:
+    """Journalist usernames and publisher names mapped to ids, loaded once per import."""
+
+    def __init__(self):
+        self.authors = dict(
+            Profile.objects.filter(role=Profile.Role.JOURNALIST).values_list("user__username", "user_id")
+        )
+        self.publishers = dict(Publisher.objects.values_list("name", "pk"))
+
+
+def _text(row, field):
+    value = row.get(field)
+    return "" if value is None else str(value).strip()
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = "" if value is None else str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"is_approved must be a boolean, not {value!r}")
+
+
+def _datetime(value, field):
+    if value in (None, ""):
+        return None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise ValueError(f"{field} is not an ISO 8601 datetime: {value!r}")
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def build_item(row, lookups, default_type=None):
+    """The unsaved Article or Newsletter described by ``row``. Raises ``ValueError`` if it is invalid."""
+    model = MODELS.get((_text(row, "type") or default_type or "").lower())
+    if model is None:
+        raise ValueError(f"type must be one of {', '.join(MODELS)}")
+
+    title = _text(row, "title")
+    if not title or len(title) > TITLE_MAX_LENGTH:
+        raise ValueError(f"title must be 1 to {TITLE_MAX_LENGTH} characters")
+
+    author_id = lookups.authors.get(_text(row, "author"))
+    if author_id is None:
+        raise ValueError(f"author {row.get('author')!r} is not a journalist")
+
+    publisher_name = _text(row, "publisher")
+    publisher_id = None
+    if publisher_name:
+        publisher_id = lookups.publishers.get(publisher_name)
+        if publisher_id is None:
+            raise ValueError(f"unknown publisher {publisher_name!r}")
+
+    is_approved = _boolean(row.get("is_approved"))
+    approved_at = _datetime(row.get("approved_at"), "approved_at") if is_approved else None
+    content = row.get("content")
+    content = str(content) if content not in (None, "") else None
+    return model(
+        title=title,
+        content=content,
+        excerpt=make_excerpt(content),
+        author_id=author_id,
+        publisher_id=publisher_id,
+        is_approved=is_approved,
+        approved_at=approved_at or (timezone.now() if is_approved else None),
+    )
+
+
+def export_queryset(model, approved_only=False, publisher_id=None, since=None):
+    """
+    ``FIELDS`` tuples of ``model``'s rows, in id order, for :func:`export_row`;
+    optionally only those of one publisher, or changed after ``since``.
+    """
+    items = model.objects.order_by("pk")
+    if approved_only:
+        items = items.filter(is_approved=True)
+    if publisher_id is not None:
+        items = items.filter(publisher_id=publisher_id)
+    if since is not None:
+        items = items.filter(updated_at__gt=since)
+    return items.values_list(
+        "pk", "title", "content", "author__username", "publisher__name", "is_approved", "approved_at", "created_at"
+    )
+
+
+def export_row(type_name, values):
+    """A row dict with :data:`FIELDS` from one :func:`export_queryset` tuple."""
+    pk, title, content, author, publisher, is_approved, approved_at, created_at = values
+    return {
+        "type": type_name,
+        "id": pk,
+        "title": title,
+        "content": content,
+        "author": author,
+        "publisher": publisher,
+        "is_approved": is_approved,
+        "approved_at": approved_at and approved_at.isoformat(),
+        "created_at": created_at.isoformat(),
+    }
+
+
+class _Echo:
+    """A file-like object whose ``write`` returns what it was given, for ``csv.writer``."""
+
+    def write(self, value):
+        return value
+
+
+def _encoder(fmt):
+    """``(header, encode)``: the lines before the first row, and the function encoding one row."""
+    if fmt == "csv":
+        writer = csv.DictWriter(_Echo(), fieldnames=FIELDS)
+        return [writer.writeheader()], writer.writerow
+    return [], lambda row: json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def encode_rows(rows, fmt):
+    """Yields each row dict of ``rows`` as a line of NDJSON or CSV (after a CSV header)."""
+    header, encode = _encoder(fmt)
+    yield from header
+    for row in rows:
+        yield encode(row)
+
+
+async def aencode_rows(rows, fmt):
+    """Async version of :func:`encode_rows`, over an async iterable of rows."""
+    header, encode = _encoder(fmt)
+    for line in header:
+        yield line
+    async for row in rows:
+        yield encode(row)
+
+
+def buffered(lines, size):
+    """Joins ``lines`` into strings of about ``size`` characters, so a stream is not one write per row."""
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+async def abuffered(lines, size):
+    """Async version of :func:`buffered`."""
+    buffer, length = [], 0
+    async for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,274 @@
+"""
+Materialized per-reader feeds (fan-out on write, with a fan-out on read
+fallback for very popular sources).
+
+When an article or newsletter is approved, the outbox worker writes one
+compact :class:`FeedEntry` row for every subscriber of its author and of
+its publisher. Subscribing backfills the newest items of the source and
+unsubscribing prunes them again, so reading a feed is a single range scan
+over the reader's rows.
+
+Journalists and publishers with more than ``FEED_FANOUT_THRESHOLD``
+subscribers are skipped on write; their items are queried live and merged
+in when a follower reads the feed.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .mailer import chunked
+from .models import Article, FeedEntry, Newsletter, Profile
+
+JOURNALIST = "journalist"
+PUBLISHER = "publisher"
+
+# Item model per feed item type, and how each subscription kind relates to it.
+ITEM_MODELS = {
+    FeedEntry.ItemType.ARTICLE: Article,
+    FeedEntry.ItemType.NEWSLETTER: Newsletter,
+}
+SOURCE_ITEM_FIELD = {JOURNALIST: "author", PUBLISHER: "publisher"}
+SOURCE_SUBSCRIPTION_FIELD = {JOURNALIST: "sub_journalist", PUBLISHER: "sub_publisher"}
+
+
+def item_type_for(instance):
+    """Returns the feed item type of an Article or Newsletter instance."""
+    return FeedEntry.ItemType.ARTICLE if isinstance(instance, Article) else FeedEntry.ItemType.NEWSLETTER
+
+
+def _audience_key(source, source_id):
+    return f"feed:audience:{source}:{source_id}"
+
+
+def audience_sizes(source, source_ids):
+    """
+    Returns ``{source_id: subscriber_count}``. Counts are cached for
+    ``FEED_AUDIENCE_CACHE_SECONDS`` so the read path rarely counts rows.
+    """
+    source_ids = list(source_ids)
+    keys = {_audience_key(source, sid): sid for sid in source_ids}
+    cached = cache.get_many(keys)
+    sizes = {keys[key]: count for key, count in cached.items()}
+
+    missing = [sid for sid in source_ids if sid not in sizes]
+    if missing:
+        field = SOURCE_SUBSCRIPTION_FIELD[source]
+        counted = dict(
+            Profile.objects
+            .filter(**{f"{field}__in": missing})
+            .values_list(field)
+            .annotate(Count("id"))
+        )
+        fresh = {sid: counted.get(sid, 0) for sid in missing}
+        cache.set_many(
+            {_audience_key(source, sid): count for sid, count in fresh.items()},
+            settings.FEED_AUDIENCE_CACHE_SECONDS,
+        )
+        sizes.update(fresh)
+    return sizes
+
+
+def read_time_sources(source, source_ids):
+    """Returns the ids among ``source_ids`` that are too popular to fan out on write."""
+    threshold = settings.FEED_FANOUT_THRESHOLD
+    return [sid for sid, size in audience_sizes(source, source_ids).items() if size > threshold]
+
+
+def _write_entries(reader_ids, item_type, item_id, published_at):
+    written = 0
+    for chunk in chunked(reader_ids, settings.FEED_FANOUT_BATCH_SIZE):
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(reader_id=reader_id, item_type=item_type, item_id=item_id, published_at=published_at)
+                for reader_id in chunk
+            ],
+            ignore_conflicts=True,
+        )
+        written += len(chunk)
+    return written
+
+
+def fan_out(item_type, item_id):
+    """
+    Writes a newly approved item into the feeds of everyone subscribed to
+    its author or publisher. Returns the number of rows attempted.
+    """
+    item = (
+        ITEM_MODELS[item_type].objects
+        .filter(pk=item_id, is_approved=True)
+        .values("author_id", "publisher_id", "approved_at")
+        .first()
+    )
+    if item is None:
+        return 0
+
+    sources = [(JOURNALIST, item["author_id"])]
+    if item["publisher_id"]:
+        sources.append((PUBLISHER, item["publisher_id"]))
+
+    written = 0
+    for source, source_id in sources:
+        if read_time_sources(source, [source_id]):
+            continue
+        readers = (
+            Profile.objects
+            .filter(**{SOURCE_SUBSCRIPTION_FIELD[source]: source_id})
+            .values_list("pk", flat=True)
+            .iterator(chunk_size=settings.FEED_FANOUT_BATCH_SIZE)
+        )
+        written += _write_entries(readers, item_type, item_id, item["approved_at"])
+    return written
+
+
+def backfill(reader_id, source, source_ids):
+    """Adds the newest approved items of newly subscribed sources to a reader's feed."""
+    fan_out_sources = set(source_ids) - set(read_time_sources(source, source_ids))
+    if not fan_out_sources:
+        return
+    field = SOURCE_ITEM_FIELD[source]
+    for item_type, model in ITEM_MODELS.items():
+        for source_id in fan_out_sources:
+            items = (
+                model.objects
+                .filter(is_approved=True, **{field: source_id})
+                .order_by("-approved_at", "-id")
+                .values_list("id", "approved_at")[:settings.FEED_BACKFILL_LIMIT]
+            )
+            FeedEntry.objects.bulk_create(
+                [
+                    FeedEntry(reader_id=reader_id, item_type=item_type, item_id=item_id, published_at=approved_at)
+                    for item_id, approved_at in items
+                ],
+                ignore_conflicts=True,
+            )
+
+
+def prune(reader_id, source, source_ids):
+    """
+    Removes the items of unsubscribed sources from a reader's feed, keeping
+    those the reader still receives through another subscription.
+    """
+    for item_type, model in ITEM_MODELS.items():
+        items = model.objects.filter(**{f"{SOURCE_ITEM_FIELD[source]}__in": source_ids})
+        if source == JOURNALIST:
+            items = items.exclude(publisher__subscribers=reader_id)
+        else:
+            items = items.exclude(author__subscribers=reader_id)
+        FeedEntry.objects.filter(
+            reader_id=reader_id, item_type=item_type, item_id__in=items.values("id")
+        ).delete()
+
+
+def rebuild(reader_id):
+    """Recomputes a reader's whole feed from their current subscriptions."""
+    FeedEntry.objects.filter(reader_id=reader_id).delete()
+    profile = Profile.objects.get(pk=reader_id)
+    backfill(reader_id, JOURNALIST, list(profile.sub_journalist.values_list("pk", flat=True)))
+    backfill(reader_id, PUBLISHER, list(profile.sub_publisher.values_list("pk", flat=True)))
+
+
+def remove_item(item_type, item_id):
+    """Drops a deleted item from every feed."""
+    FeedEntry.objects.filter(item_type=item_type, item_id=item_id).delete()
+
+
+def _before(cursor, time_field, type_value=None):
+    """
+    Builds the keyset filter for rows strictly after ``cursor`` in
+    ``(published_at, item_type, item_id)`` descending order.
+    """
+    published_at, item_type, item_id = cursor
+    if type_value is None:
+        return (
+            Q(**{f"{time_field}__lt": published_at})
+            | Q(**{time_field: published_at, "item_type__lt": item_type})
+            | Q(**{time_field: published_at, "item_type": item_type, "item_id__lt": item_id})
+        )
+    # Live queries have a fixed item type, so the type comparison is known up front.
+    if type_value < item_type:
+        return Q(**{f"{time_field}__lte": published_at})
+    if type_value == item_type:
+        return Q(**{f"{time_field}__lt": published_at}) | Q(**{time_field: published_at, "id__lt": item_id})
+    return Q(**{f"{time_field}__lt": published_at})
+
+
+def read_feed(profile, limit, cursor=None):
+    """
+    Returns up to ``limit`` ``(published_at, item_type, item_id)`` tuples
+    from a reader's feed, newest first, strictly after ``cursor``.
+    """
+    entries = FeedEntry.objects.filter(reader=profile)
+    if cursor:
+        entries = entries.filter(_before(cursor, "published_at"))
+    rows = list(
+        entries
+        .order_by("-published_at", "-item_type", "-item_id")
+        .values_list("published_at", "item_type", "item_id")[:limit]
+    )
+
+    live_journalists = read_time_sources(JOURNALIST, profile.sub_journalist.values_list("pk", flat=True))
+    live_publishers = read_time_sources(PUBLISHER, profile.sub_publisher.values_list("pk", flat=True))
+    if live_journalists or live_publishers:
+        for item_type, model in ITEM_MODELS.items():
+            items = model.objects.filter(
+                Q(author__in=live_journalists) | Q(publisher__in=live_publishers),
+                is_approved=True,
+            )
+            if cursor:
+                items = items.filter(_before(cursor, "approved_at", item_type))
+            rows.extend(
+                (approved_at, item_type, item_id)
+                for approved_at, item_id in items.order_by("-approved_at", "-id").values_list("approved_at", "id")[:limit]
+            )
+        rows = sorted(set(rows), reverse=True)
+
+    return rows[:limit]
+
+
+def hydrate(rows):
+    """Loads the listing fields (never ``content``) for feed rows, in order."""
+    ids = {item_type: [] for item_type in ITEM_MODELS}
+    for _, item_type, item_id in rows:
+        ids[item_type].append(item_id)
+    loaded = {
+        item_type: ITEM_MODELS[item_type].objects
+        .only("id", "title", "author_id", "publisher_id")
+        .in_bulk(item_ids)
+        for item_type, item_ids in ids.items() if item_ids
+    }
+    items = []
+    for published_at, item_type, item_id in rows:
+        item = loaded[item_type].get(item_id)
+        if item is not None:
+            items.append({
+                "type": FeedEntry.ItemType(item_type).label.lower(),
+                "id": item.id,
+                "title": item.title,
+                "author": item.author_id,
+                "publisher": item.publisher_id,
+                "published_at": published_at,
+            })
+    return items
+
+
+def encode_cursor(row):
+    """Turns a feed row into an opaque ``?cursor=`` value."""
+    published_at, item_type, item_id = row
+    raw = f"{published_at.isoformat()}|{item_type}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(value):
+    """Inverse of :func:`encode_cursor`. Raises ValueError on bad input."""
+    try:
+        published_at, item_type, item_id = base64.urlsafe_b64decode(value.encode()).decode().split("|")
+        cursor = datetime.fromisoformat(published_at), item_type, int(item_id)
+    except (UnicodeError, ValueError, binascii.Error):
+        raise ValueError("Malformed cursor.")
+    if item_type not in ITEM_MODELS:
+        raise ValueError("Malformed cursor.")
+    return cursor
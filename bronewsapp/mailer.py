@@ -0,0 +1,70 @@
+"""
+Bulk email delivery for subscriber fan-out.
+
+Subscriber addresses are streamed from the database with a single
+``values_list`` query and grouped into BCC messages of
+``SUBSCRIBER_EMAIL_CHUNK_SIZE`` recipients, all sent over one SMTP
+connection. Memory use is bounded by the chunk size, not by the number
+of subscribers.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from .models import Profile
+
+
+def subscriber_emails(author_id, after_id=0):
+    """
+    Yields ``(profile_id, email)`` for every subscriber of a journalist
+    that has an email address, in profile id order, starting after
+    ``after_id``.
+    """
+    return (
+        Profile.objects
+        .filter(sub_journalist=author_id, pk__gt=after_id)
+        .exclude(user__email="")
+        .order_by("pk")
+        .values_list("pk", "user__email")
+        .iterator(chunk_size=settings.SUBSCRIBER_EMAIL_FETCH_SIZE)
+    )
+
+
+def chunked(iterable, size):
+    """Splits an iterable into lists of at most ``size`` items."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def send_to_subscribers(author_id, subject, message, after_id=0, on_progress=None, chunk_size=None):
+    """
+    Emails every subscriber of ``author_id``.
+
+    Messages are handed to the backend ``SUBSCRIBER_EMAIL_MESSAGES_PER_SEND``
+    at a time. After each hand-off ``on_progress`` is called with the last
+    profile id delivered, so a caller can resume from there via
+    ``after_id`` if a later send fails. Returns the number of recipients.
+    """
+    chunk_size = chunk_size or settings.SUBSCRIBER_EMAIL_CHUNK_SIZE
+    per_send = settings.SUBSCRIBER_EMAIL_MESSAGES_PER_SEND
+    sent = 0
+
+    with get_connection() as connection:
+        for rows in chunked(chunked(subscriber_emails(author_id, after_id), chunk_size), per_send):
+            emails = [
+                EmailMessage(
+                    subject,
+                    message,
+                    settings.DEFAULT_FROM_EMAIL,
+                    bcc=[email for _, email in chunk],
+                    connection=connection,
+                )
+                for chunk in rows
+            ]
+            connection.send_messages(emails)
+            sent += sum(len(chunk) for chunk in rows)
+            if on_progress:
+                on_progress(rows[-1][-1][0])
+    return sent
@@ -0,0 +1,260 @@
+import base64
+import json
+import statistics
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+import accounts.urls
+import api.urls
+import bronewsapp.urls
+from accounts.models import Profile
+from api.tokens import issue, revoke
+from bronewsapp.models import Article, Newsletter, Publisher, User
+
+URL_MODULES = (bronewsapp.urls, accounts.urls, api.urls)
+
+# Who requests each route; everything else is requested as a reader.
+ROUTE_PERSONAS = {
+    "create_publisher": Profile.Role.ADMIN,
+    "admin_dashboard": Profile.Role.ADMIN,
+    "article_create": Profile.Role.JOURNALIST,
+    "newsletter_create": Profile.Role.JOURNALIST,
+    "journalist_dashboard": Profile.Role.JOURNALIST,
+    "article_update": Profile.Role.EDITOR,
+    "article_delete": Profile.Role.EDITOR,
+    "newsletter_update": Profile.Role.EDITOR,
+    "newsletter_delete": Profile.Role.EDITOR,
+    "article_approve": Profile.Role.EDITOR,
+    "newsletter_approve": Profile.Role.EDITOR,
+    "bulk_approve": Profile.Role.EDITOR,
+    "editor_dashboard": Profile.Role.EDITOR,
+    "api_bulk_approve": Profile.Role.EDITOR,
+    "login": None,
+    "register": None,
+}
+# How requests authenticate as their persona: a logged-in session, HTTP Basic
+# (the password is hashed on every request) or an API token.
+AUTH_SCHEMES = ("session", "basic", "token")
+QUERY_PARAMS = {
+    "search": {"q": "seeded article"},
+    "api_search": {"q": "seeded article"},
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    """
+    HTTP load benchmark over every named route of the app.
+
+    Point it at a running server that uses the same database (seed it with
+    ``seed_data`` first). Each route is requested ``--requests`` times by
+    ``--concurrency`` threads, as a user of the role that normally uses it,
+    and throughput plus p50/p95/p99 latency are reported. Results can be
+    saved with ``--output`` and compared with a previous run's file with
+    ``--baseline``.
+
+    ``--auth`` picks how requests authenticate: a session (the default),
+    HTTP Basic or an API bearer token. Only GET requests are sent, so
+    running it does not change any data, apart from the API tokens that
+    ``--auth token`` issues and revokes again.
+    """
+    help = "Load tests every route against a running server and reports throughput and latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per route.")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--password", default="benchmark", help="Password of the seeded users.")
+        parser.add_argument("--routes", nargs="*", help="Only benchmark these route names.")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--baseline", help="A previous --output file to compare against.")
+        parser.add_argument("--timeout", type=float, default=30.0)
+        parser.add_argument("--auth", choices=AUTH_SCHEMES, default="session",
+                            help="How to authenticate as each route's persona.")
+
+    def handle(self, *args, **options):
+        self.base_url = options["base_url"].rstrip("/")
+        self.password = options["password"]
+        self.timeout = options["timeout"]
+        self.auth = options["auth"]
+        self.samples = self.sample_kwargs()
+        self.logins = {}
+        self.tokens = []
+
+        results = {}
+        try:
+            for name, url in self.routes(options["routes"]):
+                persona = ROUTE_PERSONAS.get(name, Profile.Role.READER)
+                results[name] = self.run_route(name, url, persona, options["requests"], options["concurrency"])
+                self.stdout.write(self.format_line(name, results[name]))
+        finally:
+            for api_token in self.tokens:
+                revoke(api_token)
+
+        report = {
+            "meta": {
+                "commit": self.git_commit(),
+                "timestamp": timezone.now().isoformat(),
+                "base_url": self.base_url,
+                "requests_per_route": options["requests"],
+                "concurrency": options["concurrency"],
+                "auth": self.auth,
+            },
+            "routes": results,
+        }
+        if options["baseline"]:
+            self.compare(report, options["baseline"])
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
+
+    def sample_kwargs(self):
+        """Ids to fill URL parameters with, picked from the current data."""
+        article = Article.objects.filter(is_approved=True).order_by("-id").values_list("id", flat=True).first()
+        newsletter = Newsletter.objects.filter(is_approved=True).order_by("-id").values_list("id", flat=True).first()
+        publisher = Publisher.objects.order_by("id").values_list("id", flat=True).first()
+        journalist = (
+            Profile.objects.filter(role=Profile.Role.JOURNALIST).order_by("id").values_list("user_id", flat=True).first()
+        )
+        return {"article": article, "newsletter": newsletter, "publisher_id": publisher, "user_id": journalist}
+
+    def routes(self, only=None):
+        """``(name, url)`` for every named route, with sample ids filled in."""
+        for module in URL_MODULES:
+            for pattern in module.urlpatterns:
+                name = pattern.name
+                if not name or (only and name not in only):
+                    continue
+                kwargs = {}
+                for param in pattern.pattern.converters:
+                    value = self.samples["newsletter" if name.startswith("newsletter") else "article"] \
+                        if param == "pk" else self.samples.get(param)
+                    if value is None:
+                        break
+                    kwargs[param] = value
+                else:
+                    yield name, reverse(name, kwargs=kwargs)
+                    continue
+                self.stderr.write(f"Skipping {name}: no data to fill in its URL.")
+
+    def username_for(self, role):
+        users = Profile.objects.filter(role=role).order_by("id").values_list("user__username", flat=True)
+        return users.filter(user__username__startswith="seed_").first() or users.first()
+
+    def credentials(self, role):
+        """``(cookies, headers)`` that authenticate requests as a user with ``role``."""
+        if role is None:
+            return {}, {}
+        if role not in self.logins:
+            username = self.username_for(role)
+            if username is None:
+                raise CommandError(f"No {role.lower()} user to log in as; run seed_data first.")
+            if self.auth == "session":
+                self.logins[role] = self.session_cookies(username), {}
+            elif self.auth == "basic":
+                basic = base64.b64encode(f"{username}:{self.password}".encode()).decode()
+                self.logins[role] = {}, {"Authorization": f"Basic {basic}"}
+            else:
+                api_token, token = issue(User.objects.get(username=username), name="benchmark")
+                self.tokens.append(api_token)
+                self.logins[role] = {}, {"Authorization": f"Bearer {token}"}
+        return self.logins[role]
+
+    def session_cookies(self, username):
+        """Logs in as ``username``; returns the session's cookies."""
+        session = requests.Session()
+        login_url = self.base_url + reverse("login")
+        session.get(login_url, timeout=self.timeout)
+        response = session.post(login_url, timeout=self.timeout, data={
+            "username": username,
+            "password": self.password,
+            "csrfmiddlewaretoken": session.cookies.get("csrftoken", ""),
+        }, headers={"Referer": login_url})
+        if "sessionid" not in session.cookies:
+            raise CommandError(f"Could not log in as {username} (HTTP {response.status_code}).")
+        return session.cookies.get_dict()
+
+    def run_route(self, name, url, role, count, concurrency):
+        cookies, headers = self.credentials(role)
+        params = QUERY_PARAMS.get(name)
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+                local.session.cookies.update(cookies)
+                local.session.headers.update(headers)
+            started = time.perf_counter()
+            try:
+                response = local.session.get(self.base_url + url, params=params, timeout=self.timeout,
+                                             allow_redirects=False)
+                status = response.status_code
+            except requests.RequestException:
+                status = "error"
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = list(pool.map(fetch, range(count)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(seconds * 1000 for seconds, _ in timings)
+        statuses = Counter(str(status) for _, status in timings)
+        return {
+            "url": url,
+            "persona": role or "anonymous",
+            "requests": count,
+            "errors": sum(n for status, n in statuses.items() if status[0] not in "23"),
+            "statuses": dict(statuses),
+            "throughput_rps": round(count / elapsed, 2) if elapsed else None,
+            "mean_ms": round(statistics.fmean(latencies), 2) if latencies else None,
+            "p50_ms": round(percentile(latencies, 0.50), 2) if latencies else None,
+            "p95_ms": round(percentile(latencies, 0.95), 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99), 2) if latencies else None,
+        }
+
+    def format_line(self, name, result):
+        return (
+            f"{name:<36} {result['throughput_rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.1f}ms  "
+            f"p95 {result['p95_ms']:>8.1f}ms  p99 {result['p99_ms']:>8.1f}ms  errors {result['errors']}"
+        )
+
+    def compare(self, report, baseline_path):
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Compared with {baseline['meta'].get('commit') or baseline_path}"
+        ))
+        for name, result in report["routes"].items():
+            before = baseline["routes"].get(name)
+            if not before:
+                continue
+            rps_change = (result["throughput_rps"] / before["throughput_rps"] - 1) * 100 if before["throughput_rps"] else 0
+            self.stdout.write(
+                f"{name:<36} req/s {rps_change:+7.1f}%  p95 {result['p95_ms'] - before['p95_ms']:+8.1f}ms  "
+                f"p99 {result['p99_ms'] - before['p99_ms']:+8.1f}ms"
+            )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bronewsapp.related import build
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the related items of every approved article and newsletter.
+
+    Run it once to create the index and then periodically (e.g. nightly
+    from cron) so new words and edits count; between runs the outbox
+    worker adds newly approved items as they come.
+    """
+    help = "Builds the TF-IDF index and the related items of every approved article and newsletter."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=settings.RELATED_CHUNK_SIZE,
+                            help="Items scored per matrix product.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        items = build(options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Found related items for {items} item(s) in {time.monotonic() - started:.1f}s."
+        ))
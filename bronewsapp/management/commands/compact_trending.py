@@ -0,0 +1,44 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bronewsapp.trending import compact
+
+
+class Command(BaseCommand):
+    """
+    Compacts the trending ranking: drops articles whose activity has faded,
+    rebases the scores when due, and refreshes the cached home page.
+
+    Runs as a long-lived worker by default; use ``--once`` to compact a
+    single time (e.g. from cron).
+    """
+    help = "Prunes the trending article ranking and refreshes the home page."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=settings.TRENDING_COMPACT_INTERVAL,
+                            help="Seconds between compactions.")
+        parser.add_argument("--once", action="store_true",
+                            help="Compact once and exit.")
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while not self._stopping:
+            dropped = compact()
+            if dropped:
+                self.stdout.write(f"Dropped {dropped} article(s) from the trending ranking.")
+            if options["once"]:
+                break
+            # Sleep in short steps so a stop request is not held up by the interval.
+            deadline = time.monotonic() + options["interval"]
+            while not self._stopping and time.monotonic() < deadline:
+                time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+
+    def _stop(self, signum, frame):
+        """Finish the current compaction, then exit."""
+        self._stopping = True
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+
+from .compare_servers import Command as CompareServersCommand
+
+# The reader API routes, which accept both schemes.
+API_ROUTES = ["api_subscribed_journalist_articles", "api_reader_feed"]
+SCHEMES = ("basic", "token")
+
+
+class Command(CompareServersCommand):
+    """
+    Benchmarks the reader API with HTTP Basic against API token auth.
+
+    Starts one ``serve.sh`` server (one worker by default, so the numbers
+    are per core), runs ``benchmark --auth basic`` and then
+    ``benchmark --auth token`` against it, and reports each route's
+    requests/sec per worker under both. Seed the database first.
+    """
+    help = "Compares requests/sec per core of the reader API under HTTP Basic and API token auth."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=("wsgi", "asgi"), default="wsgi")
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--requests", type=int, default=500, help="Requests per route.")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--routes", nargs="*", default=API_ROUTES)
+        parser.add_argument("--password", default="benchmark", help="Password of the seeded users.")
+        parser.add_argument("--startup-timeout", type=float, default=30.0)
+        parser.add_argument("--output", help="Write both runs to this JSON file.")
+
+    def handle(self, *args, **options):
+        base_url = f"http://127.0.0.1:{options['port']}"
+        workers = options["workers"]
+        reports = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.server(options["mode"], options, os.path.join(tmp, "server.log")):
+                self.wait_until_ready(base_url, options["startup_timeout"])
+                for scheme in SCHEMES:
+                    self.stdout.write(self.style.MIGRATE_HEADING(f"{scheme} auth ({workers} {options['mode']} workers)"))
+                    output = os.path.join(tmp, f"{scheme}.json")
+                    call_command(
+                        "benchmark", base_url=base_url, routes=options["routes"], requests=options["requests"],
+                        concurrency=options["concurrency"], password=options["password"], auth=scheme,
+                        output=output, stdout=self.stdout, stderr=self.stderr,
+                    )
+                    with open(output) as fh:
+                        reports[scheme] = json.load(fh)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Requests/sec per worker"))
+        for name, basic in reports["basic"]["routes"].items():
+            token = reports["token"]["routes"].get(name)
+            if not token or not basic["throughput_rps"]:
+                continue
+            self.stdout.write(
+                f"{name:<36} basic {basic['throughput_rps'] / workers:>9.1f}  "
+                f"token {token['throughput_rps'] / workers:>9.1f}  "
+                f"x{token['throughput_rps'] / basic['throughput_rps']:.1f}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump({"workers": workers, "mode": options["mode"], **reports}, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
@@ -0,0 +1,115 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+# The views that run on the async ORM.
+ASYNC_ROUTES = [
+    "article_list",
+    "article_detail",
+    "newsletter_detail",
+    "publisher_detail",
+    "journalist_detail",
+    "api_subscribed_journalist_articles",
+]
+MODES = ("wsgi", "asgi")
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks the async read views under WSGI and ASGI.
+
+    Starts ``serve.sh`` once per ``SERVER_MODE`` (gunicorn sync workers,
+    then uvicorn workers) with the same worker count, runs ``benchmark``
+    against each in turn and reports the ASGI run relative to the WSGI one.
+    Both servers use this process's settings and database, so seed it first.
+    """
+    help = "Runs the benchmark on the async read views under gunicorn WSGI and ASGI workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--requests", type=int, default=500, help="Requests per route.")
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--routes", nargs="*", default=ASYNC_ROUTES)
+        parser.add_argument("--password", default="benchmark", help="Password of the seeded users.")
+        parser.add_argument("--startup-timeout", type=float, default=30.0)
+        parser.add_argument("--output", help="Write both runs to this JSON file.")
+
+    def handle(self, *args, **options):
+        base_url = f"http://127.0.0.1:{options['port']}"
+        reports = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode in MODES:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{mode.upper()} ({options['workers']} workers)"))
+                output = os.path.join(tmp, f"{mode}.json")
+                with self.server(mode, options, os.path.join(tmp, f"{mode}.log")):
+                    self.wait_until_ready(base_url, options["startup_timeout"])
+                    call_command(
+                        "benchmark", base_url=base_url, routes=options["routes"], requests=options["requests"],
+                        concurrency=options["concurrency"], password=options["password"], output=output,
+                        baseline=os.path.join(tmp, "wsgi.json") if mode == "asgi" else None,
+                        stdout=self.stdout, stderr=self.stderr,
+                    )
+                with open(output) as fh:
+                    reports[mode] = json.load(fh)
+
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump({"workers": options["workers"], **reports}, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
+
+    def server(self, mode, options, log_path):
+        env = {
+            **os.environ,
+            "SERVER_MODE": mode,
+            "BIND": f"127.0.0.1:{options['port']}",
+            "WEB_WORKERS": str(options["workers"]),
+        }
+        with open(log_path, "wb") as log:
+            try:
+                process = subprocess.Popen(
+                    ["sh", "serve.sh"], cwd=Path(settings.BASE_DIR), env=env,
+                    stdout=log, stderr=subprocess.STDOUT,
+                )
+            except OSError as exc:
+                raise CommandError(f"Could not start the {mode} server: {exc}")
+        return _Running(process, log_path)
+
+    def wait_until_ready(self, base_url, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                requests.get(base_url + "/", timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError(f"The server at {base_url} did not start within {timeout:g}s.")
+
+
+class _Running:
+    """Stops a server process on exit, reporting its log if it died early."""
+
+    def __init__(self, process, log_path):
+        self.process = process
+        self.log_path = log_path
+
+    def __enter__(self):
+        return self.process
+
+    def __exit__(self, *exc_info):
+        if self.process.poll() is not None:
+            with open(self.log_path) as log:
+                raise CommandError(f"The server exited early:\n{log.read()}")
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
@@ -0,0 +1,131 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import Profile
+from bronewsapp.models import Article, Newsletter, Publisher, User
+
+# Indexes added for the approval/author hot paths (bronewsapp 0007).
+HOT_PATH_INDEXES = {
+    Article: ["article_author_approved_idx", "article_pub_approved_idx", "article_pending_idx"],
+    Newsletter: ["newsletter_author_approved_idx", "newsletter_pub_approved_idx", "newsletter_pending_idx"],
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Captures EXPLAIN plans for the approval/author hot queries with and
+    without the hot path indexes.
+
+    The "before" plans are taken after dropping the indexes inside a
+    transaction that is rolled back, so the database is left untouched.
+    Use ``--seed`` to generate a dataset first.
+    """
+    help = "Prints and saves EXPLAIN plans for hot queries before/after the approval indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0,
+                            help="Create this many articles and newsletters (plus authors/publishers) first.")
+        parser.add_argument("--output", help="Write the plans to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            self.seed(options["seed"])
+
+        self.analyze()
+        after = self.explain_all()
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for names in HOT_PATH_INDEXES.values():
+                        for name in names:
+                            cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+                self.analyze()
+                before = self.explain_all()
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        results = {
+            "vendor": connection.vendor,
+            "rows": {model.__name__: model.objects.count() for model in HOT_PATH_INDEXES},
+            "queries": {
+                label: {"before": before[label], "after": after[label]} for label in after
+            },
+        }
+        for label, plans in results["queries"].items():
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write("  before:\n    " + plans["before"].replace("\n", "\n    "))
+            self.stdout.write("  after:\n    " + plans["after"].replace("\n", "\n    "))
+
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved plans to {options['output']}"))
+
+    def hot_queries(self):
+        """The queries the indexes are meant for, keyed by a readable label."""
+        author = Article.objects.values_list("author_id", flat=True).first()
+        publisher = Article.objects.exclude(publisher=None).values_list("publisher_id", flat=True).first()
+        queries = {}
+        for model in HOT_PATH_INDEXES:
+            name = model.__name__.lower()
+            queries[f"{name}: approved by author"] = (
+                model.objects.filter(author_id=author, is_approved=True).order_by("-id")[:20]
+            )
+            queries[f"{name}: approved by publisher"] = (
+                model.objects.filter(publisher_id=publisher, is_approved=True).order_by("-id")[:20]
+            )
+            queries[f"{name}: pending approval queue"] = (
+                model.objects.filter(is_approved=False).order_by("id")[:50]
+            )
+        return queries
+
+    def explain_all(self):
+        return {label: queryset.explain() for label, queryset in self.hot_queries().items()}
+
+    def analyze(self):
+        """Refreshes planner statistics so plans reflect the current data."""
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                for model in HOT_PATH_INDEXES:
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+            elif connection.vendor == "sqlite":
+                cursor.execute("ANALYZE")
+
+    def seed(self, count):
+        """Bulk creates ``count`` articles and newsletters over a few authors and publishers."""
+        rng = random.Random(0)
+        offset = User.objects.count()
+        users = User.objects.bulk_create(
+            User(username=f"explain_journalist_{offset + i}") for i in range(50)
+        )
+        Profile.objects.bulk_create(Profile(user=user, role=Profile.Role.JOURNALIST) for user in users)
+        publishers = Publisher.objects.bulk_create(
+            Publisher(name=f"Explain Publisher {offset + i}", admin=users[0]) for i in range(10)
+        )
+        now = timezone.now()
+        for model in HOT_PATH_INDEXES:
+            approved = [rng.random() > 0.05 for _ in range(count)]
+            model.objects.bulk_create(
+                (
+                    model(
+                        title=f"Seeded {model.__name__} {i}",
+                        content="Seeded content.",
+                        author=rng.choice(users),
+                        publisher=rng.choice(publishers),
+                        is_approved=approved[i],
+                        approved_at=now if approved[i] else None,
+                    )
+                    for i in range(count)
+                ),
+                batch_size=1000,
+            )
+        self.stdout.write(f"Seeded {count} articles and {count} newsletters.")
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bronewsapp.content_io import FORMATS, MODELS, buffered, encode_rows, export_queryset, export_row, format_for
+
+WRITE_BUFFER = 64 * 1024
+
+
+class Command(BaseCommand):
+    """
+    Exports articles and newsletters as NDJSON or CSV, in the format
+    ``import_content`` reads (see ``bronewsapp.content_io``).
+
+    Rows are streamed from the database with ``.iterator()``, fetching
+    ``--chunk-size`` rows at a time, so memory use does not grow with the
+    table. ``id`` and ``created_at`` are informational; imports assign
+    their own.
+    """
+    help = "Streams articles and newsletters to an NDJSON or CSV file (stdout by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", default="-", help="File to write ('-' for stdout).")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to csv for .csv files, else ndjson.")
+        parser.add_argument("--type", choices=[*MODELS, "all"], default="all")
+        parser.add_argument("--approved-only", action="store_true")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per round trip.")
+
+    def handle(self, *args, **options):
+        path = options["output"]
+        fmt = format_for(path, options["format"])
+        try:
+            fh = open(path, "w", newline="", encoding="utf-8") if path != "-" else None
+        except OSError as exc:
+            raise CommandError(f"Could not open {path}: {exc}")
+
+        exported = 0
+
+        def rows():
+            nonlocal exported
+            for type_name, model in MODELS.items():
+                if options["type"] not in ("all", type_name):
+                    continue
+                queryset = export_queryset(model, options["approved_only"])
+                for values in queryset.iterator(chunk_size=options["chunk_size"]):
+                    yield export_row(type_name, values)
+                    exported += 1
+
+        # Encoded like the publisher archive endpoint, so the two cannot drift apart.
+        try:
+            for chunk in buffered(encode_rows(rows(), fmt), WRITE_BUFFER):
+                if fh:
+                    fh.write(chunk)
+                else:
+                    self.stdout.write(chunk, ending="")
+        finally:
+            if fh:
+                fh.close()
+
+        if fh:
+            self.stdout.write(self.style.SUCCESS(f"Exported {exported} item(s) to {path}."))
+        else:
+            self.stderr.write(f"Exported {exported} item(s).")
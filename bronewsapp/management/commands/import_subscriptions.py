@@ -0,0 +1,86 @@
+import csv
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Profile
+from bronewsapp.feed import JOURNALIST, PUBLISHER
+from bronewsapp.mailer import chunked
+from bronewsapp.models import Publisher
+from bronewsapp.subscriptions import import_pairs
+
+
+class Command(BaseCommand):
+    """
+    Imports readers' subscriptions from a CSV file, e.g. when migrating
+    readers from another platform.
+
+    Each row is ``reader,kind,source``: a reader's username, ``journalist``
+    or ``publisher``, and the journalist's username or the publisher's
+    name. The file is read a batch at a time; each batch's names are
+    resolved in one query per kind and its subscriptions are inserted in
+    one statement per kind, skipping existing ones. Rows naming unknown
+    readers or sources are reported and skipped, so re-running is safe.
+    """
+    help = "Imports reader,kind,source subscription rows from a CSV file ('-' for stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=settings.SUBSCRIPTION_IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            fh = sys.stdin if options["path"] == "-" else open(options["path"], newline="", encoding="utf-8")
+        except OSError as exc:
+            raise CommandError(f"Could not open {options['path']}: {exc}")
+
+        added = skipped = 0
+        with fh:
+            rows = (row for row in csv.reader(fh) if row and not row[0].startswith("#"))
+            for batch in chunked(rows, options["batch_size"]):
+                batch_added, batch_skipped = self.import_batch(batch, options["batch_size"])
+                added += batch_added
+                skipped += batch_skipped
+        self.stdout.write(self.style.SUCCESS(f"Imported {added} subscription(s); skipped {skipped} row(s)."))
+
+    def import_batch(self, rows, batch_size):
+        """Imports one batch of rows; returns ``(added, skipped)``."""
+        wanted = {JOURNALIST: [], PUBLISHER: []}
+        skipped = 0
+        for line in rows:
+            if len(line) != 3 or line[1].strip().lower() not in wanted:
+                self.stderr.write(f"Skipping malformed row: {','.join(line)}")
+                skipped += 1
+                continue
+            reader, kind, source = (value.strip() for value in line)
+            wanted[kind.lower()].append((reader, source))
+
+        readers = self.ids(
+            Profile.objects.filter(role=Profile.Role.READER), "user__username",
+            {reader for pairs in wanted.values() for reader, _ in pairs},
+        )
+        sources = {
+            JOURNALIST: self.ids(Profile.objects.filter(role=Profile.Role.JOURNALIST), "user__username",
+                                 {source for _, source in wanted[JOURNALIST]}, "user_id"),
+            PUBLISHER: self.ids(Publisher.objects.all(), "name", {source for _, source in wanted[PUBLISHER]}),
+        }
+
+        added = 0
+        for kind, pairs in wanted.items():
+            resolved = []
+            for reader, source in pairs:
+                if reader in readers and source in sources[kind]:
+                    resolved.append((readers[reader], sources[kind][source]))
+                else:
+                    self.stderr.write(f"Skipping unknown reader or {kind}: {reader},{kind},{source}")
+                    skipped += 1
+            if resolved:
+                added += len(import_pairs(kind, resolved, batch_size))
+        return added, skipped
+
+    def ids(self, queryset, name_field, names, id_field="pk"):
+        """``{name: id}`` for the rows of ``queryset`` whose ``name_field`` is in ``names``."""
+        if not names:
+            return {}
+        return dict(queryset.filter(**{f"{name_field}__in": names}).values_list(name_field, id_field))
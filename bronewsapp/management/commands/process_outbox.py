@@ -0,0 +1,44 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bronewsapp.outbox import process_batch, record_queue_depth
+
+
+class Command(BaseCommand):
+    """
+    Drains the notification outbox.
+
+    Runs as a long-lived worker by default; use ``--once`` to process a
+    single batch (e.g. from cron).
+    """
+    help = "Delivers queued approval emails and tweets from the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.OUTBOX_BATCH_SIZE,
+                            help="Number of messages claimed per batch.")
+        parser.add_argument("--poll-interval", type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                            help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Process a single batch and exit.")
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while not self._stopping:
+            processed = process_batch(options["batch_size"])
+            record_queue_depth()
+            if processed:
+                self.stdout.write(f"Processed {processed} outbox message(s).")
+            if options["once"]:
+                break
+            if not processed:
+                time.sleep(options["poll_interval"])
+
+    def _stop(self, signum, frame):
+        """Finish the current batch, then exit."""
+        self._stopping = True
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Profile
+from bronewsapp.feed import rebuild
+
+
+class Command(BaseCommand):
+    """
+    Recomputes materialized reader feeds from current subscriptions.
+
+    Needed once after deploying feeds on an existing database, and safe to
+    re-run at any time.
+    """
+    help = "Rebuilds the feed of every reader (or of the given usernames)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="Only rebuild these readers' feeds.")
+
+    def handle(self, *args, **options):
+        readers = Profile.objects.filter(role=Profile.Role.READER)
+        if options["usernames"]:
+            readers = readers.filter(user__username__in=options["usernames"])
+
+        rebuilt = 0
+        for reader_id in readers.values_list("pk", flat=True).iterator():
+            rebuild(reader_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} feed(s)."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from bronewsapp.subscriptions import recount
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the denormalized subscriber counts of journalists and
+    publishers from the subscription tables.
+
+    The counts are kept up to date as readers subscribe and unsubscribe;
+    this repairs them after changes that bypass the ``m2m_changed`` signal
+    (bulk inserts, raw SQL, cascading deletes of readers). Safe to re-run.
+    """
+    help = "Recomputes every journalist's and publisher's subscriber count."
+
+    def handle(self, *args, **options):
+        recount()
+        self.stdout.write(self.style.SUCCESS("Recounted subscribers."))
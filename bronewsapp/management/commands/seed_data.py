@@ -0,0 +1,139 @@
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts.models import Profile
+from bronewsapp.mailer import chunked
+from bronewsapp.models import Article, Newsletter, Publisher, User, make_excerpt
+from bronewsapp.subscriptions import recount
+
+
+def zipf_cum_weights(count, exponent):
+    """Cumulative weights of ranks ``1..count`` under a power law: ``1 / rank ** exponent``."""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    """
+    Generates a synthetic dataset at a configurable scale.
+
+    Users, profiles, content and subscriptions are bulk inserted, bypassing
+    the per-user ``create_profile`` signal and per-user password hashing
+    (every seeded user shares one hashed ``--password``). Subscriptions
+    follow a power law, so a few journalists and publishers have most of
+    the followers, as in production.
+
+    Feeds are not fanned out for seeded subscriptions; run
+    ``rebuild_feeds`` afterwards if the benchmark should exercise them.
+    """
+    help = "Seeds readers, journalists, editors, publishers, content and power-law subscriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=1000)
+        parser.add_argument("--journalists", type=int, default=50)
+        parser.add_argument("--editors", type=int, default=5)
+        parser.add_argument("--publishers", type=int, default=10)
+        parser.add_argument("--articles", type=int, default=5000)
+        parser.add_argument("--newsletters", type=int, default=1000)
+        parser.add_argument("--journalist-subscriptions", type=float, default=5.0,
+                            help="Mean journalist subscriptions per reader.")
+        parser.add_argument("--publisher-subscriptions", type=float, default=2.0,
+                            help="Mean publisher subscriptions per reader.")
+        parser.add_argument("--exponent", type=float, default=1.1,
+                            help="Power-law exponent of source popularity.")
+        parser.add_argument("--approved", type=float, default=0.9,
+                            help="Fraction of content that is approved.")
+        parser.add_argument("--password", default="benchmark",
+                            help="Password of every seeded user.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--random-seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["random_seed"])
+        self.batch_size = options["batch_size"]
+        self.password = make_password(options["password"])
+        self.offset = (User.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+        with transaction.atomic():
+            admins = self.create_users("admin", Profile.Role.ADMIN, max(1, options["publishers"] // 10))
+            editors = self.create_users("editor", Profile.Role.EDITOR, options["editors"])
+            journalists = self.create_users("journalist", Profile.Role.JOURNALIST, options["journalists"])
+            readers = self.create_users("reader", Profile.Role.READER, options["readers"])
+            publishers = Publisher.objects.bulk_create(
+                (
+                    Publisher(name=f"Seed Publisher {self.offset + i}", admin=self.rng.choice(admins),
+                              content="A seeded publisher.")
+                    for i in range(options["publishers"])
+                ),
+                batch_size=self.batch_size,
+            )
+            for model, count in ((Article, options["articles"]), (Newsletter, options["newsletters"])):
+                self.create_content(model, count, journalists, publishers, options["approved"])
+            self.subscribe(readers, journalists, Profile.sub_journalist.through, "user_id",
+                           options["journalist_subscriptions"], options["exponent"])
+            self.subscribe(readers, publishers, Profile.sub_publisher.through, "publisher_id",
+                           options["publisher_subscriptions"], options["exponent"])
+            # The bulk inserted subscriptions did not go through m2m_changed.
+            recount()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(readers)} readers, {len(journalists)} journalists, {len(editors)} editors, "
+            f"{len(admins)} admins, {len(publishers)} publishers, {options['articles']} articles and "
+            f"{options['newsletters']} newsletters. Seeded users are named seed_<role>_<n> "
+            f"(e.g. seed_reader_{self.offset}) and share the --password given."
+        ))
+
+    def create_users(self, label, role, count):
+        users = []
+        for chunk in chunked(range(count), self.batch_size):
+            users += User.objects.bulk_create(
+                User(username=f"seed_{label}_{self.offset + i}", email=f"seed_{label}_{self.offset + i}@example.com",
+                     password=self.password)
+                for i in chunk
+            )
+        # bulk_create skips post_save, so profiles are created here instead of by the signal.
+        Profile.objects.bulk_create((Profile(user=user, role=role) for user in users), batch_size=self.batch_size)
+        return users
+
+    def create_content(self, model, count, authors, publishers, approved_fraction):
+        if not authors:
+            return
+        now = timezone.now()
+        cum_weights = zipf_cum_weights(len(authors), 1.0)
+        for chunk in chunked(range(count), self.batch_size):
+            items = []
+            for i in chunk:
+                approved = self.rng.random() < approved_fraction
+                created = now - timedelta(minutes=count - i)
+                content = f"Seeded {model._meta.verbose_name} body {i}. " * 20
+                items.append(model(
+                    title=f"Seeded {model._meta.verbose_name} {i}",
+                    content=content,
+                    excerpt=make_excerpt(content),
+                    author=self.rng.choices(authors, cum_weights=cum_weights)[0],
+                    publisher=self.rng.choice(publishers) if publishers and self.rng.random() < 0.7 else None,
+                    is_approved=approved,
+                    approved_at=created if approved else None,
+                ))
+            model.objects.bulk_create(items)
+
+    def subscribe(self, readers, sources, through, source_field, mean, exponent):
+        """Gives every reader about ``mean`` subscriptions, drawn from a power law over ``sources``."""
+        if not sources or mean <= 0:
+            return
+        cum_weights = zipf_cum_weights(len(sources), exponent)
+        rows = []
+        for reader in readers:
+            picks = min(len(sources), round(self.rng.expovariate(1 / mean)))
+            chosen = {source.pk for source in self.rng.choices(sources, cum_weights=cum_weights, k=picks)}
+            rows += [through(profile_id=reader.profile.pk, **{source_field: pk}) for pk in chosen]
+            if len(rows) >= self.batch_size:
+                through.objects.bulk_create(rows, ignore_conflicts=True)
+                rows = []
+        through.objects.bulk_create(rows, ignore_conflicts=True)
@@ -0,0 +1,45 @@
+"""
+Lightweight counters and gauges shared between processes.
+
+Values live in the default cache, so web workers and the outbox worker
+report into the same place whenever ``CACHE_URL`` points at a shared
+backend. They are read back through the staff-only ``metrics`` view.
+"""
+from django.core.cache import cache
+
+PREFIX = "metrics:"
+REGISTRY_KEY = PREFIX + "_names"
+
+
+def _register(name):
+    names = cache.get(REGISTRY_KEY, set())
+    if name not in names:
+        cache.set(REGISTRY_KEY, names | {name}, None)
+
+
+def incr(name, delta=1):
+    """Adds ``delta`` to the counter ``name``."""
+    key = PREFIX + name
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+        _register(name)
+
+
+def set_gauge(name, value):
+    """Records the current value of the gauge ``name``."""
+    cache.set(PREFIX + name, value, None)
+    _register(name)
+
+
+def get(name, default=0):
+    return cache.get(PREFIX + name, default)
+
+
+def snapshot():
+    """Returns every known metric as a ``{name: value}`` dict."""
+    names = sorted(cache.get(REGISTRY_KEY, set()))
+    values = cache.get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def stamp_approved_content(apps, schema_editor):
+    """Content approved before approved_at existed counts as approved now."""
+    for model_name in ("Article", "Newsletter"):
+        model = apps.get_model("bronewsapp", model_name)
+        model.objects.filter(is_approved=True, approved_at__isnull=True).update(approved_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_profile_sub_journalist_and_more'),
+        ('bronewsapp', '0005_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='approved_at',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='approved_at',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(stamp_approved_content, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='kind',
+            field=models.CharField(choices=[('EMAIL', 'Email'), ('TWEET', 'Tweet'), ('FEED', 'Feed fan-out')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('A', 'Article'), ('N', 'Newsletter')], max_length=1)),
+                ('item_id', models.PositiveBigIntegerField()),
+                ('published_at', models.DateTimeField()),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='accounts.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['reader', '-published_at', '-item_type', '-item_id'], name='feed_entry_reader_recent_idx'), models.Index(fields=['item_type', 'item_id'], name='feed_entry_item_idx')],
+                'constraints': [models.UniqueConstraint(fields=('reader', 'item_type', 'item_id'), name='feed_entry_unique_item')],
+            },
+        ),
+    ]
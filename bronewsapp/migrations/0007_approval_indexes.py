@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+from bronewsapp.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('bronewsapp', '0006_feedentry_article_approved_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='article',
+            index=models.Index(fields=['author', 'is_approved', 'id'], name='article_author_approved_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='article',
+            index=models.Index(fields=['publisher', 'is_approved', 'id'], name='article_pub_approved_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_approved', False)), fields=['id'], name='article_pending_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='newsletter',
+            index=models.Index(fields=['author', 'is_approved', 'id'], name='newsletter_author_approved_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='newsletter',
+            index=models.Index(fields=['publisher', 'is_approved', 'id'], name='newsletter_pub_approved_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='newsletter',
+            index=models.Index(condition=models.Q(('is_approved', False)), fields=['id'], name='newsletter_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,137 @@
+from django.db import migrations
+
+# PostgreSQL: a nullable tsvector column per content table, set by a
+# BEFORE INSERT/UPDATE trigger. Adding a nullable column without a default
+# does not rewrite the table; 0015_search_backfill fills in existing rows
+# in batches and builds the GIN index concurrently.
+POSTGRES_TABLES = ("bronewsapp_article", "bronewsapp_newsletter")
+
+POSTGRES_FORWARDS = [
+    """
+    CREATE FUNCTION bronewsapp_search_vector() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+        RETURN NEW;
+    END
+    $$
+    """,
+    *(
+        sql
+        for table in POSTGRES_TABLES
+        for sql in (
+            f"ALTER TABLE {table} ADD COLUMN search_vector tsvector",
+            f"""
+            CREATE TRIGGER {table}_search_vector
+            BEFORE INSERT OR UPDATE OF title, content ON {table}
+            FOR EACH ROW EXECUTE FUNCTION bronewsapp_search_vector()
+            """,
+        )
+    ),
+]
+
+POSTGRES_BACKWARDS = [
+    *(
+        sql
+        for table in POSTGRES_TABLES
+        for sql in (
+            f"DROP TRIGGER IF EXISTS {table}_search_vector ON {table}",
+            f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector",
+        )
+    ),
+    "DROP FUNCTION IF EXISTS bronewsapp_search_vector()",
+]
+
+# SQLite: one FTS5 table over both content types holding approved items
+# only, kept current by triggers (bronewsapp.search re-applies them after
+# every migrate, since SQLite table rebuilds drop triggers). FTS5 rowids
+# pack the item type into the low bit: id * 2 (+ 1 for newsletters). The
+# SQL is spelled out here so later changes to bronewsapp.search cannot
+# change what this migration does.
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE bronewsapp_search USING fts5(title, content, tokenize = 'porter unicode61')",
+    """
+    INSERT INTO bronewsapp_search (rowid, title, content)
+    SELECT id * 2, title, coalesce(content, '') FROM bronewsapp_article WHERE is_approved
+    """,
+    """
+    INSERT INTO bronewsapp_search (rowid, title, content)
+    SELECT id * 2 + 1, title, coalesce(content, '') FROM bronewsapp_newsletter WHERE is_approved
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bronewsapp_article_search_insert
+    AFTER INSERT ON bronewsapp_article WHEN NEW.is_approved
+    BEGIN
+        INSERT INTO bronewsapp_search (rowid, title, content)
+        VALUES (NEW.id * 2, NEW.title, coalesce(NEW.content, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bronewsapp_article_search_update AFTER UPDATE ON bronewsapp_article
+    BEGIN
+        DELETE FROM bronewsapp_search WHERE rowid = OLD.id * 2;
+        INSERT INTO bronewsapp_search (rowid, title, content)
+        SELECT NEW.id * 2, NEW.title, coalesce(NEW.content, '') WHERE NEW.is_approved;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bronewsapp_article_search_delete AFTER DELETE ON bronewsapp_article
+    BEGIN
+        DELETE FROM bronewsapp_search WHERE rowid = OLD.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bronewsapp_newsletter_search_insert
+    AFTER INSERT ON bronewsapp_newsletter WHEN NEW.is_approved
+    BEGIN
+        INSERT INTO bronewsapp_search (rowid, title, content)
+        VALUES (NEW.id * 2 + 1, NEW.title, coalesce(NEW.content, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bronewsapp_newsletter_search_update AFTER UPDATE ON bronewsapp_newsletter
+    BEGIN
+        DELETE FROM bronewsapp_search WHERE rowid = OLD.id * 2 + 1;
+        INSERT INTO bronewsapp_search (rowid, title, content)
+        SELECT NEW.id * 2 + 1, NEW.title, coalesce(NEW.content, '') WHERE NEW.is_approved;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bronewsapp_newsletter_search_delete AFTER DELETE ON bronewsapp_newsletter
+    BEGIN
+        DELETE FROM bronewsapp_search WHERE rowid = OLD.id * 2 + 1;
+    END
+    """,
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS bronewsapp_article_search_insert",
+    "DROP TRIGGER IF EXISTS bronewsapp_article_search_update",
+    "DROP TRIGGER IF EXISTS bronewsapp_article_search_delete",
+    "DROP TRIGGER IF EXISTS bronewsapp_newsletter_search_insert",
+    "DROP TRIGGER IF EXISTS bronewsapp_newsletter_search_update",
+    "DROP TRIGGER IF EXISTS bronewsapp_newsletter_search_delete",
+    "DROP TABLE IF EXISTS bronewsapp_search",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bronewsapp', '0007_approval_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"postgresql": POSTGRES_FORWARDS, "sqlite": SQLITE_FORWARDS}),
+            _run({"postgresql": POSTGRES_BACKWARDS, "sqlite": SQLITE_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:40
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def stamp_approved_content(apps, schema_editor):
+    """Approved content is at least as old as its approval."""
+    for model_name in ("Article", "Newsletter"):
+        model = apps.get_model("bronewsapp", model_name)
+        model.objects.filter(approved_at__isnull=False).update(
+            created_at=F("approved_at"), updated_at=F("approved_at")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bronewsapp', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='publisher',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='publisher',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(stamp_approved_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 23:05
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+EXCERPT_LENGTH = 300
+BATCH_SIZE = 2000
+
+
+def fill_excerpts(apps, schema_editor):
+    """Same as ``bronewsapp.models.make_excerpt``, frozen for this migration."""
+    for model_name in ("Article", "Newsletter"):
+        model = apps.get_model("bronewsapp", model_name)
+        batch = []
+        for item in model.objects.only("id", "content").iterator(chunk_size=BATCH_SIZE):
+            item.excerpt = Truncator(" ".join((item.content or "").split())).chars(EXCERPT_LENGTH)
+            batch.append(item)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ["excerpt"])
+                batch = []
+        model.objects.bulk_update(batch, ["excerpt"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bronewsapp', '0009_content_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
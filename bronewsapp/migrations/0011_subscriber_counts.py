@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 23:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subscribers(apps, schema_editor):
+    """Same as ``bronewsapp.subscriptions.recount``, frozen for this migration."""
+    Profile = apps.get_model("accounts", "Profile")
+    Publisher = apps.get_model("bronewsapp", "Publisher")
+
+    def count_of(through, field, outer_field):
+        return Coalesce(
+            Subquery(
+                through.objects.filter(**{field: OuterRef(outer_field)})
+                .values(field).annotate(n=Count("*")).values("n")
+            ),
+            Value(0),
+        )
+
+    Profile.objects.update(subscriber_count=count_of(Profile.sub_journalist.through, "user_id", "user_id"))
+    Publisher.objects.update(subscriber_count=count_of(Profile.sub_publisher.through, "publisher_id", "pk"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_profile_subscriber_count'),
+        ('bronewsapp', '0010_excerpts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publisher',
+            name='subscriber_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_subscribers, migrations.RunPython.noop),
+    ]
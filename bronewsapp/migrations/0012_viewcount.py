@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bronewsapp', '0011_subscriber_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('A', 'Article'), ('N', 'Newsletter'), ('P', 'Publisher')], max_length=1)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('views', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='view_count_unique_object')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bronewsapp', '0012_viewcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingLandmark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingArticle',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='bronewsapp.article')),
+                ('score', models.FloatField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='trending_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bronewsapp', '0013_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('A', 'Article'), ('N', 'Newsletter')], max_length=1)),
+                ('item_id', models.PositiveBigIntegerField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('related_type', models.CharField(choices=[('A', 'Article'), ('N', 'Newsletter')], max_length=1)),
+                ('related_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['related_type', 'related_id'], name='related_item_target_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item_type', 'item_id', 'rank'), name='related_item_unique_rank')],
+            },
+        ),
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='kind',
+            field=models.CharField(choices=[('EMAIL', 'Email'), ('TWEET', 'Tweet'), ('FEED', 'Feed fan-out'), ('RELATED', 'Related items')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# PostgreSQL only: fills in the search_vector column added (empty) by
+# 0008_search_index for rows written before its trigger existed, then
+# builds the GIN index. Each batch commits on its own and the index is
+# built concurrently, so neither holds a lock that blocks writes for long.
+POSTGRES_TABLES = ("bronewsapp_article", "bronewsapp_newsletter")
+
+BATCH_SIZE = 5000
+
+BACKFILL = """
+    UPDATE {table} SET search_vector =
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    WHERE id IN (
+        SELECT id FROM {table} WHERE search_vector IS NULL AND id > %s ORDER BY id LIMIT %s
+    )
+    RETURNING id
+"""
+
+
+def backfill(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    for table in POSTGRES_TABLES:
+        last = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(BACKFILL.format(table=table), [last, BATCH_SIZE])
+                ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            last = max(ids)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in POSTGRES_TABLES:
+        # An interrupted concurrent build leaves an invalid index behind; drop it first.
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {table}_search_idx")
+        schema_editor.execute(f"CREATE INDEX CONCURRENTLY {table}_search_idx ON {table} USING GIN (search_vector)")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in POSTGRES_TABLES:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {table}_search_idx")
+
+
+class Migration(migrations.Migration):
+    # Batches commit one by one, and CREATE INDEX CONCURRENTLY cannot run
+    # inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('bronewsapp', '0014_relateditem'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,7 +1,31 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.text import Truncator
 from accounts.models import Profile
 
+EXCERPT_LENGTH = 300
+
+
+def make_excerpt(content):
+    """The start of ``content`` for list pages: whitespace collapsed, at most ``EXCERPT_LENGTH`` characters."""
+    return Truncator(" ".join((content or "").split())).chars(EXCERPT_LENGTH)
+
+
+class ExcerptMixin:
+    """
+    Keeps the stored ``excerpt`` in step with ``content`` on every save, so
+    list pages never load full bodies. ``bulk_create`` and ``update()``
+    bypass this and must set ``excerpt`` themselves.
+    """
+
+    def save(self, *args, **kwargs):
+        self.excerpt = make_excerpt(self.content)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "content" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "excerpt"}
+        super().save(*args, **kwargs)
+
 
 class Publisher(models.Model):
     name = models.CharField(max_length=200, unique=True)
@@ -12,12 +36,16 @@ class Publisher(models.Model):
         limit_choices_to={'profile__role': "ADMIN"}
     )
     content = models.TextField(null=True, blank=True, default=None)
+    # Maintained by bronewsapp.subscriptions.
+    subscriber_count = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
 
-class Article(models.Model):
+class Article(ExcerptMixin, models.Model):
     """
     Model for an article.
     """
@@ -28,6 +56,7 @@ class Article(models.Model):
         limit_choices_to={'profile__role': "JOURNALIST"}
     )
     content = models.TextField(null=True, blank=True, default=None)
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, default="", editable=False)
     
     publisher = models.ForeignKey(
         Publisher,
@@ -37,12 +66,24 @@ class Article(models.Model):
     )
     
     is_approved = models.BooleanField(default=False)
+    approved_at = models.DateTimeField(null=True, blank=True, default=None)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Every hot path filters approval state by author or by publisher;
+        # ``id`` last serves the keyset ordering from the same index.
+        indexes = [
+            models.Index(fields=["author", "is_approved", "id"], name="article_author_approved_idx"),
+            models.Index(fields=["publisher", "is_approved", "id"], name="article_pub_approved_idx"),
+            models.Index(fields=["id"], condition=models.Q(is_approved=False), name="article_pending_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
 
-class Newsletter(models.Model):
+class Newsletter(ExcerptMixin, models.Model):
     """
     Model for a newsletter.
     """
@@ -54,6 +95,7 @@ class Newsletter(models.Model):
         limit_choices_to={'profile__role': "JOURNALIST"}
     )
     content = models.TextField(null=True, blank=True, default=None)
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, default="", editable=False)
 
     publisher = models.ForeignKey(
         Publisher,
@@ -63,7 +105,166 @@ class Newsletter(models.Model):
     )
 
     is_approved = models.BooleanField(default=False)
+    approved_at = models.DateTimeField(null=True, blank=True, default=None)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Every hot path filters approval state by author or by publisher;
+        # ``id`` last serves the keyset ordering from the same index.
+        indexes = [
+            models.Index(fields=["author", "is_approved", "id"], name="newsletter_author_approved_idx"),
+            models.Index(fields=["publisher", "is_approved", "id"], name="newsletter_pub_approved_idx"),
+            models.Index(fields=["id"], condition=models.Q(is_approved=False), name="newsletter_pending_idx"),
+        ]
 
     def __str__(self):
         return self.title
-    
\ No newline at end of file
+
+
+class FeedEntry(models.Model):
+    """
+    One approved item in one reader's materialized feed.
+
+    Rows are written when content is approved (fan-out on write) and when
+    a reader subscribes, and pruned when they unsubscribe. Authors and
+    publishers with very large audiences are not fanned out; their items
+    are merged in when the feed is read (see ``bronewsapp.feed``).
+    """
+    class ItemType(models.TextChoices):
+        ARTICLE = "A", "Article"
+        NEWSLETTER = "N", "Newsletter"
+
+    reader = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="feed_entries")
+    item_type = models.CharField(max_length=1, choices=ItemType)
+    item_id = models.PositiveBigIntegerField()
+    published_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["reader", "item_type", "item_id"], name="feed_entry_unique_item"),
+        ]
+        indexes = [
+            models.Index(fields=["reader", "-published_at", "-item_type", "-item_id"], name="feed_entry_reader_recent_idx"),
+            models.Index(fields=["item_type", "item_id"], name="feed_entry_item_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_item_type_display()} #{self.item_id} for {self.reader_id}"
+
+
+class RelatedItem(models.Model):
+    """
+    One of an approved item's most similar approved items, by TF-IDF
+    cosine similarity. Precomputed by ``bronewsapp.related``; the related
+    item's title is copied here so a detail page needs one query.
+    """
+    item_type = models.CharField(max_length=1, choices=FeedEntry.ItemType)
+    item_id = models.PositiveBigIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    related_type = models.CharField(max_length=1, choices=FeedEntry.ItemType)
+    related_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=255)
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["item_type", "item_id", "rank"], name="related_item_unique_rank"),
+        ]
+        indexes = [
+            models.Index(fields=["related_type", "related_id"], name="related_item_target_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.item_type}#{self.item_id} -> {self.related_type}#{self.related_id} ({self.score:.2f})"
+
+
+class OutboxMessage(models.Model):
+    """
+    A notification waiting to be delivered by the outbox worker.
+
+    Rows are written in the same transaction as the change that caused
+    them, and drained by the ``process_outbox`` management command.
+    """
+    class Kind(models.TextChoices):
+        EMAIL = "EMAIL", "Email"
+        TWEET = "TWEET", "Tweet"
+        FEED = "FEED", "Feed fan-out"
+        RELATED = "RELATED", "Related items"
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        DONE = "DONE", "Done"
+        FAILED = "FAILED", "Failed"
+
+    kind = models.CharField(max_length=20, choices=Kind)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=Status, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["available_at", "id"]
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="outbox_status_available_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class ViewCount(models.Model):
+    """
+    How many times an article, newsletter or publisher page was viewed.
+
+    Kept apart from the content tables so counting never touches their
+    rows (or their search triggers). Written in batches by
+    ``bronewsapp.viewcounts``.
+    """
+    class Kind(models.TextChoices):
+        ARTICLE = "A", "Article"
+        NEWSLETTER = "N", "Newsletter"
+        PUBLISHER = "P", "Publisher"
+
+    kind = models.CharField(max_length=1, choices=Kind)
+    object_id = models.PositiveBigIntegerField()
+    views = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="view_count_unique_object"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.object_id}: {self.views}"
+
+
+class TrendingArticle(models.Model):
+    """
+    An approved article's trending score, maintained by ``bronewsapp.trending``.
+
+    ``score`` is forward-decayed: each event adds its weight scaled by how
+    long after the :class:`TrendingLandmark` it happened, so scores only
+    ever grow and ranking by the stored value is ranking by decayed score.
+    """
+    article = models.OneToOneField(Article, on_delete=models.CASCADE, primary_key=True, related_name="trending")
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score"], name="trending_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.article_id}: {self.score:.1f}"
+
+
+class TrendingLandmark(models.Model):
+    """The single row holding the time ``TrendingArticle`` scores are relative to."""
+    at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.at.isoformat()
@@ -0,0 +1,39 @@
+"""
+Custom migration operations.
+"""
+from django.db import migrations
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    AddIndex that is built with ``CREATE INDEX CONCURRENTLY`` on PostgreSQL,
+    so adding it to a large table does not block writes. Other databases
+    get a plain ``CREATE INDEX``.
+
+    Migrations using it must set ``atomic = False``: PostgreSQL refuses to
+    build an index concurrently inside a transaction.
+    """
+
+    def _concurrently(self, schema_editor):
+        return schema_editor.connection.vendor == "postgresql"
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if self._concurrently(schema_editor):
+            schema_editor.add_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if self._concurrently(schema_editor):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, self.index)
+
+    def describe(self):
+        return super().describe() + " (concurrently on PostgreSQL)"
@@ -0,0 +1,219 @@
+"""
+Transactional outbox for approval notifications.
+
+Views never talk to SMTP or Twitter, fan content out to feeds, or index
+it for related items directly. They call one of the ``queue_*`` helpers
+inside the same transaction that approves the content, and the
+``process_outbox`` worker delivers the messages later with retries and
+exponential backoff.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import metrics
+from .feed import fan_out
+from .mailer import send_to_subscribers
+from .models import FeedEntry, OutboxMessage, User
+from .related import add_items
+from .tweety import RateLimited, post_tweet
+
+logger = logging.getLogger(__name__)
+
+TWEET_LENGTH = 280
+
+
+def enqueue(kind, payload):
+    """Stores a notification to be delivered by the outbox worker."""
+    return OutboxMessage.objects.create(kind=kind, payload=payload)
+
+
+def _announce(group, username):
+    """Email subject and message (also the tweet) for one journalist's approved articles."""
+    if len(group) == 1:
+        title = group[0].title
+        return f"This article has been approved: {title}", f"Check out: {title} - Written by {username}"
+    titles = "; ".join(article.title for article in group)
+    return f"{len(group)} articles by {username} have been approved", f"{len(group)} new articles by {username}: {titles}"
+
+
+def queue_articles_approved(articles):
+    """
+    Queues the notifications for freshly approved articles: one subscriber
+    email and one tweet per journalist, however many of their articles
+    were approved, and a single feed fan-out for the lot.
+    Must be called inside the transaction that sets ``is_approved``.
+    """
+    by_author = {}
+    for article in articles:
+        by_author.setdefault(article.author_id, []).append(article)
+    usernames = dict(User.objects.filter(pk__in=by_author).values_list("pk", "username"))
+
+    messages = []
+    for author_id, group in by_author.items():
+        subject, announcement = _announce(group, usernames.get(author_id, ""))
+        messages.append(OutboxMessage(kind=OutboxMessage.Kind.EMAIL, payload={
+            "author_id": author_id,
+            "subject": subject,
+            "message": announcement,
+        }))
+        tweet = announcement if len(announcement) <= TWEET_LENGTH else announcement[:TWEET_LENGTH - 1] + "\u2026"
+        messages.append(OutboxMessage(kind=OutboxMessage.Kind.TWEET, payload={"text": tweet}))
+    OutboxMessage.objects.bulk_create(messages)
+    queue_feed_fanout(FeedEntry.ItemType.ARTICLE, [article.pk for article in articles])
+    queue_related(FeedEntry.ItemType.ARTICLE, [article.pk for article in articles])
+
+
+def queue_feed_fanout(item_type, item_ids):
+    """Queues writing newly approved items into their subscribers' feeds."""
+    enqueue(OutboxMessage.Kind.FEED, {"item_type": item_type, "item_ids": list(item_ids)})
+
+
+def queue_related(item_type, item_ids):
+    """Queues adding newly approved items to the related-items index."""
+    enqueue(OutboxMessage.Kind.RELATED, {"item_type": item_type, "item_ids": list(item_ids)})
+
+
+def queue_newsletters_approved(newsletters):
+    """
+    Queues the notifications for freshly approved newsletters.
+    Must be called inside the transaction that sets ``is_approved``.
+    """
+    queue_feed_fanout(FeedEntry.ItemType.NEWSLETTER, [newsletter.pk for newsletter in newsletters])
+    queue_related(FeedEntry.ItemType.NEWSLETTER, [newsletter.pk for newsletter in newsletters])
+
+
+def deliver_email(message):
+    """
+    Emails the subscribers of the journalist named in the payload.
+
+    Progress is checkpointed on the message as chunks go out, so a retry
+    after a partial failure carries on where the last attempt stopped
+    instead of emailing everyone twice.
+    """
+    payload = message.payload
+
+    def checkpoint(last_profile_id):
+        payload["cursor"] = last_profile_id
+        message.save(update_fields=["payload"])
+
+    send_to_subscribers(
+        payload["author_id"],
+        payload["subject"],
+        payload["message"],
+        after_id=payload.get("cursor", 0),
+        on_progress=checkpoint,
+    )
+
+
+def deliver_tweet(message):
+    """Posts the tweet text from the payload, once per message."""
+    post_tweet(message.payload["text"], key=message.pk)
+
+
+def deliver_feed(message):
+    """Fans the approved items out to their subscribers' feeds."""
+    payload = message.payload
+    # Messages queued before batching carry a single ``item_id``.
+    for item_id in payload.get("item_ids") or [payload["item_id"]]:
+        fan_out(payload["item_type"], item_id)
+
+
+def deliver_related(message):
+    """Gives the approved items related items and adds them to other items' lists."""
+    add_items(message.payload["item_type"], message.payload["item_ids"])
+
+
+HANDLERS = {
+    OutboxMessage.Kind.EMAIL: deliver_email,
+    OutboxMessage.Kind.TWEET: deliver_tweet,
+    OutboxMessage.Kind.FEED: deliver_feed,
+    OutboxMessage.Kind.RELATED: deliver_related,
+}
+
+
+def retry_delay(attempts):
+    """Exponential backoff, capped at ``OUTBOX_RETRY_MAX_DELAY`` seconds."""
+    delay = settings.OUTBOX_RETRY_BASE_DELAY * (2 ** (attempts - 1))
+    return timedelta(seconds=min(delay, settings.OUTBOX_RETRY_MAX_DELAY))
+
+
+def claim_batch(batch_size):
+    """
+    Leases up to ``batch_size`` due messages to the calling worker.
+
+    Claimed rows are pushed ``OUTBOX_LEASE_SECONDS`` into the future so
+    other workers skip them; if this worker dies mid-batch they simply
+    become due again once the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.Status.PENDING, available_at__lte=now)
+            .order_by("available_at", "id")[:batch_size]
+        )
+        if messages:
+            OutboxMessage.objects.filter(pk__in=[m.pk for m in messages]).update(
+                available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            )
+    return messages
+
+
+def process_message(message):
+    """Delivers one message and records the outcome. Returns True on success."""
+    handler = HANDLERS[message.kind]
+    try:
+        handler(message)
+    except RateLimited as exc:
+        # Not a failure: wait for the rate limit window without using up an attempt.
+        message.available_at = timezone.now() + timedelta(seconds=exc.retry_after)
+        message.save(update_fields=["available_at"])
+        return False
+    except Exception as exc:
+        message.attempts += 1
+        logger.warning("Outbox message %s failed (attempt %s): %s", message.pk, message.attempts, exc)
+        message.last_error = f"{type(exc).__name__}: {exc}"
+        if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            message.status = OutboxMessage.Status.FAILED
+            message.processed_at = timezone.now()
+        else:
+            message.available_at = timezone.now() + retry_delay(message.attempts)
+        message.save(update_fields=["attempts", "last_error", "status", "available_at", "processed_at"])
+        return False
+
+    message.attempts += 1
+    message.status = OutboxMessage.Status.DONE
+    message.processed_at = timezone.now()
+    message.last_error = ""
+    message.save(update_fields=["attempts", "last_error", "status", "processed_at"])
+    return True
+
+
+def process_batch(batch_size=None):
+    """
+    Claims and delivers one batch of due messages.
+    Returns the number of messages that were attempted.
+    """
+    messages = claim_batch(batch_size or settings.OUTBOX_BATCH_SIZE)
+    for message in messages:
+        process_message(message)
+    return len(messages)
+
+
+def record_queue_depth():
+    """Publishes the number of pending messages per kind as gauges."""
+    depth = dict.fromkeys(OutboxMessage.Kind.values, 0)
+    depth.update(
+        OutboxMessage.objects
+        .filter(status=OutboxMessage.Status.PENDING)
+        .values_list("kind")
+        .annotate(Count("id"))
+    )
+    for kind, pending in depth.items():
+        metrics.set_gauge(f"outbox.pending.{kind.lower()}", pending)
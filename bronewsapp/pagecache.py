@@ -0,0 +1,174 @@
+"""
+Full-page caching of anonymous responses, purged by surrogate key.
+
+Views tag their responses with surrogate keys (``article:12``,
+``publisher:3``, ``journalist:7``, ...) in a ``Surrogate-Key`` header,
+which an upstream proxy can use as well. :func:`cache_anonymous_page`
+stores successful ``GET`` responses for anonymous users without pending
+messages, together with the version of each of their keys.
+
+:func:`purge` sets a key's version to the current time, so every page
+tagged with it is stale from then on. A page whose keys were purged while
+it was rendering is not stored. Receivers of :data:`surrogate_keys_purged`
+can forward purges to a proxy.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import metrics
+from .conditional import has_pending_messages
+
+SURROGATE_KEY_HEADER = "Surrogate-Key"
+
+# Sent with ``keys`` after they are purged.
+surrogate_keys_purged = Signal()
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def _tag_key(key):
+    return f"pagetag:{key}"
+
+
+def source_keys(items):
+    """Surrogate keys of the journalists and publishers of ``items``."""
+    keys = {}
+    for item in items:
+        keys[f"journalist:{item.author_id}"] = None
+        if item.publisher_id is not None:
+            keys[f"publisher:{item.publisher_id}"] = None
+    return list(keys)
+
+
+def item_keys(item):
+    """Surrogate keys of an article or newsletter's own page."""
+    return [f"{item._meta.model_name}:{item.pk}", *source_keys([item])]
+
+
+def tag(response, *keys):
+    """Adds surrogate ``keys`` to ``response``."""
+    existing = response.get(SURROGATE_KEY_HEADER, "").split()
+    response[SURROGATE_KEY_HEADER] = " ".join(dict.fromkeys([*existing, *keys]))
+    return response
+
+
+def purge(*keys):
+    """Makes every cached page tagged with any of ``keys`` stale."""
+    if not keys:
+        return
+    now = _now()
+    cache.set_many({_tag_key(key): now for key in keys}, None)
+    surrogate_keys_purged.send(sender=None, keys=keys)
+
+
+def purge_on_commit(*keys):
+    """:func:`purge` once the current transaction commits, so no page is re-cached from old data."""
+    if keys:
+        transaction.on_commit(lambda: purge(*keys))
+
+
+def _page_key(request):
+    url = request.build_absolute_uri()
+    return "page:" + hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+
+
+def _cacheable(request, user):
+    # The user is resolved first: it loads the session the messages may live in.
+    return request.method in ("GET", "HEAD") and not user.is_authenticated and not has_pending_messages(request)
+
+
+def _fresh(entry):
+    """The cached response if none of its keys were purged since it was stored."""
+    if entry is None:
+        return None
+    versions, response = entry
+    current = cache.get_many(list(versions))
+    if all(current.get(key) == version for key, version in versions.items()):
+        return response
+    return None
+
+
+def _entry(request, response, started):
+    """What to cache for ``response``, or ``None`` if it must not be cached."""
+    if (
+        request.method != "GET"
+        or response.status_code != 200
+        or response.streaming
+        or response.cookies
+        or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")  # The page holds a CSRF token.
+        or has_pending_messages(request)
+    ):
+        return None
+    keys = [_tag_key(key) for key in response.get(SURROGATE_KEY_HEADER, "").split()]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Never purged. ``add`` leaves a concurrent purge in place; the
+            # page then mismatches it and is treated as stale.
+            cache.add(key, 0, None)
+            versions[key] = 0
+    if any(version >= started for version in versions.values()):
+        return None  # Purged while rendering.
+    return versions, response
+
+
+def _hit(request, response):
+    metrics.incr("cache.page.hits")
+    return get_conditional_response(
+        request,
+        etag=response.get("ETag"),
+        last_modified=parse_http_date_safe(response.get("Last-Modified", "")),
+        response=response,
+    )
+
+
+def _store(key, entry):
+    metrics.incr("cache.page.misses")
+    if entry is not None:
+        cache.set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+
+
+def cache_anonymous_page(view):
+    """
+    Serves the view's response for anonymous users from the page cache.
+    Works on sync and async views.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or not _cacheable(request, await request.auser()):
+                return await view(request, *args, **kwargs)
+            key = _page_key(request)
+            cached = await sync_to_async(_fresh)(await cache.aget(key))
+            if cached is not None:
+                return await sync_to_async(_hit)(request, cached)
+            started = _now()
+            response = await view(request, *args, **kwargs)
+            await sync_to_async(_store)(key, await sync_to_async(_entry)(request, response, started))
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable(request, request.user):
+            return view(request, *args, **kwargs)
+        key = _page_key(request)
+        cached = _fresh(cache.get(key))
+        if cached is not None:
+            return _hit(request, cached)
+        started = _now()
+        response = view(request, *args, **kwargs)
+        _store(key, _entry(request, response, started))
+        return response
+    return wrapper
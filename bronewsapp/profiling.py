@@ -0,0 +1,128 @@
+"""
+Per-request SQL instrumentation.
+
+:class:`QueryRecorder` hooks into every database connection with
+``execute_wrapper`` (so it works with ``DEBUG`` off) and groups queries by
+shape: the SQL before parameters are bound, with ``IN`` lists collapsed.
+The same shape running several times in one request is the signature of
+an N+1 loop.
+
+:class:`QueryProfileMiddleware` reports this for every request when
+``QUERY_PROFILE`` is on; :mod:`bronewsapp.testing` uses the same recorder
+to enforce query budgets in tests.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\bIN \((?:%s, )*%s\)", re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """The shape of a query: its SQL with ``IN (%s, %s, ...)`` lists collapsed."""
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+class QueryRecorder:
+    """
+    Records the queries run on every connection while used as a context
+    manager, with their total time.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries.append(sql)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def duplicates(self, threshold=2):
+        """``{shape: times}`` for query shapes that ran at least ``threshold`` times."""
+        shapes = Counter(fingerprint(sql) for sql in self.queries)
+        return {shape: times for shape, times in shapes.most_common() if times >= threshold}
+
+
+class QueryProfileMiddleware:
+    """
+    Logs the query count, DB time, wall time and probable N+1 query shapes
+    of every request, keyed by view name. Enabled by ``QUERY_PROFILE``;
+    ``QUERY_PROFILE_HEADER`` also returns the summary in an
+    ``X-Query-Profile`` response header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - started)
+
+    def report(self, request, response, recorder, wall_time):
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        suspects = recorder.duplicates(settings.QUERY_PROFILE_N_PLUS_ONE_THRESHOLD)
+        summary = (
+            f"queries={recorder.count}; db_ms={recorder.db_time * 1000:.1f}; "
+            f"wall_ms={wall_time * 1000:.1f}; n_plus_one={len(suspects)}"
+        )
+
+        logger.info("%s %s [%s] %s", request.method, request.path, view, summary)
+        for shape, times in suspects.items():
+            logger.warning("Probable N+1 in %s: %d x %s", view, times, shape)
+
+        metrics.incr(f"view.{view}.requests")
+        metrics.incr(f"view.{view}.queries", recorder.count)
+        metrics.incr(f"view.{view}.db_ms", round(recorder.db_time * 1000))
+        metrics.incr(f"view.{view}.wall_ms", round(wall_time * 1000))
+        if suspects:
+            metrics.incr(f"view.{view}.n_plus_one")
+
+        if settings.QUERY_PROFILE_HEADER:
+            response["X-Query-Profile"] = summary
+        return response
@@ -0,0 +1,427 @@
+"""
+Related articles and newsletters, by TF-IDF cosine similarity.
+
+:func:`build` (the ``build_related`` command) turns the title and content
+of every approved article and newsletter into a SciPy CSR matrix of
+L2-normalized TF-IDF rows (sublinear term frequencies, smoothed idf,
+words in fewer than ``RELATED_MIN_DF`` items or more than the
+``RELATED_MAX_DF`` share of them left out). Each item's top
+``RELATED_COUNT`` neighbours come from multiplying ``RELATED_CHUNK_SIZE``
+rows at a time by the whole matrix and ranking the scores of at least
+``RELATED_MIN_SCORE``, which keeps the products sparse. The neighbours
+replace the ``RelatedItem`` table, and the matrix is saved with its
+vocabulary and idf to ``RELATED_INDEX_PATH``.
+
+Items approved later are added by the outbox worker (:func:`add_items`):
+they are weighted with the saved vocabulary and idf, scored against the
+indexed items, given their own neighbours, and put into the lists of the
+neighbours they now outrank. Their rows are saved as a small file in
+``<RELATED_INDEX_PATH>.additions/``, and the worker keeps what it has
+read in memory, so an approval never reads or rewrites the whole index.
+The next build folds them in. Words first seen since the last build
+count once it is rebuilt.
+
+The web and worker services must share ``RELATED_INDEX_PATH`` (and its
+lock file and additions), since ``build_related`` and the worker both
+write there.
+
+Detail pages read an item's neighbours with one indexed query
+(:func:`related_to`) and never compute a similarity.
+"""
+import os
+import re
+import tempfile
+import uuid
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.core.files import locks
+from django.db import transaction
+from django.db.models import Q
+from scipy import sparse
+
+from .feed import ITEM_MODELS
+from .models import RelatedItem
+from .pagecache import purge_on_commit
+
+# Surrogate key of every page listing related items, purged by a rebuild.
+TAG = "related"
+# Runs of two or more letters, in any script.
+WORD = re.compile(r"[^\W\d_]{2,}")
+INSERT_BATCH_SIZE = 1000
+
+
+class Index(NamedTuple):
+    """The TF-IDF rows of the indexed items, and what is needed to weigh new ones alike."""
+    matrix: sparse.csr_matrix  # One L2-normalized float32 row per item.
+    types: np.ndarray  # Item type of each row.
+    ids: np.ndarray  # Item id of each row.
+    terms: np.ndarray  # Word of each column.
+    idf: np.ndarray  # Inverse document frequency of each column.
+
+
+def related_to(item_type, item_id):
+    """An item's ``RelatedItem`` rows, most similar first."""
+    return RelatedItem.objects.filter(item_type=item_type, item_id=item_id).order_by("rank")
+
+
+def page_keys(rows):
+    """Surrogate keys of the pages of the items ``rows`` link to."""
+    return [f"{ITEM_MODELS[row.related_type]._meta.model_name}:{row.related_id}" for row in rows]
+
+
+def forget(item_type, item_id):
+    """Drops an item that was deleted or unapproved from every list, and its own."""
+    RelatedItem.objects.filter(item_type=item_type, item_id=item_id).delete()
+    RelatedItem.objects.filter(related_type=item_type, related_id=item_id).delete()
+
+
+def retitle(item_type, item_id, title):
+    """Copies an item's new title into the lists it appears in."""
+    RelatedItem.objects.filter(related_type=item_type, related_id=item_id).exclude(title=title).update(title=title)
+
+
+def _words(title, content):
+    return Counter(WORD.findall(f"{title} {content or ''}".lower()))
+
+
+def _documents():
+    """Yields ``(item_type, item_id, title, word_counts)`` for every approved item."""
+    for item_type, model in ITEM_MODELS.items():
+        rows = model.objects.filter(is_approved=True).order_by("pk").values_list("pk", "title", "content")
+        for pk, title, content in rows.iterator(chunk_size=2000):
+            yield item_type, pk, title, _words(title, content)
+
+
+def _count_matrix(word_counts, columns, grow=False):
+    """
+    A CSR matrix with a row of counts per item of ``word_counts``.
+    ``columns`` maps words to columns; unknown words get a new column if
+    ``grow``, and are left out otherwise.
+    """
+    indptr, indices, data = array("q", [0]), array("i"), array("f")
+    for counts in word_counts:
+        for word, count in counts.items():
+            column = columns.get(word)
+            if column is None:
+                if not grow:
+                    continue
+                column = columns[word] = len(columns)
+            indices.append(column)
+            data.append(count)
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.frombuffer(data, np.float32), np.frombuffer(indices, np.int32), np.frombuffer(indptr, np.int64)),
+        shape=(len(indptr) - 1, len(columns)),
+    )
+
+
+def _weigh(counts, idf):
+    """TF-IDF rows from word counts: ``1 + log(tf)`` times idf, scaled to unit length."""
+    weighted = counts.astype(np.float32)
+    weighted.data = 1 + np.log(weighted.data)
+    weighted = weighted @ sparse.diags(idf)
+    norms = np.sqrt(weighted.multiply(weighted).sum(axis=1)).A1
+    norms[norms == 0] = 1
+    return (sparse.diags(1 / norms) @ weighted).astype(np.float32).tocsr()
+
+
+def _neighbours(scores, first):
+    """
+    Each row's best ``RELATED_COUNT`` ``(column, score)`` pairs, best first,
+    from a sparse matrix of ``scores`` of rows ``first`` onwards against
+    every row (so row ``i``'s own column, ``first + i``, is left out).
+    Only scores of at least ``RELATED_MIN_SCORE`` can make a list, so the
+    product stays sparse and just those are ranked.
+    """
+    scores = scores.tocoo()
+    keep = (scores.data >= settings.RELATED_MIN_SCORE) & (scores.col != first + scores.row)
+    row, column, score = scores.row[keep], scores.col[keep], scores.data[keep]
+    # By row, then best score first, ties going to the earlier item.
+    order = np.lexsort((column, -score, row))
+    row, column, score = row[order], column[order], score[order]
+    starts = np.searchsorted(row, np.arange(scores.shape[0] + 1))
+    stops = np.minimum(starts[1:], starts[:-1] + settings.RELATED_COUNT)
+    return [
+        list(zip(column[start:stop].tolist(), score[start:stop].tolist()))
+        for start, stop in zip(starts[:-1], stops)
+    ]
+
+
+def _lock_path():
+    return f"{settings.RELATED_INDEX_PATH}.lock"
+
+
+def _additions_dir():
+    return f"{settings.RELATED_INDEX_PATH}.additions"
+
+
+@contextmanager
+def _locked():
+    """Holds the index lock, so builds and additions never interleave."""
+    os.makedirs(os.path.dirname(os.path.abspath(settings.RELATED_INDEX_PATH)), exist_ok=True)
+    with open(_lock_path(), "a") as fh:
+        locks.lock(fh, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(fh)
+
+
+def _save(path, matrix, types, ids, **arrays):
+    """Writes rows of the index to ``path`` in one step, readable by the other services."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                     shape=np.array(matrix.shape), types=types, ids=ids, **arrays)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _matrix(saved):
+    return sparse.csr_matrix((saved["data"], saved["indices"], saved["indptr"]), shape=tuple(saved["shape"]))
+
+
+def _keys(saved):
+    return list(zip(saved["types"].tolist(), saved["ids"].tolist()))
+
+
+class _LoadedIndex:
+    """
+    The saved index as this process last read it: the last build, kept with
+    its word-to-items matrix for scoring, and the additions since. The
+    build is only read again once it is rebuilt, and each addition once.
+    """
+
+    def __init__(self, stamp, saved):
+        self.stamp = stamp
+        self.generation = str(saved["generation"])
+        self.matrix = _matrix(saved)
+        self.transposed = self.matrix.T.tocsr()
+        self.terms, self.idf = saved["terms"], saved["idf"]
+        self.columns = {word: column for column, word in enumerate(self.terms.tolist())}
+        self.added = sparse.csr_matrix((0, self.matrix.shape[1]), dtype=np.float32)
+        self.keys = _keys(saved)
+        self.indexed = set(self.keys)
+        self.seen = set()  # Addition files already read (or skipped as stale).
+
+    def add(self, name, matrix, keys):
+        self.seen.add(name)
+        self.added = sparse.vstack([self.added, matrix], format="csr")
+        self.keys.extend(keys)
+        self.indexed.update(keys)
+
+    def scores(self, vectors):
+        """Similarities of ``vectors`` to every indexed item, then to each other."""
+        return sparse.hstack(
+            [vectors @ self.transposed, vectors @ self.added.T, vectors @ vectors.T], format="csr"
+        )
+
+
+_loaded = None
+
+
+def _current():
+    """The saved index, reading only the files that changed since this process last looked."""
+    global _loaded
+    path = settings.RELATED_INDEX_PATH
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _loaded = None
+        return None
+    stamp = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _loaded is None or _loaded.stamp != stamp:
+        with np.load(path, allow_pickle=False) as saved:
+            _loaded = _LoadedIndex(stamp, saved)
+
+    directory = _additions_dir()
+    names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    for name in names:
+        if name.startswith(".") or name in _loaded.seen:
+            continue
+        with np.load(os.path.join(directory, name), allow_pickle=False) as saved:
+            if str(saved["generation"]) == _loaded.generation:
+                _loaded.add(name, _matrix(saved), _keys(saved))
+            else:
+                _loaded.seen.add(name)  # Left behind by a build that was interrupted.
+    return _loaded
+
+
+def load():
+    """The saved :class:`Index`, additions included, or ``None`` before the first build."""
+    if not os.path.exists(settings.RELATED_INDEX_PATH):
+        return None
+    with _locked():
+        index = _current()
+        if index is None:
+            return None
+        return Index(
+            sparse.vstack([index.matrix, index.added], format="csr"),
+            np.array([item_type for item_type, _ in index.keys], dtype=str),
+            np.array([item_id for _, item_id in index.keys], dtype=np.int64),
+            index.terms,
+            index.idf,
+        )
+
+
+def _replace_lists(lists):
+    """Writes ``{(item_type, item_id): [(related_type, related_id, title, score)]}`` over those items' rows."""
+    by_type = {}
+    for item_type, item_id in lists:
+        by_type.setdefault(item_type, []).append(item_id)
+    for item_type, item_ids in by_type.items():
+        RelatedItem.objects.filter(item_type=item_type, item_id__in=item_ids).delete()
+    RelatedItem.objects.bulk_create(
+        [
+            RelatedItem(item_type=item_type, item_id=item_id, rank=rank, related_type=related_type,
+                        related_id=related_id, title=title, score=score)
+            for (item_type, item_id), neighbours in lists.items()
+            for rank, (related_type, related_id, title, score) in enumerate(neighbours)
+        ],
+        batch_size=INSERT_BATCH_SIZE,
+    )
+
+
+def build(chunk_size=None):
+    """Recomputes every approved item's neighbours and saves the index. Returns how many items were indexed."""
+    chunk_size = chunk_size or settings.RELATED_CHUNK_SIZE
+    with _locked():
+        keys, titles, columns = [], [], {}
+
+        def word_counts():
+            for item_type, item_id, title, counts in _documents():
+                keys.append((item_type, item_id))
+                titles.append(title)
+                yield counts
+
+        counts = _count_matrix(word_counts(), columns, grow=True)
+
+        items = len(keys)
+        frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+        kept = np.flatnonzero(
+            (frequency >= settings.RELATED_MIN_DF)
+            & (frequency <= max(settings.RELATED_MIN_DF, settings.RELATED_MAX_DF * items))
+        )
+        idf = (np.log((1 + items) / (1 + frequency[kept])) + 1).astype(np.float32)
+        matrix = _weigh(counts[:, kept], idf)
+        words = np.array(list(columns), dtype=str) if columns else np.array([], dtype=str)
+
+        transposed = matrix.T.tocsr()
+        with transaction.atomic():
+            RelatedItem.objects.all().delete()
+            for first in range(0, items, chunk_size):
+                neighbours = _neighbours(matrix[first:first + chunk_size] @ transposed, first)
+                _replace_lists({
+                    keys[first + offset]: [(*keys[column], titles[column], score) for column, score in row]
+                    for offset, row in enumerate(neighbours)
+                })
+            purge_on_commit(TAG)
+            _save(
+                settings.RELATED_INDEX_PATH,
+                matrix,
+                np.array([item_type for item_type, _ in keys], dtype=str),
+                np.array([item_id for _, item_id in keys], dtype=np.int64),
+                terms=words[kept],
+                idf=idf,
+                generation=np.array(uuid.uuid4().hex),
+            )
+            # The new build includes them; a new generation would skip them anyway.
+            directory = _additions_dir()
+            for name in os.listdir(directory) if os.path.isdir(directory) else []:
+                os.unlink(os.path.join(directory, name))
+    return items
+
+
+def add_items(item_type, item_ids):
+    """
+    Adds newly approved items to the index: gives them neighbours and puts
+    them in their neighbours' lists where they rank. Returns how many were
+    added; items already indexed, and every item before the first build,
+    are skipped. The new rows are saved as a file of their own next to the
+    build, so an addition costs the same however large the index is.
+    """
+    if not os.path.exists(settings.RELATED_INDEX_PATH):
+        return 0
+    with _locked():
+        index = _current()
+        if index is None:
+            return 0
+        model = ITEM_MODELS[item_type]
+        new = [
+            row for row in model.objects.filter(pk__in=list(item_ids), is_approved=True)
+            .order_by("pk").values_list("pk", "title", "content")
+            if (item_type, row[0]) not in index.indexed
+        ]
+        if not new:
+            return 0
+
+        counts = _count_matrix([_words(title, content) for _, title, content in new], index.columns)
+        vectors = _weigh(counts, index.idf)
+        first = len(index.keys)
+        new_keys = [(item_type, pk) for pk, _, _ in new]
+        neighbours = _neighbours(index.scores(vectors), first)
+
+        def key_of(column):
+            return index.keys[column] if column < first else new_keys[column - first]
+
+        # Titles of the neighbours, which also drops any deleted or unapproved since they were indexed.
+        wanted = {}
+        for row in neighbours:
+            for column, _ in row:
+                related_type, related_id = key_of(column)
+                wanted.setdefault(related_type, set()).add(related_id)
+        titles = {
+            (related_type, pk): title
+            for related_type, pks in wanted.items()
+            for pk, title in ITEM_MODELS[related_type].objects.filter(pk__in=pks, is_approved=True)
+            .values_list("pk", "title")
+        }
+
+        lists = {}
+        candidates = {}
+        for (pk, title, _), row in zip(new, neighbours):
+            own = lists[item_type, pk] = []
+            for column, score in row:
+                key = key_of(column)
+                if key in titles:
+                    own.append((*key, titles[key], score))
+                    candidates.setdefault(key, []).append((item_type, pk, title, score))
+
+        # Neighbours symmetric to the new items: keep their best RELATED_COUNT of old and new.
+        current = {}
+        of_candidates = Q(pk__in=[])  # An empty Q() would match every row.
+        for related_type in {related_type for related_type, _ in candidates}:
+            of_candidates |= Q(item_type=related_type,
+                               item_id__in=[pk for key_type, pk in candidates if key_type == related_type])
+        for row in RelatedItem.objects.filter(of_candidates).order_by("rank"):
+            current.setdefault((row.item_type, row.item_id), []).append(
+                (row.related_type, row.related_id, row.title, row.score)
+            )
+        for key, additions in candidates.items():
+            if key in lists:
+                continue  # A new item; its own list is already complete.
+            existing = current.get(key, [])
+            merged = sorted(existing + additions, key=lambda neighbour: -neighbour[3])[:settings.RELATED_COUNT]
+            if merged != existing:
+                lists[key] = merged
+
+        with transaction.atomic():
+            _replace_lists(lists)
+            purge_on_commit(*(f"{ITEM_MODELS[key_type]._meta.model_name}:{pk}" for key_type, pk in lists))
+            directory = _additions_dir()
+            os.makedirs(directory, exist_ok=True)
+            saved = [int(name.partition(".")[0]) for name in os.listdir(directory) if not name.startswith(".")]
+            name = f"{max(saved, default=0) + 1:08d}.npz"
+            _save(os.path.join(directory, name), vectors, np.array([item_type] * len(new), dtype=str),
+                  np.array([pk for pk, _, _ in new], dtype=np.int64), generation=np.array(index.generation))
+            index.add(name, vectors, new_keys)
+    return len(new)
@@ -0,0 +1,112 @@
+"""
+Read-replica routing.
+
+Replicas are listed in ``DATABASE_REPLICAS`` (built from
+``DATABASE_REPLICA_URLS``). Only reads made while serving a safe (``GET``
+/ ``HEAD``) request go to a replica; everything else, including
+management commands and the outbox worker, uses the primary.
+
+Replicas lag behind the primary, so clients read their own writes from
+the primary: a request that writes reads from the primary for the rest
+of the request, and :class:`ReplicaPinningMiddleware` sets a cookie that
+keeps the client on the primary for ``REPLICA_PIN_SECONDS`` afterwards.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = "db_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class _Routing:
+    """Where the current request reads from, and whether it has written."""
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+_routing = ContextVar("db_routing", default=None)
+
+
+class ReplicaRouter:
+    """Sends the reads of safe, unpinned requests to one replica per request."""
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None:
+            return None
+        if routing.wrote or routing.replica is None:
+            # Not the instance hint's database: it may be a replica.
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Chooses the database each request reads from. Safe requests read from
+    a random replica unless the client carries the pin cookie; requests
+    that write (or use an unsafe method) set it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = self.routing_for(request)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(request, response, routing)
+
+    async def __acall__(self, request):
+        routing = self.routing_for(request)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(request, response, routing)
+
+    def routing_for(self, request):
+        if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+            return _Routing(None)
+        return _Routing(random.choice(settings.DATABASE_REPLICAS))
+
+    def pin(self, request, response, routing):
+        if routing.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, "1", max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite="Lax")
+        return response
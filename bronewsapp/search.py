@@ -0,0 +1,158 @@
+"""
+Ranked full-text search over approved articles and newsletters.
+
+PostgreSQL uses a ``search_vector`` tsvector column on each content table
+(set by a trigger, so always current) behind a GIN index. SQLite uses a
+single FTS5 table, ``bronewsapp_search``, maintained by triggers, so
+development and tests exercise the same ranked search. Both are set up by
+migration ``0008_search_index``; on PostgreSQL, ``0015_search_backfill``
+fills in existing rows and builds the index.
+"""
+from django.db import connection
+
+from .models import Article, FeedEntry, Newsletter
+
+FTS_TABLE = "bronewsapp_search"
+
+# FTS5 rowids pack the item type into the low bit: id * 2 (+ 1 for newsletters).
+SQLITE_SOURCES = (
+    ("bronewsapp_article", FeedEntry.ItemType.ARTICLE, 0),
+    ("bronewsapp_newsletter", FeedEntry.ItemType.NEWSLETTER, 1),
+)
+ITEM_MODELS = {
+    FeedEntry.ItemType.ARTICLE: Article,
+    FeedEntry.ItemType.NEWSLETTER: Newsletter,
+}
+
+
+def sqlite_trigger_sql():
+    """
+    The triggers that keep the FTS5 table in step with the content tables.
+    ``IF NOT EXISTS`` makes them safe to re-apply after SQLite migrations
+    rebuild a content table (which drops its triggers).
+    """
+    statements = []
+    for table, _, parity in SQLITE_SOURCES:
+        statements += [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} WHEN NEW.is_approved
+            BEGIN
+                INSERT INTO {FTS_TABLE} (rowid, title, content)
+                VALUES (NEW.id * 2 + {parity}, NEW.title, coalesce(NEW.content, ''));
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE ON {table}
+            BEGIN
+                DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id * 2 + {parity};
+                INSERT INTO {FTS_TABLE} (rowid, title, content)
+                SELECT NEW.id * 2 + {parity}, NEW.title, coalesce(NEW.content, '') WHERE NEW.is_approved;
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id * 2 + {parity};
+            END
+            """,
+        ]
+    return statements
+
+
+def install_sqlite_triggers(using_connection=None):
+    """(Re)creates the FTS5 triggers if the search table exists."""
+    conn = using_connection or connection
+    if conn.vendor != "sqlite" or FTS_TABLE not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        for sql in sqlite_trigger_sql():
+            cursor.execute(sql)
+
+
+def _fts5_query(query):
+    """Quotes every term so user input cannot use FTS5 query syntax."""
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+
+def _search_sqlite(query, limit, offset):
+    # bm25() is lower-is-better; title matches weigh 10x body matches.
+    sql = f"""
+        SELECT rowid, -bm25({FTS_TABLE}, 10.0, 1.0) AS rank
+        FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+        ORDER BY rank DESC LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_fts5_query(query), limit, offset])
+        rows = cursor.fetchall()
+    return [
+        (FeedEntry.ItemType.NEWSLETTER if rowid % 2 else FeedEntry.ItemType.ARTICLE, rowid // 2, rank)
+        for rowid, rank in rows
+    ]
+
+
+def _search_postgresql(query, limit, offset):
+    sql = """
+        SELECT item_type, id, rank FROM (
+            SELECT 'A' AS item_type, id, ts_rank(search_vector, q) AS rank
+            FROM bronewsapp_article, websearch_to_tsquery('english', %s) q
+            WHERE is_approved AND search_vector @@ q
+            UNION ALL
+            SELECT 'N' AS item_type, id, ts_rank(search_vector, q) AS rank
+            FROM bronewsapp_newsletter, websearch_to_tsquery('english', %s) q
+            WHERE is_approved AND search_vector @@ q
+        ) hits
+        ORDER BY rank DESC, item_type, id DESC LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, query, limit, offset])
+        return cursor.fetchall()
+
+
+def _search_fallback(query, limit, offset):
+    """Unranked title/content match for databases without a search index."""
+    hits = []
+    for item_type, model in ITEM_MODELS.items():
+        matches = model.objects.filter(is_approved=True)
+        for term in query.split():
+            matches = matches.filter(title__icontains=term) | matches.filter(content__icontains=term)
+        hits += [(item_type, pk, 0.0) for pk in matches.order_by("-id").values_list("id", flat=True)[:offset + limit]]
+    return hits[offset:offset + limit]
+
+
+def search(query, limit=20, offset=0):
+    """
+    Returns ``(item_type, item_id, rank)`` tuples for approved articles and
+    newsletters matching ``query``, best match first.
+    """
+    if not query.strip():
+        return []
+    backend = {
+        "postgresql": _search_postgresql,
+        "sqlite": _search_sqlite,
+    }.get(connection.vendor, _search_fallback)
+    return backend(query, limit, offset)
+
+
+def load_results(hits):
+    """
+    Turns search hits into model instances (listing fields only), in rank
+    order, each annotated with ``item_type`` and ``search_rank``.
+    """
+    ids = {}
+    for item_type, item_id, _ in hits:
+        ids.setdefault(item_type, []).append(item_id)
+    loaded = {
+        item_type: ITEM_MODELS[item_type].objects
+        .select_related("author", "publisher")
+        .only("id", "title", "author__username", "publisher__name")
+        .in_bulk(item_ids)
+        for item_type, item_ids in ids.items()
+    }
+    results = []
+    for item_type, item_id, rank in hits:
+        item = loaded[item_type].get(item_id)
+        if item is not None:
+            item.item_type = FeedEntry.ItemType(item_type).label.lower()
+            item.search_rank = rank
+            results.append(item)
+    return results
@@ -0,0 +1,180 @@
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import feed, related, search, subscriptions
+from .caching import bump_publisher_version
+from .models import Article, Newsletter, Profile, Publisher, User
+from .pagecache import purge_on_commit
+
+
+def _subscription_changes(instance, action, reverse, pk_set):
+    """
+    Normalises an m2m_changed call into ``{reader_profile_id: [source_ids]}``,
+    whichever side of the relation it was made from.
+    """
+    if not reverse:
+        return {instance.pk: list(pk_set)}
+    return {reader_id: [instance.pk] for reader_id in pk_set}
+
+
+def _update_feeds(source, instance, action, reverse, pk_set):
+    if action == "post_clear":
+        # The removed ids are not reported for clear(), so recompute from scratch.
+        if not reverse:
+            feed.rebuild(instance.pk)
+        return
+    if action not in ("post_add", "post_remove") or not pk_set:
+        return
+    for reader_id, source_ids in _subscription_changes(instance, action, reverse, pk_set).items():
+        if action == "post_add":
+            feed.backfill(reader_id, source, source_ids)
+        else:
+            feed.prune(reader_id, source, source_ids)
+
+
+def _update_counts(source, instance, action, reverse, pk_set):
+    """
+    Keeps subscriber counts and cached subscription sets in step. Removals
+    are looked up before they happen: ``remove()`` reports every id it was
+    given, subscribed or not, and ``clear()`` reports none.
+    """
+    if action == "post_add" and pk_set:
+        changed = {(instance.pk, pk) if not reverse else (pk, instance.pk) for pk in pk_set}
+        subscriptions.adjust_counts(source, changed, +1)
+    elif action in ("pre_remove", "pre_clear"):
+        if action == "pre_clear":
+            reader_ids, source_ids = ([instance.pk], None) if not reverse else (None, [instance.pk])
+        else:
+            reader_ids, source_ids = ([instance.pk], pk_set) if not reverse else (pk_set, [instance.pk])
+        subscriptions.stash_removed(instance, source, subscriptions.existing(source, reader_ids, source_ids))
+        return
+    elif action in ("post_remove", "post_clear"):
+        changed = subscriptions.pop_removed(instance, source)
+        subscriptions.adjust_counts(source, changed, -1)
+    else:
+        return
+    subscriptions.forget({reader_id for reader_id, _ in changed})
+
+
+@receiver(m2m_changed, sender=Profile.sub_journalist.through)
+def journalist_subscriptions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Updates reader feeds, subscriber counts and subscription caches when journalist subscriptions change."""
+    _update_feeds(feed.JOURNALIST, instance, action, reverse, pk_set)
+    _update_counts(feed.JOURNALIST, instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Profile.sub_publisher.through)
+def publisher_subscriptions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Updates reader feeds, subscriber counts and subscription caches when publisher subscriptions change."""
+    _update_feeds(feed.PUBLISHER, instance, action, reverse, pk_set)
+    _update_counts(feed.PUBLISHER, instance, action, reverse, pk_set)
+
+
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=Newsletter)
+def remove_deleted_item(sender, instance, **kwargs):
+    """Takes a deleted item out of reader feeds and related-item lists."""
+    feed.remove_item(feed.item_type_for(instance), instance.pk)
+    related.forget(feed.item_type_for(instance), instance.pk)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=Newsletter)
+def update_related_items(sender, instance, created, **kwargs):
+    """Keeps titles in related-item lists current, and takes unapproved items out of them."""
+    if created:
+        return  # Not in any list yet.
+    if instance.is_approved:
+        related.retitle(feed.item_type_for(instance), instance.pk, instance.title)
+    else:
+        related.forget(feed.item_type_for(instance), instance.pk)
+
+
+def _bump_on_commit(publisher_ids):
+    """
+    Invalidates the cached fragments of publishers once the change commits,
+    so no fragment is rebuilt from (and cached with) the old rows meanwhile.
+    """
+    publisher_ids = set(publisher_ids) - {None}
+    if publisher_ids:
+        transaction.on_commit(lambda: [bump_publisher_version(pk) for pk in publisher_ids])
+
+
+@receiver(pre_save, sender=Article)
+@receiver(pre_save, sender=Newsletter)
+def remember_previous_publisher(sender, instance, **kwargs):
+    """Notes the publisher an existing item is moving away from, if any."""
+    if instance.pk:
+        instance._previous_publisher_id = (
+            sender.objects.filter(pk=instance.pk).values_list("publisher_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=Newsletter)
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=Newsletter)
+def invalidate_publisher_pages(sender, instance, **kwargs):
+    """
+    Any change to an item invalidates its publisher's (old and new) cached
+    pages, and purges its own page and the list of its kind.
+    """
+    previous = getattr(instance, "_previous_publisher_id", None)
+    _bump_on_commit({instance.publisher_id, previous})
+
+    name = sender._meta.model_name
+    purge_on_commit(f"{name}:{instance.pk}", f"{name}s",
+                    *(f"publisher:{pk}" for pk in {instance.publisher_id, previous} if pk is not None))
+
+
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+def invalidate_publisher(sender, instance, **kwargs):
+    _bump_on_commit({instance.pk})
+    purge_on_commit(f"publisher:{instance.pk}")
+
+
+@receiver(post_save, sender=User)
+def purge_journalist_pages(sender, instance, update_fields=None, **kwargs):
+    """Pages show their journalists' usernames; logging in changes nothing they show."""
+    if update_fields != frozenset({"last_login"}):
+        purge_on_commit(f"journalist:{instance.pk}")
+
+
+def _invalidate_publishers_showing(user_id):
+    """Invalidates the publisher pages that show a user, as their admin or as an item's author."""
+    publisher_ids = set(
+        Publisher.objects.filter(admin_id=user_id).values_list("pk", flat=True).union(
+            Article.objects.filter(author_id=user_id, publisher__isnull=False).values_list("publisher_id", flat=True),
+            Newsletter.objects.filter(author_id=user_id, publisher__isnull=False).values_list("publisher_id", flat=True),
+        )
+    )
+    _bump_on_commit(publisher_ids)
+    purge_on_commit(*(f"publisher:{pk}" for pk in publisher_ids))
+
+
+@receiver(post_init, sender=User)
+@receiver(post_init, sender=Profile)
+def remember_shown_fields(sender, instance, **kwargs):
+    """Remembers the username or role as loaded; deferred fields count as unknown."""
+    field = "username" if sender is User else "role"
+    instance._loaded_shown = instance.__dict__.get(field)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Profile)
+def invalidate_publishers_on_rename(sender, instance, created, **kwargs):
+    """
+    Publisher pages show their admin's and authors' usernames and roles.
+    Saves that change neither (every login saves both) leave them cached.
+    """
+    shown = instance.username if sender is User else instance.role
+    if not created and instance._loaded_shown != shown:
+        _invalidate_publishers_showing(instance.pk if sender is User else instance.user_id)
+    instance._loaded_shown = shown
+
+
+def reinstall_search_triggers(using, **kwargs):
+    """SQLite drops triggers when a migration rebuilds a table; put them back."""
+    search.install_sqlite_triggers(connections[using])
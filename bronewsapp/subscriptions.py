@@ -0,0 +1,271 @@
+"""
+Subscriber counts and cached subscription sets.
+
+``Publisher.subscriber_count`` and journalists' ``Profile.subscriber_count``
+are denormalized: the ``m2m_changed`` receivers in ``bronewsapp.signals``
+adjust them with ``F()`` updates as subscriptions are added and removed.
+``recount`` rebuilds them from the subscription tables.
+
+Each reader's subscribed journalist and publisher ids are cached as one
+:class:`Subscriptions` entry, so "am I subscribed?" is a set lookup. The
+entry is dropped once a change to the reader's subscriptions commits.
+
+:func:`subscribe` and :func:`unsubscribe` change subscriptions in one
+statement each (a conflict-ignoring ``INSERT`` and a ``DELETE`` on the
+through table) that returns the rows it changed, so repeating them is
+harmless and concurrent calls never double count. They send
+``m2m_changed`` for exactly those rows, so feeds, counts and caches follow
+as they do for ``add()`` and ``remove()``. :func:`import_pairs` is the
+batched ``INSERT`` for loading many readers' subscriptions.
+"""
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
+
+from . import trending
+from .approval import supports_returning
+from .caching import bump_publisher_version
+from .feed import JOURNALIST, PUBLISHER
+from .mailer import chunked
+from .models import Profile, Publisher, User
+from .pagecache import purge, purge_on_commit
+
+THROUGH = {
+    JOURNALIST: Profile.sub_journalist.through,
+    PUBLISHER: Profile.sub_publisher.through,
+}
+SOURCE_FIELD = {JOURNALIST: "user_id", PUBLISHER: "publisher_id"}
+SOURCE_MODEL = {JOURNALIST: User, PUBLISHER: Publisher}
+
+
+class Subscriptions(NamedTuple):
+    """The journalist (user) ids and publisher ids one reader subscribes to."""
+    journalists: frozenset
+    publishers: frozenset
+
+
+def _key(profile_id):
+    return f"subscriptions:{profile_id}"
+
+
+def _load(profile_id):
+    return Subscriptions(
+        frozenset(THROUGH[JOURNALIST].objects.filter(profile_id=profile_id).values_list("user_id", flat=True)),
+        frozenset(THROUGH[PUBLISHER].objects.filter(profile_id=profile_id).values_list("publisher_id", flat=True)),
+    )
+
+
+async def _aload(profile_id):
+    return Subscriptions(
+        frozenset([pk async for pk in THROUGH[JOURNALIST].objects
+                   .filter(profile_id=profile_id).values_list("user_id", flat=True)]),
+        frozenset([pk async for pk in THROUGH[PUBLISHER].objects
+                   .filter(profile_id=profile_id).values_list("publisher_id", flat=True)]),
+    )
+
+
+def subscriptions_of(profile_id):
+    """The reader's :class:`Subscriptions`, from the cache when possible."""
+    subscriptions = cache.get(_key(profile_id))
+    if subscriptions is None:
+        subscriptions = _load(profile_id)
+        cache.set(_key(profile_id), subscriptions, settings.SUBSCRIPTION_CACHE_TIMEOUT)
+    return subscriptions
+
+
+async def asubscriptions_of(profile_id):
+    """Async version of :func:`subscriptions_of`."""
+    subscriptions = await cache.aget(_key(profile_id))
+    if subscriptions is None:
+        subscriptions = await _aload(profile_id)
+        await cache.aset(_key(profile_id), subscriptions, settings.SUBSCRIPTION_CACHE_TIMEOUT)
+    return subscriptions
+
+
+def forget(profile_ids):
+    """Drops the cached sets of ``profile_ids`` once the current transaction commits."""
+    keys = [_key(pk) for pk in profile_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def existing(kind, profile_ids=None, source_ids=None):
+    """The ``(profile_id, source_id)`` subscriptions among the given readers and sources (default: all)."""
+    subscriptions = THROUGH[kind].objects.all()
+    if profile_ids is not None:
+        subscriptions = subscriptions.filter(profile_id__in=profile_ids)
+    if source_ids is not None:
+        subscriptions = subscriptions.filter(**{f"{SOURCE_FIELD[kind]}__in": source_ids})
+    return set(subscriptions.values_list("profile_id", SOURCE_FIELD[kind]))
+
+
+def valid_sources(kind, source_ids):
+    """The ids among ``source_ids`` that are journalists (for ``JOURNALIST``) or publishers."""
+    if kind == JOURNALIST:
+        sources = Profile.objects.filter(role=Profile.Role.JOURNALIST, user_id__in=source_ids).values_list("user_id", flat=True)
+    else:
+        sources = Publisher.objects.filter(pk__in=source_ids).values_list("pk", flat=True)
+    return set(sources)
+
+
+def stash_removed(instance, kind, pairs):
+    """
+    Records the ``(profile_id, source_id)`` subscriptions about to be
+    removed through ``instance``, for the ``post_remove``/``post_clear``
+    receiver to pick up with :func:`pop_removed`.
+    """
+    setattr(instance, f"_removed_{kind}_subscriptions", pairs)
+
+
+def pop_removed(instance, kind):
+    return instance.__dict__.pop(f"_removed_{kind}_subscriptions", set())
+
+
+def adjust_counts(kind, pairs, delta):
+    """
+    Adds ``delta`` to the subscriber count of the source of every
+    ``(profile_id, source_id)`` pair, one ``UPDATE`` per distinct change.
+    """
+    per_source = {}
+    for _, source_id in pairs:
+        per_source[source_id] = per_source.get(source_id, 0) + delta
+    by_change = {}
+    for source_id, change in per_source.items():
+        by_change.setdefault(change, []).append(source_id)
+
+    for change, source_ids in by_change.items():
+        if kind == JOURNALIST:
+            Profile.objects.filter(user_id__in=source_ids).update(subscriber_count=F("subscriber_count") + change)
+        else:
+            Publisher.objects.filter(pk__in=source_ids).update(subscriber_count=F("subscriber_count") + change)
+            # The count is part of the cached publisher page.
+            transaction.on_commit(lambda ids=source_ids: [bump_publisher_version(pk) for pk in ids])
+            purge_on_commit(*(f"publisher:{pk}" for pk in source_ids))
+
+
+def _count_of(kind, outer_field):
+    through = THROUGH[kind]
+    return Coalesce(
+        Subquery(
+            through.objects.filter(**{SOURCE_FIELD[kind]: OuterRef(outer_field)})
+            .values(SOURCE_FIELD[kind]).annotate(n=Count("*")).values("n")
+        ),
+        Value(0),
+    )
+
+
+def recount():
+    """Recomputes every subscriber count from the subscription tables."""
+    Profile.objects.update(subscriber_count=_count_of(JOURNALIST, "user_id"))
+    Publisher.objects.update(subscriber_count=_count_of(PUBLISHER, "pk"))
+    publisher_ids = list(Publisher.objects.values_list("pk", flat=True))
+    for publisher_id in publisher_ids:
+        bump_publisher_version(publisher_id)
+    purge(*(f"publisher:{pk}" for pk in publisher_ids))
+
+
+def _columns(kind):
+    through = THROUGH[kind]
+    quote = connection.ops.quote_name
+    return (quote(through._meta.db_table), quote(through._meta.get_field("profile").column),
+            quote(through._meta.get_field(SOURCE_FIELD[kind].removesuffix("_id")).column))
+
+
+def _insert(kind, pairs):
+    """Inserts the ``(profile_id, source_id)`` pairs that do not exist yet; returns those it inserted."""
+    if supports_returning():
+        table, profile_column, source_column = _columns(kind)
+        sql = (
+            f"INSERT INTO {table} ({profile_column}, {source_column}) "
+            f"VALUES {', '.join(['(%s, %s)'] * len(pairs))} "
+            f"ON CONFLICT DO NOTHING RETURNING {profile_column}, {source_column}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for pair in pairs for value in pair])
+            return set(cursor.fetchall())
+
+    # Without RETURNING, report the pairs that were missing beforehand.
+    through = THROUGH[kind]
+    before = existing(kind, {pid for pid, _ in pairs}, {sid for _, sid in pairs})
+    through.objects.bulk_create(
+        [through(**{"profile_id": pid, SOURCE_FIELD[kind]: sid}) for pid, sid in pairs],
+        ignore_conflicts=True,
+    )
+    return set(pairs) - before
+
+
+def _delete(kind, profile_id, source_ids):
+    """Deletes ``profile_id``'s subscriptions to ``source_ids``; returns the ``(profile_id, source_id)`` pairs deleted."""
+    if supports_returning():
+        table, profile_column, source_column = _columns(kind)
+        sql = (
+            f"DELETE FROM {table} WHERE {profile_column} = %s "
+            f"AND {source_column} IN ({', '.join(['%s'] * len(source_ids))}) "
+            f"RETURNING {profile_column}, {source_column}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [profile_id, *source_ids])
+            return set(cursor.fetchall())
+
+    # Without RETURNING, lock the rows first so the pairs we report are the rows we delete.
+    rows = list(THROUGH[kind].objects.select_for_update().filter(
+        profile_id=profile_id, **{f"{SOURCE_FIELD[kind]}__in": source_ids}
+    ).values_list("pk", SOURCE_FIELD[kind]))
+    THROUGH[kind].objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+    return {(profile_id, source_id) for _, source_id in rows}
+
+
+def _send(kind, action, pairs):
+    """Sends ``m2m_changed`` for ``pairs`` from each reader's side, as ``add()``/``remove()`` would."""
+    per_reader = {}
+    for profile_id, source_id in pairs:
+        per_reader.setdefault(profile_id, set()).add(source_id)
+    for profile_id, source_ids in per_reader.items():
+        profile = Profile(pk=profile_id)
+        if action == "post_remove":
+            stash_removed(profile, kind, {(profile_id, source_id) for source_id in source_ids})
+        m2m_changed.send(
+            sender=THROUGH[kind], instance=profile, action=action, reverse=False,
+            model=SOURCE_MODEL[kind], pk_set=source_ids, using=connection.alias,
+        )
+
+
+def import_pairs(kind, pairs, batch_size=None):
+    """
+    Subscribes every ``(profile_id, source_id)`` pair, one ``INSERT`` per
+    batch of ``SUBSCRIPTION_IMPORT_BATCH_SIZE``. Existing subscriptions
+    are skipped. Returns the pairs that were new. The sources must exist.
+    """
+    added = set()
+    for batch in chunked(dict.fromkeys(pairs), batch_size or settings.SUBSCRIPTION_IMPORT_BATCH_SIZE):
+        with transaction.atomic():
+            inserted = _insert(kind, batch)
+            _send(kind, "post_add", inserted)
+        added |= inserted
+    return added
+
+
+def subscribe(kind, profile_id, source_ids):
+    """
+    Subscribes a reader to ``source_ids``; returns the ids they were not
+    already subscribed to. Unlike imports, these count towards trending.
+    """
+    added = {source_id for _, source_id in import_pairs(kind, [(profile_id, pk) for pk in source_ids])}
+    trending.record_subscriptions(kind, added)
+    return added
+
+
+def unsubscribe(kind, profile_id, source_ids):
+    """Unsubscribes a reader from ``source_ids`` in one ``DELETE``; returns the ids they were subscribed to."""
+    source_ids = list(source_ids)
+    if not source_ids:
+        return set()
+    with transaction.atomic():
+        deleted = _delete(kind, profile_id, source_ids)
+        _send(kind, "post_remove", deleted)
+    return {source_id for _, source_id in deleted}
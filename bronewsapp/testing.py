@@ -0,0 +1,51 @@
+"""
+Test helpers: the test runner, and keeping views within their query budgets.
+"""
+from contextlib import contextmanager
+
+from django.test.runner import DiscoverRunner
+
+from . import viewcounts
+from .profiling import QueryRecorder
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Keeps view counts out of the way of tests: no background thread writes
+    them while tests run, and the views still buffered when the run ends are
+    dropped rather than written to the real database at exit. Tests that
+    flush views call ``viewcounts.flush()`` themselves.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        viewcounts._flusher.stop()
+
+    def teardown_test_environment(self, **kwargs):
+        viewcounts.discard()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Adds :meth:`assertQueryBudget` to a ``TestCase``/``APITestCase``.
+
+    Unlike ``assertNumQueries`` it allows any count up to the budget, and
+    it separately fails on query shapes repeated ``max_repeats`` times or
+    more, which is how an N+1 shows up as soon as a test has a few rows.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_repeats=3):
+        with QueryRecorder() as recorder:
+            yield recorder
+        if recorder.count > max_queries:
+            self.fail(
+                f"{recorder.count} queries executed, budget is {max_queries}:\n"
+                + "\n".join(f"{i}. {sql}" for i, sql in enumerate(recorder.queries, 1))
+            )
+        repeated = recorder.duplicates(max_repeats)
+        if repeated:
+            self.fail("Probable N+1 queries:\n" + "\n".join(
+                f"{times} x {shape}" for shape, times in repeated.items()
+            ))
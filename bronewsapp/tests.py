@@ -1,3 +1,1491 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db.models import Count
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from api.models import ApiToken
+
+from . import feed, metrics, related, search, trending, viewcounts
+from .approval import approve
+from .caching import publisher_version
+from .profiling import fingerprint
+from .routers import PIN_COOKIE, ReplicaPinningMiddleware, _routing
+from .subscriptions import THROUGH, import_pairs, recount, subscribe, subscriptions_of, unsubscribe
+from .mailer import send_to_subscribers
+from .models import (
+    EXCERPT_LENGTH, Article, FeedEntry, Newsletter, OutboxMessage, Profile, Publisher, TrendingArticle,
+    TrendingLandmark, ViewCount,
+)
+from .outbox import process_batch, enqueue
+from .pagecache import SURROGATE_KEY_HEADER, surrogate_keys_purged
+from .testing import QueryBudgetMixin
+from .tweety import RateLimited, build_poster
+from .viewcounts import ViewBuffer, flush, views_of
+
+User = get_user_model()
+
+
+def make_readers(count, subscribed_to):
+    """
+    Bulk creates readers subscribed to a journalist, bypassing the
+    per-user profile signal and password hashing.
+    """
+    users = User.objects.bulk_create(
+        User(username=f'bulk{i}', email=f'bulk{i}@example.com') for i in range(count)
+    )
+    profiles = Profile.objects.bulk_create(Profile(user=user) for user in users)
+    Profile.sub_journalist.through.objects.bulk_create(
+        Profile.sub_journalist.through(profile_id=profile.pk, user_id=subscribed_to.pk)
+        for profile in profiles
+    )
+    return profiles
+
+
+def make_user(username, role, email=""):
+    """Creates a user and sets the role on the profile created by the signal."""
+    user = User.objects.create_user(username=username, password='pwd', email=email)
+    user.profile.role = role
+    user.profile.save()
+    return user
+
+
+def use_temporary_related_index(test):
+    """Points RELATED_INDEX_PATH into a directory removed after the test; returns the directory."""
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    settings_override = override_settings(RELATED_INDEX_PATH=os.path.join(tmp.name, 'related.npz'))
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    return tmp.name
+
+
+class ApprovalOutboxTest(TestCase):
+
+    """Tests for queuing and delivering approval notifications."""
+
+    def setUp(self):
+        # Approvals queue related-item additions; keep them out of a real index.
+        use_temporary_related_index(self)
+        self.editor = make_user('editor', Profile.Role.EDITOR)
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.reader = make_user('reader', Profile.Role.READER, email='reader@example.com')
+        self.reader.profile.sub_journalist.add(self.journalist)
+
+        pub = Publisher.objects.create(name='Simple Pub', admin=self.editor)
+        self.article = Article.objects.create(
+            title='Pending Article', content='Ok.', author=self.journalist, publisher=pub
+        )
+        self.url = reverse('article_approve', kwargs={'pk': self.article.pk})
+
+    @mock.patch('bronewsapp.outbox.post_tweet')
+    def test_approval_queues_notifications_without_sending(self, post_tweet):
+        """Approving only writes outbox rows; nothing is delivered inline."""
+        self.client.force_login(self.editor)
+        response = self.client.post(self.url)
+
+        self.assertRedirects(response, reverse('article_detail', kwargs={'pk': self.article.pk}))
+        self.article.refresh_from_db()
+        self.assertTrue(self.article.is_approved)
+        self.assertEqual(
+            sorted(OutboxMessage.objects.values_list('kind', flat=True)),
+            [OutboxMessage.Kind.EMAIL, OutboxMessage.Kind.FEED, OutboxMessage.Kind.RELATED, OutboxMessage.Kind.TWEET],
+        )
+        self.assertEqual(len(mail.outbox), 0)
+        post_tweet.assert_not_called()
+
+    @mock.patch('bronewsapp.outbox.post_tweet')
+    def test_worker_delivers_queued_messages(self, post_tweet):
+        """The worker sends the email and tweet and marks both rows done."""
+        self.client.force_login(self.editor)
+        self.client.post(self.url)
+
+        self.assertEqual(process_batch(), 4)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('reader@example.com', mail.outbox[0].recipients())
+        post_tweet.assert_called_once_with("Check out: Pending Article - Written by journalist", key=mock.ANY)
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.Status.DONE).exists())
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BASE_DELAY=60)
+    @mock.patch('bronewsapp.outbox.post_tweet', side_effect=RuntimeError("twitter down"))
+    def test_failed_tweet_is_retried_with_backoff(self, post_tweet):
+        """A failing tweet is rescheduled, then marked failed; the approval stands."""
+        self.client.force_login(self.editor)
+        self.client.post(self.url)
+        process_batch()
+
+        tweet = OutboxMessage.objects.get(kind=OutboxMessage.Kind.TWEET)
+        self.assertEqual(tweet.status, OutboxMessage.Status.PENDING)
+        self.assertEqual(tweet.attempts, 1)
+        self.assertIn("twitter down", tweet.last_error)
+        self.assertGreater(tweet.available_at, timezone.now() + timedelta(seconds=30))
+
+        # Not due yet, so the next batch leaves it alone.
+        self.assertEqual(process_batch(), 0)
+
+        OutboxMessage.objects.filter(pk=tweet.pk).update(available_at=timezone.now())
+        process_batch()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.status, OutboxMessage.Status.FAILED)
+        self.assertEqual(tweet.attempts, 2)
+
+        self.article.refresh_from_db()
+        self.assertTrue(self.article.is_approved)
+
+
+@override_settings(SUBSCRIBER_EMAIL_MESSAGES_PER_SEND=2)
+class SubscriberMailerTest(TestCase):
+
+    """Tests for chunked subscriber email delivery."""
+
+    def setUp(self):
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.profiles = make_readers(25, subscribed_to=self.journalist)
+        # A subscriber without an address is skipped.
+        make_user('no_email', Profile.Role.READER).profile.sub_journalist.add(self.journalist)
+
+    def test_recipients_are_streamed_in_one_query_and_chunked(self):
+        """25 recipients in chunks of 10 make 3 BCC messages from a single query."""
+        with self.assertNumQueries(1):
+            sent = send_to_subscribers(self.journalist.pk, "Subject", "Body", chunk_size=10)
+
+        self.assertEqual(sent, 25)
+        self.assertEqual([len(m.bcc) for m in mail.outbox], [10, 10, 5])
+        self.assertEqual(mail.outbox[0].to, [])
+        self.assertEqual(len({addr for m in mail.outbox for addr in m.recipients()}), 25)
+
+    def test_progress_allows_resuming(self):
+        """Progress reports the last profile delivered; resuming skips those already sent."""
+        progress = []
+        send_to_subscribers(self.journalist.pk, "Subject", "Body", chunk_size=10, on_progress=progress.append)
+        self.assertEqual(progress, [self.profiles[19].pk, self.profiles[24].pk])
+
+        mail.outbox.clear()
+        sent = send_to_subscribers(self.journalist.pk, "Subject", "Body", chunk_size=10, after_id=progress[0])
+        self.assertEqual(sent, 5)
+
+
+class FakeTwitterHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the ``POST /2/tweets`` endpoint.
+
+    Responses are taken from ``server.responses`` (status, headers) and
+    default to 201 Created once the list is empty.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.received.append((self.path, body["text"]))
+        status, headers = self.server.responses.pop(0) if self.server.responses else (201, {})
+        payload = json.dumps({"data": {"id": str(len(self.server.received)), "text": body["text"]}})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TwitterPosterTest(TestCase):
+
+    """Tests for the rate limited Twitter client against a local fake API."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTwitterHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.host = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.received = []
+        self.server.responses = []
+        settings_override = override_settings(
+            TWITTER_API_HOST=self.host, TWITTER_RATE_LIMIT_POSTS=2, TWITTER_RATE_LIMIT_WINDOW=60
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.poster = build_poster()
+
+    def test_posts_through_one_client(self):
+        """Posts reach the API over the poster's long-lived session."""
+        self.poster.post("first")
+        self.poster.post("second")
+        self.assertEqual(self.server.received, [("/2/tweets", "first"), ("/2/tweets", "second")])
+        self.assertEqual(metrics.get("twitter.posted"), 2)
+
+    def test_token_bucket_defers_instead_of_calling_api(self):
+        """Once the allowance is spent, posts are deferred locally."""
+        self.poster.post("one")
+        self.poster.post("two")
+        with self.assertRaises(RateLimited) as ctx:
+            self.poster.post("three")
+        self.assertAlmostEqual(ctx.exception.retry_after, 30, delta=1)
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(metrics.get("twitter.throttled"), 1)
+
+    def test_rate_limit_response_blocks_until_reset(self):
+        """A 429 blocks the bucket until the reset time the API reported."""
+        reset_at = int(time.time()) + 120
+        self.server.responses = [(429, {"x-rate-limit-reset": str(reset_at)})]
+        with self.assertRaises(RateLimited) as ctx:
+            self.poster.post("limited")
+        self.assertAlmostEqual(ctx.exception.retry_after, 120, delta=2)
+
+        with self.assertRaises(RateLimited):
+            self.poster.post("still limited")
+        self.assertEqual(len(self.server.received), 1)
+        self.assertEqual(metrics.get("twitter.rate_limit_responses"), 1)
+
+    def test_retried_message_is_coalesced(self):
+        """Re-posting under a key this process already tweeted does not tweet again."""
+        first = self.poster.post("same", key=1)
+        self.assertEqual(self.poster.post("same", key=1), first)
+        self.assertEqual(len(self.server.received), 1)
+
+    def test_same_text_from_different_messages_is_posted(self):
+        """Two messages that happen to announce the same text both tweet."""
+        self.poster.post("same", key=1)
+        self.poster.post("same", key=2)
+        self.assertEqual(self.server.received, [("/2/tweets", "same"), ("/2/tweets", "same")])
+
+    def test_outbox_delays_rate_limited_tweets(self):
+        """The outbox reschedules a throttled tweet without spending an attempt."""
+        self.poster.post("one")
+        self.poster.post("two")
+        message = enqueue(OutboxMessage.Kind.TWEET, {"text": "three"})
+
+        with mock.patch('bronewsapp.tweety.get_poster', return_value=self.poster):
+            process_batch()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.Status.PENDING)
+        self.assertEqual(message.attempts, 0)
+        self.assertGreater(message.available_at, timezone.now() + timedelta(seconds=20))
+
+
+class ReaderFeedTest(TestCase):
+
+    """Tests for materialized reader feeds."""
+
+    def setUp(self):
+        cache.clear()
+        use_temporary_related_index(self)
+        self.editor = make_user('editor', Profile.Role.EDITOR)
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.reader = make_user('reader', Profile.Role.READER)
+        self.publisher = Publisher.objects.create(name='Simple Pub', admin=self.editor)
+
+    def approve(self, model, **fields):
+        """Approves a new item through the editor views and runs the worker."""
+        item = model.objects.create(content='.', author=self.journalist, **fields)
+        name = 'article_approve' if model is Article else 'newsletter_approve'
+        self.client.force_login(self.editor)
+        self.client.post(reverse(name, kwargs={'pk': item.pk}))
+        with mock.patch('bronewsapp.outbox.post_tweet'):
+            process_batch()
+        return item
+
+    def feed_ids(self, reader=None):
+        return [(item_type, item_id) for _, item_type, item_id in feed.read_feed((reader or self.reader).profile, 50)]
+
+    def test_approval_fans_out_to_journalist_and_publisher_subscribers(self):
+        """Approved items reach readers of the author and of the publisher."""
+        pub_reader = make_user('pub_reader', Profile.Role.READER)
+        self.reader.profile.sub_journalist.add(self.journalist)
+        pub_reader.profile.sub_publisher.add(self.publisher)
+
+        article = self.approve(Article, title='Article', publisher=self.publisher)
+        newsletter = self.approve(Newsletter, title='Newsletter')
+
+        self.assertEqual(self.feed_ids(), [('N', newsletter.pk), ('A', article.pk)])
+        self.assertEqual(self.feed_ids(pub_reader), [('A', article.pk)])
+
+    def test_subscribe_backfills_and_unsubscribe_prunes(self):
+        """Subscribing adds existing items; unsubscribing removes those not still followed."""
+        via_publisher = self.approve(Article, title='Published', publisher=self.publisher)
+        direct = self.approve(Article, title='Direct')
+
+        self.reader.profile.sub_journalist.add(self.journalist)
+        self.reader.profile.sub_publisher.add(self.publisher)
+        self.assertEqual(self.feed_ids(), [('A', direct.pk), ('A', via_publisher.pk)])
+
+        self.reader.profile.sub_journalist.remove(self.journalist)
+        self.assertEqual(self.feed_ids(), [('A', via_publisher.pk)])
+
+        self.reader.profile.sub_publisher.clear()
+        self.assertEqual(self.feed_ids(), [])
+
+    @override_settings(FEED_FANOUT_THRESHOLD=0)
+    def test_popular_sources_are_read_live(self):
+        """Sources over the threshold are not fanned out but still show up in feeds."""
+        self.reader.profile.sub_journalist.add(self.journalist)
+        article = self.approve(Article, title='Celebrity news')
+
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed_ids(), [('A', article.pk)])
+
+    def test_deleted_items_leave_feeds(self):
+        """Deleting an item removes it from every feed."""
+        self.reader.profile.sub_journalist.add(self.journalist)
+        article = self.approve(Article, title='Short lived')
+        article.delete()
+        self.assertFalse(FeedEntry.objects.exists())
+
+
+class ExplainHotQueriesTest(TestCase):
+
+    """Tests for the index EXPLAIN benchmark command."""
+
+    def test_captures_plans_and_keeps_indexes(self):
+        """Plans are captured without and with the indexes; the indexes survive the run."""
+        call_command('explain_hot_queries', seed=200, stdout=StringIO())
+
+        output = StringIO()
+        call_command('explain_hot_queries', stdout=output)
+        self.assertIn('pending approval queue', output.getvalue())
+        self.assertIn('article_pending_idx', output.getvalue())
+        self.assertEqual(Article.objects.count(), 200)
+
+
+class SearchTest(TestCase):
+
+    """Tests for full-text search over approved content."""
+
+    def setUp(self):
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.article = Article.objects.create(
+            title='Election results', content='Turnout was high.', author=self.journalist, is_approved=True
+        )
+        self.newsletter = Newsletter.objects.create(
+            title='Weekly digest', content='All about the election campaign.', author=self.journalist,
+            is_approved=True
+        )
+        self.pending = Article.objects.create(
+            title='Election rumours', content='Not yet approved.', author=self.journalist
+        )
+
+    def hits(self, query):
+        return [(item_type, item_id) for item_type, item_id, _ in search.search(query)]
+
+    def test_ranks_both_types_and_skips_unapproved(self):
+        """Title matches outrank body matches; pending items are not searchable."""
+        self.assertEqual(self.hits('election'), [('A', self.article.pk), ('N', self.newsletter.pk)])
+
+    def test_index_follows_saves(self):
+        """Approving, editing and deleting keep the index current."""
+        self.pending.is_approved = True
+        self.pending.save()
+        self.assertIn(('A', self.pending.pk), self.hits('rumours'))
+
+        self.article.title = 'Vote count'
+        self.article.save()
+        self.assertEqual(self.hits('results'), [])
+        self.assertEqual(self.hits('vote'), [('A', self.article.pk)])
+
+        self.newsletter.delete()
+        self.assertEqual(self.hits('digest'), [])
+
+    def test_query_syntax_is_escaped(self):
+        """Operators and quotes in user input are treated as plain text."""
+        self.assertEqual(self.hits('"election" OR NEAR('), [])
+        self.assertEqual(self.hits('   '), [])
+
+    def test_search_page_and_api(self):
+        """The HTML page and the API both return ranked results."""
+        response = self.client.get(reverse('search'), {'q': 'election'})
+        self.assertContains(response, 'Election results')
+        self.assertContains(response, 'Weekly digest')
+        self.assertNotContains(response, 'Election rumours')
+
+        response = self.client.get(reverse('api_search'), {'q': 'digest'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(r['type'], r['id']) for r in response.json()['results']],
+                         [('newsletter', self.newsletter.pk)])
+
+
+class PublisherPageCacheTest(TestCase):
+
+    """Tests for the versioned fragment cache behind publisher pages."""
+
+    def setUp(self):
+        cache.clear()
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.reader = make_user('reader', Profile.Role.READER)
+        self.publisher = Publisher.objects.create(name='Daily', content='News daily.', admin=self.journalist)
+        self.article = Article.objects.create(
+            title='First story', content='Body.', author=self.journalist, publisher=self.publisher
+        )
+        self.url = reverse('publisher_detail', args=[self.publisher.pk])
+
+    def test_second_view_only_loads_the_user(self):
+        """With the page and the reader's subscriptions cached, only the session and user are queried."""
+        self.client.login(username='reader', password='pwd')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.profile.sub_publisher.add(self.publisher)
+        self.assertContains(self.client.get(self.url), 'First story')
+
+        with self.assertNumQueries(2):  # session, user with profile
+            response = self.client.get(self.url)
+        self.assertContains(response, 'First story')
+        self.assertContains(response, 'Unsubscribe from Publisher')
+        self.assertEqual(metrics.get('cache.publisher_detail.hits'), 1)
+        self.assertEqual(metrics.get('cache.publisher_detail.misses'), 1)
+
+    def test_writes_invalidate_the_listing(self):
+        """Saving, approving, adding and deleting items show up on the next view."""
+        self.client.get(self.url)
+
+        self.article.title = 'Edited story'
+        self.article.is_approved = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.save()
+        self.assertContains(self.client.get(self.url), 'Edited story')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Newsletter.objects.create(title='Weekly', content='Body.', author=self.journalist, publisher=self.publisher)
+        self.assertContains(self.client.get(self.url), 'Weekly')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.delete()
+        self.assertNotContains(self.client.get(self.url), 'Edited story')
+        self.assertEqual(metrics.get('cache.publisher_detail.hits'), 0)
+
+    def test_listing_is_invalidated_on_commit(self):
+        """A view rendered before the write commits must not stay cached under the new version."""
+        version = publisher_version(self.publisher.pk)
+        self.article.title = 'Edited story'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.save()
+            self.assertEqual(publisher_version(self.publisher.pk), version)
+        self.assertNotEqual(publisher_version(self.publisher.pk), version)
+
+    def test_moving_an_item_invalidates_both_publishers(self):
+        other = Publisher.objects.create(name='Weekly Times', admin=self.journalist)
+        self.client.get(self.url)
+        self.article.publisher = other
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.save()
+        self.assertNotContains(self.client.get(self.url), 'First story')
+
+    def test_renames_and_role_changes_invalidate_the_listing(self):
+        """Publisher pages show their authors' usernames and roles, and the admin's name."""
+        self.client.get(self.url)
+        self.journalist.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.journalist.save()
+        self.assertContains(self.client.get(self.url), 'Admin: renamed')
+
+        profile = Profile.objects.get(user=self.journalist)
+        profile.role = Profile.Role.READER
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertNotContains(self.client.get(self.url), reverse('journalist_detail', args=[self.journalist.pk]))
+
+    def test_logging_in_keeps_the_listing(self):
+        self.client.get(self.url)
+        self.client.login(username='journalist', password='pwd')
+        self.client.get(self.url)
+        self.assertEqual(metrics.get('cache.publisher_detail.hits'), 1)
+
+    def test_unknown_publisher_is_404(self):
+        self.assertEqual(self.client.get(reverse('publisher_detail', args=[999])).status_code, 404)
+
+
+class ConditionalGetTest(TestCase):
+
+    """Tests for ETag / Last-Modified on the article and newsletter pages."""
+
+    def setUp(self):
+        cache.clear()
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        self.article = Article.objects.create(
+            title='Story', content='Body.', author=self.journalist, publisher=self.publisher
+        )
+        self.newsletter = Newsletter.objects.create(title='Weekly', content='Body.', author=self.journalist)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in (reverse('article_detail', args=[self.article.pk]),
+                    reverse('newsletter_detail', args=[self.newsletter.pk])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(0):  # answered from the anonymous page cache
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_item_and_publisher_changes_are_modified(self):
+        url = reverse('article_detail', args=[self.article.pk])
+        etag = self.client.get(url)['ETag']
+
+        self.article.is_approved = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        self.publisher.name = 'Daily Times'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.publisher.save()
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'Daily Times')
+
+    def test_viewer_is_part_of_the_etag(self):
+        url = reverse('article_detail', args=[self.article.pk])
+        etag = self.client.get(url)['ETag']
+        self.client.login(username='journalist', password='pwd')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_missing_item_is_404(self):
+        self.assertEqual(self.client.get(reverse('article_detail', args=[999])).status_code, 404)
+
+
+class ApprovalTest(TestCase):
+
+    """Tests for single-statement and bulk approval."""
+
+    def setUp(self):
+        cache.clear()
+        use_temporary_related_index(self)
+        self.editor = make_user('editor', Profile.Role.EDITOR)
+        self.alice = make_user('alice', Profile.Role.JOURNALIST)
+        self.bob = make_user('bob', Profile.Role.JOURNALIST)
+        self.reader = make_user('reader', Profile.Role.READER, email='reader@example.com')
+        self.reader.profile.sub_journalist.add(self.alice, self.bob)
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.editor)
+        self.articles = [
+            Article.objects.create(title=title, content='Body.', author=author, publisher=self.publisher)
+            for title, author in (('alice one', self.alice), ('alice two', self.alice), ('bob one', self.bob))
+        ]
+
+    def kinds(self):
+        return sorted(OutboxMessage.objects.values_list('kind', flat=True))
+
+    def test_second_approval_is_a_no_op(self):
+        """Only the call that flips is_approved queues notifications."""
+        article = self.articles[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            approved = approve(Article, [article.pk])
+        self.assertEqual([a.pk for a in approved], [article.pk])
+        self.assertEqual(approve(Article, [article.pk]), [])
+        self.assertEqual(self.kinds(), [
+            OutboxMessage.Kind.EMAIL, OutboxMessage.Kind.FEED, OutboxMessage.Kind.RELATED, OutboxMessage.Kind.TWEET,
+        ])
+
+        article.refresh_from_db()
+        self.assertTrue(article.is_approved)
+        self.assertIsNotNone(article.approved_at)
+        self.assertEqual(article.updated_at, article.approved_at)
+        self.assertEqual(search.search('alice'), [('A', article.pk, mock.ANY)])
+
+    def test_bulk_approval_batches_notifications_per_journalist(self):
+        approve(Article, [self.articles[2].pk])
+        OutboxMessage.objects.all().delete()
+
+        with self.assertNumQueries(7):  # savepoint, update, usernames, 3 outbox inserts, release
+            approved = approve(Article, [a.pk for a in self.articles] + [999])
+        self.assertEqual([a.pk for a in approved], [self.articles[0].pk, self.articles[1].pk])
+        self.assertEqual(self.kinds(), [
+            OutboxMessage.Kind.EMAIL, OutboxMessage.Kind.FEED, OutboxMessage.Kind.RELATED, OutboxMessage.Kind.TWEET,
+        ])
+        tweet = OutboxMessage.objects.get(kind=OutboxMessage.Kind.TWEET)
+        self.assertEqual(tweet.payload['text'], '2 new articles by alice: alice one; alice two')
+
+        with mock.patch('bronewsapp.outbox.post_tweet'):
+            process_batch()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(FeedEntry.objects.filter(reader=self.reader.profile).count(), 2)
+
+    def test_approval_invalidates_publisher_page(self):
+        url = reverse('publisher_detail', args=[self.publisher.pk])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            approve(Article, [self.articles[0].pk])
+        self.client.get(url)
+        self.assertEqual(metrics.get('cache.publisher_detail.misses'), 2)
+
+    def test_bulk_approve_view(self):
+        self.client.force_login(self.editor)
+        self.assertContains(self.client.get(reverse('editor_dashboard')), 'alice two')
+
+        response = self.client.post(reverse('bulk_approve'), {
+            'kind': 'article', 'ids': [a.pk for a in self.articles],
+        }, follow=True)
+        self.assertEqual([str(m) for m in response.context['messages']], ['Approved 3 articles.'])
+        self.assertFalse(Article.objects.filter(is_approved=False).exists())
+
+        self.client.force_login(self.reader)
+        self.client.post(reverse('bulk_approve'), {'kind': 'newsletter', 'ids': ['1']})
+        self.assertEqual(self.kinds().count(OutboxMessage.Kind.FEED), 1)
+
+
+class QueryProfileTest(QueryBudgetMixin, TestCase):
+
+    """Tests for per-request query profiling and query budgets."""
+
+    def setUp(self):
+        cache.clear()
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        for i in range(5):
+            Article.objects.create(title=f'Story {i}', content='Body.', author=self.journalist, publisher=publisher)
+            Newsletter.objects.create(title=f'Issue {i}', content='Body.', author=self.journalist, publisher=publisher)
+
+    def test_list_views_stay_within_budget(self):
+        """Authors and publishers are joined, not loaded per row."""
+        for name in ('article_list', 'newsletter_list'):
+            with self.assertQueryBudget(1):
+                self.client.get(reverse(name))
+
+    def test_budget_flags_repeated_query_shapes(self):
+        with self.assertRaisesMessage(AssertionError, 'Probable N+1'):
+            with self.assertQueryBudget(100):
+                for article in Article.objects.all():
+                    article.author.username
+
+    @override_settings(QUERY_PROFILE=True, QUERY_PROFILE_HEADER=True)
+    def test_middleware_reports_per_view(self):
+        with self.assertLogs('bronewsapp.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('article_list'))
+        self.assertRegex(response['X-Query-Profile'], r'^queries=1; db_ms=[\d.]+; wall_ms=[\d.]+; n_plus_one=0$')
+        self.assertIn('[article_list]', logs.output[0])
+        self.assertEqual(metrics.get('view.article_list.requests'), 1)
+        self.assertEqual(metrics.get('view.article_list.queries'), 1)
+
+    def test_fingerprint_collapses_in_lists(self):
+        self.assertEqual(fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'), fingerprint('SELECT 1 WHERE id IN (%s)'))
+
+
+class SeedDataTest(TestCase):
+
+    """Tests for the synthetic data seeder."""
+
+    def test_seeds_requested_volumes_without_the_profile_signal(self):
+        with mock.patch('accounts.signals.Profile.objects.create') as signal_create:
+            call_command('seed_data', readers=200, journalists=10, editors=2, publishers=3,
+                         articles=50, newsletters=20, stdout=StringIO())
+        signal_create.assert_not_called()
+
+        self.assertEqual(Profile.objects.filter(role=Profile.Role.READER).count(), 200)
+        self.assertEqual(Profile.objects.filter(role=Profile.Role.JOURNALIST).count(), 10)
+        self.assertEqual(Profile.objects.filter(role=Profile.Role.EDITOR).count(), 2)
+        self.assertEqual(Profile.objects.count(), User.objects.count())
+        self.assertEqual(Publisher.objects.count(), 3)
+        self.assertEqual(Article.objects.count(), 50)
+        self.assertEqual(Newsletter.objects.count(), 20)
+        editor = User.objects.filter(profile__role=Profile.Role.EDITOR).first()
+        self.assertTrue(self.client.login(username=editor.username, password='benchmark'))
+
+    def test_subscriptions_follow_a_power_law(self):
+        call_command('seed_data', readers=500, journalists=20, publishers=0, articles=0, newsletters=0,
+                     stdout=StringIO())
+        counts = sorted(
+            User.objects.filter(profile__role=Profile.Role.JOURNALIST)
+            .annotate(n=Count('subscribers')).values_list('n', flat=True),
+            reverse=True,
+        )
+        self.assertGreater(counts[0], 5 * max(counts[-1], 1))
+
+
+class BenchmarkCommandTest(LiveServerTestCase):
+
+    """Tests for the HTTP load benchmark against a live test server."""
+
+    def test_reports_percentiles_and_saves_json(self):
+        call_command('seed_data', readers=5, journalists=2, editors=1, publishers=1, articles=5,
+                     newsletters=2, approved=1.0, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'bench.json')
+            out = StringIO()
+            call_command('benchmark', base_url=self.live_server_url, requests=6, concurrency=2,
+                         routes=['article_detail', 'api_subscribed_journalist_articles', 'editor_dashboard'],
+                         output=output, stdout=out)
+            with open(output) as fh:
+                report = json.load(fh)
+
+            call_command('benchmark', base_url=self.live_server_url, requests=2, concurrency=1,
+                         routes=['article_detail'], baseline=output, stdout=out)
+
+        self.assertEqual(set(report['routes']), {'article_detail', 'api_subscribed_journalist_articles',
+                                                 'editor_dashboard'})
+        for result in report['routes'].values():
+            self.assertEqual(result['errors'], 0)
+            self.assertEqual(result['requests'], 6)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        self.assertEqual(report['routes']['editor_dashboard']['persona'], 'EDITOR')
+        self.assertIn('Compared with', out.getvalue())
+
+    def test_token_auth_revokes_its_tokens(self):
+        call_command('seed_data', readers=3, journalists=1, editors=0, publishers=1, articles=3,
+                     newsletters=0, approved=1.0, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'bench.json')
+            call_command('benchmark', base_url=self.live_server_url, requests=4, concurrency=2, auth='token',
+                         routes=['api_subscribed_journalist_articles', 'api_reader_feed'],
+                         output=output, stdout=StringIO())
+            with open(output) as fh:
+                report = json.load(fh)
+
+        self.assertEqual(report['meta']['auth'], 'token')
+        self.assertTrue(all(result['errors'] == 0 for result in report['routes'].values()))
+        self.assertFalse(ApiToken.objects.filter(revoked_at=None).exists())
+
+
+class AsyncReadViewTest(TestCase):
+
+    """Tests for the async read views, served through the ASGI handler."""
+
+    def setUp(self):
+        cache.clear()
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.reader = make_user('reader', Profile.Role.READER)
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        self.article = Article.objects.create(title='Story', content='Body.', author=self.journalist,
+                                              publisher=self.publisher, is_approved=True)
+        self.reader.profile.sub_journalist.add(self.journalist)
+        self.reader.profile.sub_publisher.add(self.publisher)
+
+    async def test_read_views_render_for_a_subscribed_reader(self):
+        await self.async_client.aforce_login(self.reader)
+        for url in (reverse('article_list'), reverse('article_detail', args=[self.article.pk])):
+            response = await self.async_client.get(url)
+            self.assertContains(response, 'Story')
+
+        for name, pk in (('publisher_detail', self.publisher.pk), ('journalist_detail', self.journalist.pk)):
+            response = await self.async_client.get(reverse(name, args=[pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['is_subscribed'])
+
+        response = await self.async_client.get(reverse('api_subscribed_journalist_articles'))
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Story'])
+
+    async def test_model_backend_sessions_render(self):
+        """Sessions from the plain ModelBackend have no preloaded profile; it is loaded asynchronously."""
+        newsletter = await Newsletter.objects.acreate(title='Weekly', content='Body.', author=self.journalist,
+                                                      publisher=self.publisher, is_approved=True)
+        await self.async_client.aforce_login(self.reader, backend='django.contrib.auth.backends.ModelBackend')
+        for url in (
+            reverse('article_list'),
+            reverse('article_detail', args=[self.article.pk]),
+            reverse('newsletter_detail', args=[newsletter.pk]),
+            reverse('publisher_detail', args=[self.publisher.pk]),
+            reverse('journalist_detail', args=[self.journalist.pk]),
+            reverse('api_subscribed_journalist_articles'),
+        ):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+    async def test_missing_items_and_non_journalists(self):
+        response = await self.async_client.get(reverse('article_detail', args=[999]))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('journalist_detail', args=[self.reader.pk]))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=30)
+class ReplicaRoutingTest(TestCase):
+
+    """Tests for read-replica routing and read-your-writes pinning."""
+
+    def run_view(self, request, write=False):
+        """Runs a view through the middleware; returns the response and the databases it read from."""
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Article))
+            if write:
+                router.db_for_write(Article)
+                reads.append(router.db_for_read(Article))
+            return HttpResponse()
+
+        return ReplicaPinningMiddleware(view)(request), reads
+
+    def test_safe_requests_read_from_a_replica(self):
+        response, reads = self.run_view(RequestFactory().get('/'))
+        self.assertEqual(reads, ['replica1'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response, reads = self.run_view(RequestFactory().post('/'))
+        self.assertEqual(reads, ['default'])
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 30)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.run_view(request)[1], ['default'])
+
+    def test_a_write_during_a_safe_request_pins_the_rest_of_it(self):
+        response, reads = self.run_view(RequestFactory().get('/'), write=True)
+        self.assertEqual(reads, ['replica1', 'default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(router.db_for_read(Article), 'default')
+
+
+class ListPageTest(TestCase):
+
+    """Tests for the paginated list pages and stored excerpts."""
+
+    def setUp(self):
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+
+    def test_excerpt_follows_content(self):
+        article = Article.objects.create(title='Long', content='word  \n' * 200, author=self.journalist)
+        self.assertEqual(len(article.excerpt), EXCERPT_LENGTH)
+        self.assertTrue(article.excerpt.startswith('word word'))
+
+        article.content = 'Rewritten.'
+        article.save(update_fields=['content'])
+        self.assertEqual(Article.objects.get(pk=article.pk).excerpt, 'Rewritten.')
+
+    @override_settings(LIST_PAGE_SIZE=2)
+    def test_lists_page_newest_first_without_bodies(self):
+        for i in range(3):
+            Article.objects.create(title=f'Story {i}', content=f'Body {i}.', author=self.journalist)
+            Newsletter.objects.create(title=f'Issue {i}', content=f'Body {i}.', author=self.journalist)
+
+        for name, key, titles in (('article_list', 'articles', ['Story 2', 'Story 1']),
+                                  ('newsletter_list', 'newsletters', ['Issue 2', 'Issue 1'])):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name))
+            self.assertNotIn('"content"', queries[0]['sql'])
+            self.assertEqual([item.title for item in response.context[key]], titles)
+            self.assertTrue(response.context['has_next'])
+            self.assertContains(response, 'Body 2.')
+
+            response = self.client.get(reverse(name), {'page': 2})
+            self.assertEqual(len(response.context[key]), 1)
+            self.assertFalse(response.context['has_next'])
+
+
+class SubscriberCountTest(TestCase):
+
+    """Tests for denormalized subscriber counts and cached subscription sets."""
+
+    def setUp(self):
+        cache.clear()
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.readers = [make_user(f'reader{i}', Profile.Role.READER) for i in range(3)]
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+
+    def counts(self):
+        return (
+            Profile.objects.get(user=self.journalist).subscriber_count,
+            Publisher.objects.get(pk=self.publisher.pk).subscriber_count,
+        )
+
+    def test_counts_follow_adds_removes_and_clears_from_either_side(self):
+        first, second, third = (reader.profile for reader in self.readers)
+        first.sub_journalist.add(self.journalist)
+        first.sub_journalist.add(self.journalist)  # already subscribed
+        self.journalist.subscribers.add(second, third)
+        first.sub_publisher.add(self.publisher)
+        self.publisher.subscribers.add(second)
+        self.assertEqual(self.counts(), (3, 2))
+
+        third.sub_journalist.remove(self.journalist)
+        third.sub_publisher.remove(self.publisher)  # never subscribed
+        self.assertEqual(self.counts(), (2, 2))
+
+        first.sub_journalist.clear()
+        self.publisher.subscribers.clear()
+        self.assertEqual(self.counts(), (1, 0))
+
+        Profile.objects.update(subscriber_count=0)
+        recount()
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_subscription_sets_are_cached_until_they_change(self):
+        profile = self.readers[0].profile
+        self.assertEqual(subscriptions_of(profile.pk).journalists, frozenset())
+        with self.assertNumQueries(0):
+            subscriptions_of(profile.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.sub_journalist.add(self.journalist)
+        self.assertEqual(subscriptions_of(profile.pk).journalists, {self.journalist.pk})
+
+    def test_pages_show_counts_and_toggle_from_the_cached_set(self):
+        self.client.login(username='reader0', password='pwd')
+        url = reverse('subscribe_journalist', args=[self.journalist.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+        response = self.client.get(reverse('journalist_detail', args=[self.journalist.pk]))
+        self.assertContains(response, 'Subscribers: 1')
+        self.assertTrue(response.context['is_subscribed'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+        self.assertEqual(self.counts(), (0, 0))
+
+
+class PageCacheTest(TestCase):
+
+    """Tests for the anonymous full-page cache and surrogate-key purges."""
+
+    def setUp(self):
+        cache.clear()
+        self.editor = make_user('editor', Profile.Role.EDITOR)
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        self.article = Article.objects.create(
+            title='Story', content='Body.', author=self.journalist, publisher=self.publisher
+        )
+        self.url = reverse('article_detail', args=[self.article.pk])
+
+    def test_anonymous_pages_are_served_from_the_cache(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response[SURROGATE_KEY_HEADER].split(),
+                         [f'article:{self.article.pk}', f'journalist:{self.journalist.pk}',
+                          f'publisher:{self.publisher.pk}', 'related'])
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), 'Story')
+        self.assertEqual(metrics.get('cache.page.hits'), 1)
+
+    def test_logged_in_users_are_not_cached(self):
+        self.client.get(self.url)
+        self.client.login(username='editor', password='pwd')
+        self.assertContains(self.client.get(self.url), 'Story')
+        self.assertEqual(metrics.get('cache.page.hits'), 0)
+        self.assertEqual(metrics.get('cache.page.misses'), 1)
+
+    def test_pages_with_pending_messages_are_not_stored(self):
+        storage = CookieStorage(RequestFactory().get('/'))
+        self.client.cookies[storage.cookie_name] = storage._encode([Message(messages.INFO, 'Welcome')])
+        self.client.get(self.url)  # bypasses the cache
+        self.client.cookies.clear()
+        self.client.get(self.url)
+        self.assertEqual(metrics.get('cache.page.hits'), 0)
+        self.assertEqual(metrics.get('cache.page.misses'), 1)
+
+    def test_writes_purge_tagged_pages(self):
+        self.client.get(self.url)
+        self.article.title = 'Edited'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.save()
+        self.assertContains(self.client.get(self.url), 'Edited')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.journalist.username = 'renamed'
+            self.journalist.save()
+        self.assertContains(self.client.get(self.url), 'renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(metrics.get('cache.page.hits'), 0)
+
+    def test_approval_purges_the_list_and_sends_the_signal(self):
+        list_url = reverse('article_list')
+        self.assertContains(self.client.get(list_url), 'Story')
+        purged = []
+        surrogate_keys_purged.connect(lambda keys, **kwargs: purged.extend(keys), weak=False,
+                                      dispatch_uid='test_purges')
+        self.addCleanup(surrogate_keys_purged.disconnect, dispatch_uid='test_purges')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            approve(Article, [self.article.pk])
+        self.assertIn('articles', purged)
+        self.assertIn(f'article:{self.article.pk}', purged)
+        self.client.get(list_url)
+        self.assertEqual(metrics.get('cache.page.hits'), 0)
+
+
+class SubscriptionStatementTest(TestCase):
+
+    """Tests for one-statement subscribe/unsubscribe and subscription imports."""
+
+    def setUp(self):
+        cache.clear()
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.reader = make_user('reader', Profile.Role.READER)
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        Article.objects.create(title='Story', content='.', author=self.journalist, publisher=self.publisher,
+                               is_approved=True, approved_at=timezone.now())
+
+    def counts(self):
+        return (
+            Profile.objects.get(user=self.journalist).subscriber_count,
+            Publisher.objects.get(pk=self.publisher.pk).subscriber_count,
+        )
+
+    def test_repeated_posts_are_idempotent(self):
+        self.client.login(username='reader', password='pwd')
+        journalist_url = reverse('subscribe_journalist', args=[self.journalist.pk])
+        publisher_url = reverse('subscribe_publisher', args=[self.publisher.pk])
+        for _ in range(2):
+            self.client.post(journalist_url, {'action': 'subscribe'})
+            self.client.post(publisher_url, {'action': 'subscribe'})
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(FeedEntry.objects.filter(reader=self.reader.profile).count(), 1)
+
+        for _ in range(2):
+            self.client.post(journalist_url, {'action': 'unsubscribe'})
+            response = self.client.post(publisher_url, {'action': 'unsubscribe'})
+        self.assertRedirects(response, reverse('publisher_detail', args=[self.publisher.pk]))
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_each_change_is_one_statement_on_the_through_table(self):
+        table = THROUGH[feed.JOURNALIST]._meta.db_table
+        for change in (subscribe, unsubscribe):
+            with CaptureQueriesContext(connection) as queries:
+                change(feed.JOURNALIST, self.reader.profile.pk, [self.journalist.pk])
+            touching = [q['sql'].split()[0] for q in queries.captured_queries if table in q['sql']]
+            # No existence check first; the feed receivers read the table afterwards.
+            self.assertEqual(touching[0], 'INSERT' if change is subscribe else 'DELETE')
+            self.assertEqual(touching.count(touching[0]), 1)
+
+    def test_only_changed_rows_are_reported_and_counted(self):
+        other = make_user('other', Profile.Role.JOURNALIST)
+        profile_id = self.reader.profile.pk
+        self.assertEqual(subscribe(feed.JOURNALIST, profile_id, [self.journalist.pk]), {self.journalist.pk})
+        self.assertEqual(subscribe(feed.JOURNALIST, profile_id, [self.journalist.pk, other.pk]), {other.pk})
+        self.assertEqual(unsubscribe(feed.JOURNALIST, profile_id, [other.pk]), {other.pk})
+        self.assertEqual(unsubscribe(feed.JOURNALIST, profile_id, [other.pk]), set())
+        self.assertEqual(Profile.objects.get(user=other).subscriber_count, 0)
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_caches_follow_the_statements(self):
+        profile_id = self.reader.profile.pk
+        subscriptions_of(profile_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            subscribe(feed.PUBLISHER, profile_id, [self.publisher.pk])
+        self.assertEqual(subscriptions_of(profile_id).publishers, {self.publisher.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            unsubscribe(feed.PUBLISHER, profile_id, [self.publisher.pk])
+        self.assertEqual(subscriptions_of(profile_id).publishers, frozenset())
+
+    def test_import_pairs_batches_many_readers(self):
+        readers = [make_user(f'reader{i}', Profile.Role.READER).profile.pk for i in range(5)]
+        pairs = [(reader_id, self.journalist.pk) for reader_id in readers]
+        with CaptureQueriesContext(connection) as queries:
+            added = import_pairs(feed.JOURNALIST, pairs, batch_size=2)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "accounts_profile_sub')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(added, set(pairs))
+        self.assertEqual(import_pairs(feed.JOURNALIST, pairs), set())
+        self.assertEqual(self.counts(), (5, 0))
+        self.assertEqual(FeedEntry.objects.count(), 5)
+
+    def test_import_command_resolves_names_and_skips_unknown_rows(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fh:
+            fh.write('reader,journalist,journalist\n'
+                     'reader,publisher,Daily\n'
+                     'reader,journalist,nobody\n'
+                     'reader,columnist,journalist\n')
+        self.addCleanup(os.remove, fh.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_subscriptions', fh.name, batch_size=2, stdout=out, stderr=err)
+        self.assertIn('Imported 2 subscription(s); skipped 2 row(s).', out.getvalue())
+        self.assertIn('nobody', err.getvalue())
+        self.assertEqual(self.counts(), (1, 1))
+
+        call_command('import_subscriptions', fh.name, stdout=out, stderr=StringIO())
+        self.assertIn('Imported 0 subscription(s)', out.getvalue())
+        self.assertEqual(self.counts(), (1, 1))
+
+
+class ContentTransferTest(TestCase):
+
+    """Tests for the import_content and export_content commands."""
+
+    def setUp(self):
+        cache.clear()
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        self.approved_at = timezone.now() - timedelta(days=3)
+        Article.objects.create(title='Story', content='Long body. ' * 50, author=self.journalist,
+                               publisher=self.publisher, is_approved=True, approved_at=self.approved_at)
+        Article.objects.create(title='Draft', content='Draft body.', author=self.journalist)
+        Newsletter.objects.create(title='Weekly', content='Issue body.', author=self.journalist)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name, content=None):
+        path = os.path.join(self.tmp.name, name)
+        if content is not None:
+            with open(path, 'w') as fh:
+                fh.write(content)
+        return path
+
+    def snapshot(self):
+        return sorted(
+            (model.__name__, item.title, item.content, item.excerpt, item.publisher_id, item.is_approved,
+             item.approved_at)
+            for model in (Article, Newsletter) for item in model.objects.all()
+        )
+
+    def round_trip(self, name):
+        before = self.snapshot()
+        call_command('export_content', output=self.path(name), chunk_size=2, stdout=StringIO())
+        Article.objects.all().delete()
+        Newsletter.objects.all().delete()
+        out = StringIO()
+        call_command('import_content', self.path(name), batch_size=2, transaction_size=2, stdout=out)
+        self.assertIn('Imported 3 item(s); skipped 0 invalid row(s).', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+
+    def test_ndjson_round_trip(self):
+        self.round_trip('content.ndjson')
+
+    def test_csv_round_trip(self):
+        self.round_trip('content.csv')
+
+    def test_export_streams_to_stdout(self):
+        out = StringIO()
+        call_command('export_content', type='newsletter', stdout=out, stderr=StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(row['type'], row['title'], row['author']) for row in rows],
+                         [('newsletter', 'Weekly', 'journalist')])
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        rows = [
+            {'type': 'article', 'title': 'Good', 'author': 'journalist', 'publisher': 'Daily', 'is_approved': True},
+            {'type': 'article', 'title': 'No author', 'author': 'nobody'},
+            {'type': 'poem', 'title': 'Wrong type', 'author': 'journalist'},
+            {'title': 'Defaulted', 'author': 'journalist', 'is_approved': 'maybe'},
+        ]
+        path = self.path('rows.ndjson', '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n')
+        out, err = StringIO(), StringIO()
+        call_command('import_content', path, type='newsletter', stdout=out, stderr=err)
+        self.assertIn('Imported 1 item(s); skipped 4 invalid row(s).', out.getvalue())
+        for line in ('Line 2:', 'Line 3:', 'Line 4:', 'Line 5:'):
+            self.assertIn(line, err.getvalue())
+
+        good = Article.objects.get(title='Good')
+        self.assertEqual(good.publisher, self.publisher)
+        self.assertIsNotNone(good.approved_at)
+
+    def test_rows_are_inserted_in_batches(self):
+        lines = ''.join(f'newsletter,Issue {i},,journalist,,false\n' for i in range(5))
+        path = self.path('rows.csv', 'type,title,content,author,publisher,is_approved\n' + lines)
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_content', path, batch_size=2, transaction_size=4, stdout=StringIO())
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "bronewsapp_newsletter"')]
+        self.assertEqual(len(inserts), 3)  # 2 + 2, then 1 in the second transaction
+        self.assertEqual(Newsletter.objects.filter(title__startswith='Issue').count(), 5)
+
+    def test_import_from_stdin_leaves_it_open(self):
+        stdin = StringIO(json.dumps({'type': 'newsletter', 'title': 'Piped', 'author': 'journalist'}))
+        with mock.patch('sys.stdin', stdin):
+            call_command('import_content', '-', stdout=StringIO())
+        self.assertFalse(stdin.closed)
+        self.assertTrue(Newsletter.objects.filter(title='Piped').exists())
+
+    def test_import_purges_cached_pages(self):
+        self.assertNotContains(self.client.get(reverse('article_list')), 'Imported story')
+        path = self.path('rows.ndjson', json.dumps(
+            {'type': 'article', 'title': 'Imported story', 'author': 'journalist', 'publisher': 'Daily'}
+        ))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_content', path, stdout=StringIO())
+        self.assertContains(self.client.get(reverse('article_list')), 'Imported story')
+
+
+class ViewCountTest(TestCase):
+    """Tests for the buffered article, newsletter and publisher view counters."""
+
+    def setUp(self):
+        cache.clear()
+        viewcounts.discard()
+        self.journalist = User.objects.create_user(username='journalist', password='pwd')
+        self.journalist.profile.role = Profile.Role.JOURNALIST
+        self.journalist.profile.save()
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        self.article = Article.objects.create(
+            title='Story', content='Body.', author=self.journalist, publisher=self.publisher, is_approved=True
+        )
+        self.newsletter = Newsletter.objects.create(title='Weekly', content='Body.', author=self.journalist)
+        self.article_url = reverse('article_detail', args=[self.article.pk])
+
+    def stored(self, kind, pk):
+        return ViewCount.objects.filter(kind=kind, object_id=pk).values_list('views', flat=True).first()
+
+    def test_views_are_buffered_until_flushed(self):
+        response = self.client.get(self.article_url)
+        self.client.get(self.article_url)  # from the page cache
+        self.client.get(self.article_url, HTTP_IF_NONE_MATCH=response['ETag'])  # 304
+        self.client.get(reverse('article_detail', args=[self.article.pk + 100]))  # 404, not counted
+        self.assertIsNone(self.stored(ViewCount.Kind.ARTICLE, self.article.pk))
+        self.assertEqual(views_of(ViewCount.Kind.ARTICLE, [self.article.pk]), {self.article.pk: 3})
+
+        self.assertEqual(flush(), 1)
+        self.assertEqual(self.stored(ViewCount.Kind.ARTICLE, self.article.pk), 3)
+        self.assertEqual(views_of(ViewCount.Kind.ARTICLE, [self.article.pk]), {self.article.pk: 3})
+        self.assertEqual(flush(), 0)
+
+    @override_settings(VIEW_COUNT_MAX_PENDING=2)
+    def test_a_full_buffer_wakes_the_flush_thread(self):
+        """Requests never write counts themselves, however many are pending."""
+        with mock.patch.object(viewcounts._flusher, 'wake') as wake:
+            self.client.get(self.article_url)
+            wake.assert_not_called()
+            self.client.get(reverse('newsletter_detail', args=[self.newsletter.pk]))
+            wake.assert_called_once_with()
+        self.assertIsNone(self.stored(ViewCount.Kind.ARTICLE, self.article.pk))
+        self.assertIsNone(self.stored(ViewCount.Kind.NEWSLETTER, self.newsletter.pk))
+
+    @override_settings(VIEW_COUNT_FLUSH_SECONDS=0, DATABASE_REPLICAS=['replica1'])
+    def test_flush_thread_runs_outside_the_request(self):
+        """The thread's writes neither pin the reader whose view started it nor see its routing."""
+        flusher = viewcounts.Flusher()
+        flushed = threading.Event()
+        routing = []
+
+        def fake_flush():
+            routing.append(_routing.get())
+            flushed.set()
+
+        def view(request):
+            viewcounts.record(ViewCount.Kind.ARTICLE, self.article.pk)
+            return HttpResponse()
+
+        with mock.patch.object(viewcounts, '_flusher', flusher), mock.patch.object(viewcounts, 'flush', fake_flush):
+            response = ReplicaPinningMiddleware(view)(RequestFactory().get('/'))
+            self.assertTrue(flushed.wait(5))
+            flusher.stop()
+            flusher._thread.join(5)
+        self.assertFalse(flusher._thread.is_alive())
+        self.assertEqual(routing, [None])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_each_process_starts_its_own_flush_thread(self):
+        with mock.patch.object(viewcounts, '_flusher', viewcounts.Flusher()), \
+                mock.patch.object(viewcounts.threading, 'Thread') as thread:
+            viewcounts.record(ViewCount.Kind.ARTICLE, self.article.pk)
+            viewcounts.record(ViewCount.Kind.ARTICLE, self.article.pk)
+            self.assertEqual(thread.call_count, 1)
+            with mock.patch.object(viewcounts.os, 'getpid', return_value=os.getpid() + 1):  # a forked worker
+                viewcounts.record(ViewCount.Kind.ARTICLE, self.article.pk)
+            self.assertEqual(thread.call_count, 2)
+
+    def test_flushes_from_several_workers_add_up(self):
+        for views in (2, 5):
+            worker = ViewBuffer()
+            worker.add(ViewCount.Kind.ARTICLE, self.article.pk, views)
+            worker.add(ViewCount.Kind.PUBLISHER, self.publisher.pk)
+            with mock.patch.object(viewcounts, '_buffer', worker):
+                flush()
+        self.assertEqual(self.stored(ViewCount.Kind.ARTICLE, self.article.pk), 7)
+        self.assertEqual(self.stored(ViewCount.Kind.PUBLISHER, self.publisher.pk), 2)
+
+    def test_a_flush_is_one_statement(self):
+        for pk in range(1, 6):
+            viewcounts._buffer.add(ViewCount.Kind.ARTICLE, pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush(), 5)
+        writes = [q for q in queries.captured_queries if 'bronewsapp_viewcount' in q['sql']]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(ViewCount.objects.count(), 5)
+        self.assertEqual(metrics.get('views.flushed'), 5)
+
+
+class TrendingTest(TestCase):
+    """Tests for the incrementally maintained trending ranking on the home page."""
+
+    def setUp(self):
+        cache.clear()
+        viewcounts.discard()
+        self.journalist = User.objects.create_user(username='journalist', password='pwd')
+        self.journalist.profile.role = Profile.Role.JOURNALIST
+        self.journalist.profile.save()
+        self.reader = User.objects.create_user(username='reader', password='pwd')
+        self.publisher = Publisher.objects.create(name='Daily', admin=self.journalist)
+        self.first, self.second, self.old = (
+            Article.objects.create(title=title, content='Body.', author=self.journalist, publisher=self.publisher,
+                                   is_approved=True, approved_at=timezone.now())
+            for title in ('First story', 'Second story', 'Old story')
+        )
+        Article.objects.filter(pk=self.old.pk).update(approved_at=timezone.now() - timedelta(days=30))
+        self.pending = Article.objects.create(title='Pending story', content='Body.', author=self.journalist)
+        self.half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+
+    def ranking(self):
+        return [article.title for article in trending.top()]
+
+    def test_views_rank_approved_articles(self):
+        trending.record_views({self.first.pk: 3, self.second.pk: 5, self.pending.pk: 100})
+        self.assertEqual(self.ranking(), ['Second story', 'First story'])
+        trending.record_views({self.first.pk: 4})
+        self.assertEqual(self.ranking(), ['First story', 'Second story'])
+
+    def test_older_activity_weighs_less(self):
+        now = timezone.now()
+        trending.add({self.first.pk: 10}, at=now - 3 * self.half_life)  # decays to 1.25
+        trending.add({self.second.pk: 2}, at=now)
+        self.assertEqual(self.ranking(), ['Second story', 'First story'])
+
+    def test_new_subscriptions_credit_recent_articles(self):
+        subscribe(feed.PUBLISHER, self.reader.profile.pk, [self.publisher.pk])
+        subscribe(feed.PUBLISHER, self.reader.profile.pk, [self.publisher.pk])  # not new, not counted again
+        scores = dict(TrendingArticle.objects.values_list('article_id', 'score'))
+        self.assertEqual(set(scores), {self.first.pk, self.second.pk})
+        self.assertAlmostEqual(scores[self.first.pk], settings.TRENDING_SUBSCRIPTION_WEIGHT, places=2)
+
+    def test_compaction_rebases_and_drops_faded_articles(self):
+        now = timezone.now()
+        TrendingLandmark.objects.create(pk=1, at=now - 20 * self.half_life)
+        trending.add({self.first.pk: 100}, at=now - 20 * self.half_life)
+        trending.add({self.second.pk: 8}, at=now)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(trending.compact(now), 1)
+        self.assertEqual(TrendingLandmark.objects.get().at, now)
+        self.assertAlmostEqual(TrendingArticle.objects.get().score, 8)
+        self.assertEqual(self.ranking(), ['Second story'])
+
+    def test_home_page_shows_trending_articles(self):
+        with self.assertNumQueries(1):  # the ranking
+            self.assertNotContains(self.client.get(reverse('home')), 'Trending')
+        self.client.get(reverse('article_detail', args=[self.second.pk]))
+        flush()
+        self.assertTrue(TrendingArticle.objects.filter(article=self.second).exists())
+        self.assertNotContains(self.client.get(reverse('home')), 'Second story')  # still cached
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trending.compact()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Second story')
+        self.assertIn(f'article:{self.second.pk}', response[SURROGATE_KEY_HEADER].split())
+
+
+class RelatedItemsTest(TestCase):
+    """Tests for the precomputed related articles and newsletters."""
+
+    def setUp(self):
+        cache.clear()
+        self.directory = use_temporary_related_index(self)
+        settings_override = override_settings(RELATED_COUNT=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.journalist = make_user('journalist', Profile.Role.JOURNALIST)
+        self.final, self.preview, self.rates = (
+            Article.objects.create(title=title, content=content, author=self.journalist, is_approved=True)
+            for title, content in (
+                ('Football cup final', 'The football team won the cup final in extra time.'),
+                ('Cup final preview', 'Both football teams prepare for the cup final.'),
+                ('Interest rates rise', 'The central bank raised interest rates again.'),
+            )
+        )
+        self.weekly = Newsletter.objects.create(
+            title='Bank weekly', content='Why the central bank keeps raising interest rates.',
+            author=self.journalist, is_approved=True,
+        )
+        self.pending = Article.objects.create(
+            title='Football cup gossip', content='Cup final football rumours.', author=self.journalist,
+        )
+
+    def related(self, item):
+        return [(row.related_type, row.related_id, row.title)
+                for row in related.related_to(feed.item_type_for(item), item.pk)]
+
+    def build(self):
+        out = StringIO()
+        call_command('build_related', stdout=out)
+        self.assertIn('Found related items for 4 item(s)', out.getvalue())
+
+    def test_build_finds_similar_approved_items(self):
+        self.build()
+        self.assertEqual(self.related(self.final), [('A', self.preview.pk, 'Cup final preview')])
+        self.assertEqual(self.related(self.rates), [('N', self.weekly.pk, 'Bank weekly')])
+        self.assertEqual(self.related(self.weekly), [('A', self.rates.pk, 'Interest rates rise')])
+        self.assertEqual(self.related(self.pending), [])
+        self.assertEqual(sorted(related.load().ids.tolist()),
+                         sorted([self.final.pk, self.preview.pk, self.rates.pk, self.weekly.pk]))
+
+    def test_detail_page_reads_the_precomputed_items(self):
+        self.build()
+        with self.assertNumQueries(3):  # page validators, article, related items
+            response = self.client.get(reverse('article_detail', args=[self.final.pk]))
+        self.assertContains(response, reverse('article_detail', args=[self.preview.pk]))
+        self.assertIn(f'article:{self.preview.pk}', response[SURROGATE_KEY_HEADER].split())
+
+    def test_approved_items_are_added_incrementally(self):
+        self.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            approve(Article, [self.pending.pk])
+        with mock.patch('bronewsapp.outbox.post_tweet'):
+            process_batch()
+
+        self.assertEqual([row[1] for row in self.related(self.pending)], [self.final.pk, self.preview.pk])
+        self.assertIn(('A', self.pending.pk, 'Football cup gossip'), self.related(self.final))
+        self.assertEqual(len(related.load().ids), 5)
+        self.assertEqual(related.add_items(FeedEntry.ItemType.ARTICLE, [self.pending.pk]), 0)  # already indexed
+
+    def test_additions_leave_the_build_alone(self):
+        """Each addition is a file of its own; other processes read it, and the next build folds it in."""
+        self.build()
+        index_path = os.path.join(self.directory, 'related.npz')
+        built = os.stat(index_path).st_mtime_ns
+        self.pending.is_approved = True
+        self.pending.save()
+        self.assertEqual(related.add_items(FeedEntry.ItemType.ARTICLE, [self.pending.pk]), 1)
+        self.assertEqual(os.stat(index_path).st_mtime_ns, built)
+        self.assertEqual(os.listdir(index_path + '.additions'), ['00000001.npz'])
+
+        related._loaded = None  # As in another worker process.
+        gossip = Article.objects.create(title='More cup gossip', content='Football rumours before the final.',
+                                        author=self.journalist, is_approved=True)
+        with override_settings(RELATED_COUNT=5):
+            self.assertEqual(related.add_items(FeedEntry.ItemType.ARTICLE, [self.pending.pk, gossip.pk]), 1)
+        self.assertIn(('A', self.pending.pk, 'Football cup gossip'), self.related(gossip))  # an addition too
+        self.assertEqual(sorted(os.listdir(index_path + '.additions')), ['00000001.npz', '00000002.npz'])
+
+        out = StringIO()
+        call_command('build_related', stdout=out)
+        self.assertIn('Found related items for 6 item(s)', out.getvalue())
+        self.assertEqual(os.listdir(index_path + '.additions'), [])
+        self.assertEqual(len(related.load().ids), 6)
+
+    def test_edits_and_deletions_update_the_lists(self):
+        self.build()
+        self.preview.title = 'Cup final: the preview'
+        self.preview.save()
+        self.assertEqual(self.related(self.final), [('A', self.preview.pk, 'Cup final: the preview')])
+
+        self.preview.delete()
+        self.assertEqual(self.related(self.final), [])
+        self.weekly.is_approved = False
+        self.weekly.save()
+        self.assertEqual(self.related(self.rates), [])
+
+    def test_nothing_is_added_before_the_first_build(self):
+        self.assertEqual(related.add_items(FeedEntry.ItemType.ARTICLE, [self.final.pk]), 0)
+        self.assertFalse(os.listdir(self.directory))
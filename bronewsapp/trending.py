@@ -0,0 +1,131 @@
+"""
+Trending articles, ranked by time-decayed views and subscription activity.
+
+Scores are kept incrementally in ``TrendingArticle`` with forward decay:
+activity at time ``t`` adds ``weight * 2 ** ((t - landmark) / half_life)``
+to an article's score. Every decayed score is its stored score divided by
+the same ``2 ** ((now - landmark) / half_life)``, so the stored order is
+the trending order at any moment. Recording activity is one additive
+upsert (which, like the view counts, merges across workers), and the top
+N articles are an index scan of N rows.
+
+Views arrive with each view-count flush, ``TRENDING_VIEW_WEIGHT`` each. A
+new subscription to a journalist or publisher adds
+``TRENDING_SUBSCRIPTION_WEIGHT`` to each of their articles approved in
+the last ``TRENDING_WINDOW_DAYS``.
+
+:func:`compact` (the ``compact_trending`` command) keeps the table small
+and the numbers bounded: it drops articles whose decayed score fell below
+``TRENDING_MIN_SCORE`` or that are no longer approved, moves the landmark
+forward every :data:`REBASE_HALF_LIVES` half-lives, and purges the cached
+home page.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .feed import JOURNALIST, PUBLISHER
+from .mailer import chunked
+from .models import Article, TrendingArticle, TrendingLandmark
+from .pagecache import purge_on_commit
+
+# Surrogate key of pages showing the ranking.
+TAG = "trending"
+# Stored scores grow by 2**16 between rebases, well within a float's range.
+REBASE_HALF_LIVES = 16
+UPSERT_BATCH_SIZE = 500
+SOURCE_FIELD = {JOURNALIST: "author_id", PUBLISHER: "publisher_id"}
+
+
+def _growth(landmark, at):
+    """How much more activity at ``at`` weighs than activity at ``landmark``."""
+    return 2 ** ((at - landmark).total_seconds() / (settings.TRENDING_HALF_LIFE_HOURS * 3600))
+
+
+def _landmark():
+    """The landmark, locked until the transaction ends so scores are not rebased meanwhile."""
+    landmark, _ = TrendingLandmark.objects.select_for_update().get_or_create(pk=1)
+    return landmark
+
+
+def _upsert(scores):
+    rows = list(scores.items())
+    if connection.vendor in ("postgresql", "sqlite"):
+        table = connection.ops.quote_name(TrendingArticle._meta.db_table)
+        for batch in chunked(rows, UPSERT_BATCH_SIZE):
+            sql = (
+                f"INSERT INTO {table} (article_id, score) "
+                f"VALUES {', '.join(['(%s, %s)'] * len(batch))} "
+                f"ON CONFLICT (article_id) DO UPDATE SET score = {table}.score + excluded.score"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [value for row in batch for value in row])
+        return
+
+    for article_id, score in rows:
+        TrendingArticle.objects.get_or_create(article_id=article_id)
+        TrendingArticle.objects.filter(article_id=article_id).update(score=F("score") + score)
+
+
+def add(weights, at=None):
+    """Adds ``{article_id: weight}`` of activity that happened at ``at`` (now) to the scores."""
+    weights = {pk: weight for pk, weight in weights.items() if weight}
+    if not weights:
+        return
+    at = at or timezone.now()
+    with transaction.atomic():
+        growth = _growth(_landmark().at, at)
+        _upsert({pk: weight * growth for pk, weight in weights.items()})
+
+
+def record_views(views):
+    """Adds ``{article_id: views}`` to the scores of the approved articles among them."""
+    if not views:
+        return
+    approved = Article.objects.filter(pk__in=list(views), is_approved=True).values_list("pk", flat=True)
+    add({pk: views[pk] * settings.TRENDING_VIEW_WEIGHT for pk in approved})
+
+
+def record_subscriptions(kind, source_ids):
+    """Credits one new subscription per listed journalist or publisher id to their recent articles."""
+    subscriptions = Counter(source_ids)
+    if not subscriptions:
+        return
+    field = SOURCE_FIELD[kind]
+    since = timezone.now() - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    articles = Article.objects.filter(
+        **{f"{field}__in": list(subscriptions)}, is_approved=True, approved_at__gte=since,
+    ).values_list("pk", field)
+    add({pk: subscriptions[source_id] * settings.TRENDING_SUBSCRIPTION_WEIGHT for pk, source_id in articles})
+
+
+def top(limit=None):
+    """The ``limit`` (``TRENDING_SIZE``) approved articles with the highest scores, best first."""
+    return Article.objects.filter(is_approved=True, trending__isnull=False).order_by(
+        "-trending__score", "-pk"
+    )[:limit or settings.TRENDING_SIZE]
+
+
+def compact(now=None):
+    """
+    Drops faded and unapproved articles from the ranking, rebasing the
+    scores first when due. Returns how many articles were dropped.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        landmark = _landmark()
+        growth = _growth(landmark.at, now)
+        if growth >= 2 ** REBASE_HALF_LIVES:
+            TrendingArticle.objects.update(score=F("score") / growth)
+            landmark.at = now
+            landmark.save(update_fields=["at"])
+            growth = 1.0
+        dropped, _ = TrendingArticle.objects.filter(
+            Q(score__lt=settings.TRENDING_MIN_SCORE * growth) | Q(article__is_approved=False)
+        ).delete()
+        purge_on_commit(TAG)
+    return dropped
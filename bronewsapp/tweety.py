@@ -1,5 +1,17 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
 import tweepy
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
 
 # Replace these values with your own credentials
 API_KEY = settings.API_KEY
@@ -8,17 +20,163 @@ ACCESS_TOKEN = settings.ACCESS_TOKEN
 ACCESS_TOKEN_SECRET = settings.ACCESS_TOKEN_SECRET
 BEARER_TOKEN = settings.BEARER_TOKEN
 
+TWITTER_HOST = "https://api.twitter.com"
+
+
+class RateLimited(Exception):
+    """Raised when a tweet has to wait for the rate limit window to reopen."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Twitter rate limit reached, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket matching a "``capacity`` posts per ``window`` seconds" limit.
+
+    Tokens refill continuously. The bucket can also be emptied until a
+    given time when the API tells us the window is exhausted.
+    """
+
+    def __init__(self, capacity, window, clock=time.time):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Takes a token. Returns 0 on success, else the seconds to wait."""
+        now = self.clock()
+        if self.blocked_until:
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            # The API's window has reset, so the full allowance is back.
+            self.tokens, self.updated, self.blocked_until = float(self.capacity), now, 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def block_until(self, reset_at):
+        """Stops handing out tokens until ``reset_at`` (epoch seconds)."""
+        self.tokens = 0.0
+        self.blocked_until = reset_at
+
+
+class _HostAdapter(HTTPAdapter):
+    """Sends requests meant for api.twitter.com to ``TWITTER_API_HOST`` instead."""
+
+    def __init__(self, host):
+        super().__init__()
+        self.host = host.rstrip("/")
 
-def post_tweet(tweet_text):
-    """Posts a tweet to Twitter."""
+    def send(self, request, **kwargs):
+        request.url = self.host + request.url[len(TWITTER_HOST):]
+        return super().send(request, **kwargs)
+
+
+class TwitterPoster:
+    """
+    Long-lived Twitter client shared by everything in one process.
+
+    Posts go through a token bucket sized from the configured rate limit,
+    and the rate limit headers of every response keep the bucket in sync
+    with the API. When no token is available :class:`RateLimited` is
+    raised so the outbox can delay the post instead of failing it.
+    Posts made under a ``key`` (the outbox message) are remembered, so a
+    retried message whose tweet already went out is not tweeted twice;
+    different messages with the same text are posted separately. The lock
+    only guards the bucket and the remembered posts, never the API call.
+    """
+
+    def __init__(self, client, bucket, remember=256):
+        self.client = client
+        self.bucket = bucket
+        self.remember = remember
+        self._posted = OrderedDict()
+        self._lock = threading.Lock()
+
+    def post(self, text, key=None):
+        with self._lock:
+            if key is not None and key in self._posted:
+                metrics.incr("twitter.coalesced")
+                return self._posted[key]
+
+            wait = self.bucket.acquire()
+            if wait:
+                metrics.incr("twitter.throttled")
+                raise RateLimited(wait)
+
+        try:
+            response = self.client.create_tweet(text=text, user_auth=True)
+        except tweepy.TooManyRequests as exc:
+            reset_at = float(exc.response.headers.get("x-rate-limit-reset", time.time() + 60))
+            with self._lock:
+                self.bucket.block_until(reset_at)
+            metrics.incr("twitter.throttled")
+            metrics.incr("twitter.rate_limit_responses")
+            raise RateLimited(max(reset_at - time.time(), 1)) from exc
+        except tweepy.TweepyException:
+            metrics.incr("twitter.errors")
+            raise
+
+        posted = response.json()
+        with self._lock:
+            self._sync_bucket(response.headers)
+            if key is not None:
+                self._posted[key] = posted
+                if len(self._posted) > self.remember:
+                    self._posted.popitem(last=False)
+        metrics.incr("twitter.posted")
+        return posted
+
+    def _sync_bucket(self, headers):
+        """Stops posting early when the API reports the window is used up."""
+        if headers.get("x-rate-limit-remaining") == "0" and "x-rate-limit-reset" in headers:
+            self.bucket.block_until(float(headers["x-rate-limit-reset"]))
+
+
+def build_poster():
+    """Creates a poster from the credentials and rate limit in settings."""
     client = tweepy.Client(
         bearer_token=BEARER_TOKEN,
         consumer_key=API_KEY,
         consumer_secret=API_KEY_SECRET,
         access_token=ACCESS_TOKEN,
-        access_token_secret=ACCESS_TOKEN_SECRET
+        access_token_secret=ACCESS_TOKEN_SECRET,
+        return_type=requests.Response,
     )
+    if settings.TWITTER_API_HOST.rstrip("/") != TWITTER_HOST:
+        client.session.mount(TWITTER_HOST, _HostAdapter(settings.TWITTER_API_HOST))
+    bucket = TokenBucket(settings.TWITTER_RATE_LIMIT_POSTS, settings.TWITTER_RATE_LIMIT_WINDOW)
+    return TwitterPoster(client, bucket)
+
+
+_poster = None
+_poster_pid = None
+_poster_lock = threading.Lock()
+
+
+def get_poster():
+    """Returns this process's poster, creating it on first use (and after a fork)."""
+    global _poster, _poster_pid
+    with _poster_lock:
+        if _poster is None or _poster_pid != os.getpid():
+            _poster = build_poster()
+            _poster_pid = os.getpid()
+        return _poster
+
 
-    response = client.create_tweet(text=tweet_text)
-    print("Tweet posted successfully!", response)
-    return response
\ No newline at end of file
+def post_tweet(tweet_text, key=None):
+    """Posts a tweet to Twitter, at most once per ``key``."""
+    response = get_poster().post(tweet_text, key=key)
+    logger.info("Tweet posted successfully! %s", response)
+    return response
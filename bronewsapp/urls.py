@@ -7,6 +7,7 @@ urlpatterns = [
     path('create-publisher/', views.create_publisher, name='create_publisher'),
     path('publisher-list/', views.publisher_list, name='publisher_list'),
     path('publisher-details/<int:publisher_id>/', views.publisher_detail, name='publisher_detail'),
+    path('search/', views.search_view, name='search'),
 
     # Article URLs
     path('articles/create/', views.article_create, name='article_create'),
@@ -18,6 +19,7 @@ urlpatterns = [
     # Approval URLs
     path('articles/<int:pk>/approve/', views.article_approve, name='article_approve'),
     path('newsletters/<int:pk>/approve/', views.newsletter_approve, name='newsletter_approve'),
+    path('approve/', views.bulk_approve, name='bulk_approve'),
 
     # Newsletter URLs
     path('newsletters/create/', views.newsletter_create, name='newsletter_create'),
@@ -35,4 +37,7 @@ urlpatterns = [
     path('publisher/<int:publisher_id>/subscribe/', views.subscribe_publisher, name='subscribe_publisher'),
     path('journalist/<int:user_id>/', views.journalist_detail, name='journalist_detail'),
     path('journalist/<int:user_id>/subscribe/', views.subscribe_journalist, name='subscribe_journalist'),
-]
\ No newline at end of file
+
+    # Operations
+    path('metrics/', views.metrics_view, name='metrics'),
+]
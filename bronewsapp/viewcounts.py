@@ -0,0 +1,229 @@
+"""
+Write-behind view counters for article, newsletter and publisher pages.
+
+Each process adds views to an in-memory buffer instead of writing per
+hit, and flushes it as one batched upsert that adds the buffered counts
+to the ``ViewCount`` rows (``views = views + excluded.views``). Flushes
+from any number of workers therefore merge in the database without
+losing increments, and a popular page costs one row write per flush
+rather than one per view. Article views also feed the trending ranking
+(``bronewsapp.trending``) in the same transaction.
+
+Requests never write counts themselves. A daemon thread, started in each
+process by its first counted view, flushes every
+``VIEW_COUNT_FLUSH_SECONDS``, and at once when ``VIEW_COUNT_MAX_PENDING``
+distinct pages are waiting (or every view, with an interval of ``0``);
+the process also flushes when it exits normally. The thread runs outside
+any request, so its writes go to the primary without pinning a reader to
+it (see ``bronewsapp.routers``) or delaying a response. The interval is
+the accuracy trade-off: a worker that is killed outright loses whatever
+it had pending.
+"""
+import atexit
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+
+from . import metrics, trending
+from .mailer import chunked
+from .models import ViewCount
+
+logger = logging.getLogger(__name__)
+
+# Full pages and revalidated (Not Modified) pages both count as views.
+COUNTED_STATUSES = (200, 304)
+UPSERT_BATCH_SIZE = 500
+
+
+class ViewBuffer:
+    """This process's views not yet written, as ``{(kind, object_id): views}``."""
+
+    def __init__(self):
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, kind, object_id, views=1):
+        with self._lock:
+            self._pending[kind, object_id] += views
+
+    def due(self):
+        return (
+            len(self._pending) >= settings.VIEW_COUNT_MAX_PENDING
+            or time.monotonic() - self._last_flush >= settings.VIEW_COUNT_FLUSH_SECONDS
+        )
+
+    def take(self):
+        """Empties the buffer, returning what it held."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        return pending
+
+    def restore(self, pending):
+        with self._lock:
+            self._pending.update(pending)
+
+    def pending(self, kind, object_id):
+        return self._pending.get((kind, object_id), 0)
+
+
+_buffer = ViewBuffer()
+
+
+def _upsert(pending):
+    rows = [(kind, object_id, views) for (kind, object_id), views in pending.items()]
+    if connection.vendor in ("postgresql", "sqlite"):
+        table = connection.ops.quote_name(ViewCount._meta.db_table)
+        for batch in chunked(rows, UPSERT_BATCH_SIZE):
+            sql = (
+                f"INSERT INTO {table} (kind, object_id, views) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(batch))} "
+                f"ON CONFLICT (kind, object_id) DO UPDATE SET views = {table}.views + excluded.views"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [value for row in batch for value in row])
+        return
+
+    for kind, object_id, views in rows:
+        ViewCount.objects.get_or_create(kind=kind, object_id=object_id)
+        ViewCount.objects.filter(kind=kind, object_id=object_id).update(views=F("views") + views)
+
+
+def flush():
+    """Writes this process's pending views; returns how many pages were updated."""
+    pending = _buffer.take()
+    if not pending:
+        return 0
+    try:
+        with transaction.atomic():
+            _upsert(pending)
+            trending.record_views({
+                object_id: views for (kind, object_id), views in pending.items() if kind == ViewCount.Kind.ARTICLE
+            })
+    except DatabaseError:
+        logger.exception("Could not write %d view counts; keeping them for the next flush.", len(pending))
+        _buffer.restore(pending)
+        return 0
+    metrics.incr("views.flushes")
+    metrics.incr("views.flushed", sum(pending.values()))
+    return len(pending)
+
+
+def discard():
+    """Drops this process's pending views without writing them, e.g. when a test run ends."""
+    _buffer.take()
+
+
+class Flusher:
+    """
+    The daemon thread that flushes this process's views. It is started by
+    the first view a process counts, so each worker forked from a parent
+    that imported this module still gets its own.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the thread in this process unless it runs already (or flushing in the background is off)."""
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wake = threading.Event()
+            # A fresh context: the thread must not see the routing of the request that started it.
+            context = contextvars.Context()
+            self._thread = threading.Thread(target=context.run, args=(self._run,), name="viewcounts-flush",
+                                            daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def wake(self):
+        """Makes the thread flush now rather than at the end of its interval."""
+        self._wake.set()
+
+    def stop(self):
+        """Stops flushing in the background; a running thread exits without flushing again."""
+        self.enabled = False
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.VIEW_COUNT_FLUSH_SECONDS or None)
+            self._wake.clear()
+            if not self.enabled:
+                return
+            try:
+                flush()
+            except Exception:
+                logger.exception("Could not write view counts.")
+            finally:
+                close_old_connections()
+
+
+_flusher = Flusher()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not write view counts at exit.")
+
+
+def record(kind, object_id):
+    """Counts one view of an object; the flush thread writes it."""
+    _buffer.add(kind, object_id)
+    _flusher.start()
+    if _buffer.due():
+        _flusher.wake()
+
+
+def views_of(kind, object_ids):
+    """``{object_id: views}``: stored counts plus this process's pending ones."""
+    stored = dict(
+        ViewCount.objects.filter(kind=kind, object_id__in=object_ids).values_list("object_id", "views")
+    )
+    return {pk: stored.get(pk, 0) + _buffer.pending(kind, pk) for pk in object_ids}
+
+
+def count_views(kind, url_kwarg):
+    """
+    Counts a view of the object named by the ``url_kwarg`` URL argument for
+    every 200 or 304 response of the view. Place it above
+    ``cache_anonymous_page`` so pages served from the cache count too.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                response = await view(request, *args, **kwargs)
+                if response.status_code in COUNTED_STATUSES:
+                    record(kind, kwargs[url_kwarg])
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if response.status_code in COUNTED_STATUSES:
+                record(kind, kwargs[url_kwarg])
+            return response
+        return wrapper
+    return decorator
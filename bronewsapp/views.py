@@ -1,15 +1,59 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages 
-from django.core.mail import send_mail
 from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from accounts.roles import RoleContext, aload_role, role_required
+from . import metrics, related, trending
+from .caching import apublisher_listing
+from .conditional import async_item_condition
+from .pagecache import cache_anonymous_page, item_keys, source_keys, tag
 from .forms import PublisherForm, ArticleForm, NewsletterForm
-from .models import Article, Newsletter, Publisher, User, Profile
-from .tweety import post_tweet
+from .models import Article, FeedEntry, Newsletter, Publisher, User, Profile, ViewCount
+from .approval import approve
+from .search import load_results, search
+from .feed import JOURNALIST, PUBLISHER
+from .subscriptions import asubscriptions_of, subscribe, subscriptions_of, unsubscribe
+from .viewcounts import count_views
 
 
+# Columns list pages show; ``content`` is never loaded for them.
+LIST_FIELDS = ('title', 'excerpt', 'is_approved', 'author', 'author__username', 'publisher', 'publisher__name')
+
+
+def _page_number(request):
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
+
+
+def _list_window(model, page):
+    """Page ``page`` of ``model``'s list, newest first, plus one row to tell whether another page follows."""
+    size = settings.LIST_PAGE_SIZE
+    offset = (page - 1) * size
+    return (
+        model.objects.select_related('author', 'publisher').only(*LIST_FIELDS)
+        .order_by('-id')[offset:offset + size + 1]
+    )
+
+
+def _list_context(name, rows, page):
+    size = settings.LIST_PAGE_SIZE
+    return {name: rows[:size], 'page': page, 'has_next': len(rows) > size}
+
+
+@cache_anonymous_page
 def home(request):
-    return render(request, "home.html")
+    """
+    The home page with the trending articles, read from the precomputed
+    ranking (see ``bronewsapp.trending``) in one query.
+    """
+    articles = list(trending.top().select_related('author', 'publisher').only(*LIST_FIELDS))
+    response = render(request, "home.html", {'trending': articles})
+    return tag(response, trending.TAG, *(f"article:{article.pk}" for article in articles), *source_keys(articles))
 
 
 @login_required
@@ -35,38 +79,54 @@ def publisher_list(request):
     return render(request, 'publisher_list.html', {'publishers': publishers})
 
 
-def publisher_detail(request, publisher_id):
-    """Displays details of a specific publisher and their articles and newsletters."""
-    publisher = get_object_or_404(Publisher, pk=publisher_id)
-    articles = Article.objects.filter(publisher=publisher)
-    newsletters = Newsletter.objects.filter(publisher=publisher)
+@count_views(ViewCount.Kind.PUBLISHER, 'publisher_id')
+@cache_anonymous_page
+async def publisher_detail(request, publisher_id):
+    """
+    Displays details of a specific publisher and their articles and newsletters.
+    The listing comes from the versioned fragment cache and the
+    subscription status from the reader's cached subscriptions.
+    """
+    role = await aload_role(request)
+    publisher = await apublisher_listing(publisher_id)
 
     # Check subscription status for the current logged-in user if they are a READER
     is_subscribed = False
-    if request.user.is_authenticated and hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.READER:
-        is_subscribed = request.user.profile.sub_publisher.filter(pk=publisher.pk).exists()
+    if role.is_reader:
+        is_subscribed = publisher['pk'] in (await asubscriptions_of(role.profile.pk)).publishers
 
-    return render(request, 'publisher_detail.html', {
+    response = render(request, 'publisher_detail.html', {
         'publisher': publisher, 
-        'articles': articles, 
-        'newsletters': newsletters,
         'is_subscribed': is_subscribed, # Pass subscription status to template
     })
+    return tag(response, f"publisher:{publisher['pk']}")
 
 
+def search_view(request):
+    """
+    Ranked full-text search across approved articles and newsletters.
+    """
+    query = request.GET.get('q', '').strip()
+    page = _page_number(request)
+    page_size = settings.SEARCH_PAGE_SIZE
+
+    hits = search(query, limit=page_size + 1, offset=(page - 1) * page_size)
+    return render(request, 'search.html', {
+        'query': query,
+        'results': load_results(hits[:page_size]),
+        'page': page,
+        'has_next': len(hits) > page_size,
+    })
+
+
+@role_required(Profile.Role.JOURNALIST,
+               message="You must be a journalist to create articles.",
+               login_message="You must be logged in to create an article.")
 def article_create(request):
     """
     Handles creating a new article, associating it with the logged-in journalist.
     Access restricted to authenticated journalists.
     """
-    if not request.user.is_authenticated:
-        messages.error(request, "You must be logged in to create an article.")
-        return redirect('login')
-
-    if not (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.JOURNALIST): # Use Profile.Role
-        messages.error(request, "You must be a journalist to create articles.")
-        return redirect('home')
-
     if request.method == 'POST':
         form = ArticleForm(request.POST)
         if form.is_valid():
@@ -91,8 +151,7 @@ def article_update(request, pk):
         messages.error(request, "You must be logged in to edit this article.")
         return redirect('login') 
 
-    is_authorized = (request.user == article.author) or \
-                    (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.EDITOR) # Use Profile.Role
+    is_authorized = article.author_id == request.user.pk or request.role.is_editor
 
     if not is_authorized:
         messages.error(request, "You are not authorized to edit this article.")
@@ -119,8 +178,7 @@ def article_delete(request, pk):
         messages.error(request, "You must be logged in to delete this article.")
         return redirect('login') 
 
-    is_authorized = (request.user == article.author) or \
-                    (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.EDITOR) # Use Profile.Role
+    is_authorized = article.author_id == request.user.pk or request.role.is_editor
 
     if not is_authorized:
         messages.error(request, "You are not authorized to delete this article.")
@@ -134,75 +192,67 @@ def article_delete(request, pk):
     return render(request, 'article_confirm_delete.html', {'article': article})
 
 
-def article_list(request):
+@cache_anonymous_page
+async def article_list(request):
     """
-    Displays a list of all articles.
+    Displays a page of articles, newest first, with their excerpts.
     """
-    articles = Article.objects.all()
-    return render(request, 'article_list.html', {'articles': articles})
+    await aload_role(request)
+    page = _page_number(request)
+    articles = [article async for article in _list_window(Article, page)]
+    response = render(request, 'article_list.html', _list_context('articles', articles, page))
+    return tag(response, "articles", *source_keys(articles))
 
 
-def article_detail(request, pk):
+@count_views(ViewCount.Kind.ARTICLE, 'pk')
+@cache_anonymous_page
+@async_item_condition(Article)
+async def article_detail(request, pk):
     """
-    Displays the details of a specific article.
+    Displays the details of a specific article and its related items,
+    which are precomputed (see ``bronewsapp.related``).
+    Answers 304 Not Modified while the article and its publisher are unchanged.
     """
-    article = get_object_or_404(Article, pk=pk) 
-    return render(request, 'article_detail.html', {'article': article})
+    article = await aget_object_or_404(Article.objects.select_related('author', 'publisher'), pk=pk)
+    related_items = [item async for item in related.related_to(FeedEntry.ItemType.ARTICLE, pk)]
+    response = render(request, 'article_detail.html', {'article': article, 'related_items': related_items})
+    return tag(response, *item_keys(article), related.TAG, *related.page_keys(related_items))
 
 
+@role_required(Profile.Role.EDITOR,
+               message="You must be an editor to approve articles.",
+               login_message="You must be logged in to approve this article.",
+               redirect_to='article_detail')
 def article_approve(request, pk):
     """
     Allows an editor to approve an article. 
-    Sends approval emails and twitter posts.
+    Queues the approval emails and twitter post in the outbox; they are
+    delivered by the process_outbox worker, not during this request.
+    Approving an already approved article is a no-op, so concurrent
+    approvals notify subscribers once.
     """
-    article = get_object_or_404(Article, pk=pk)
-
-    if not request.user.is_authenticated:
-        messages.error(request, "You must be logged in to approve this article.")
-        return redirect('login') 
-
-    if not (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.EDITOR): # Use Profile.Role
-        messages.error(request, "You must be an editor to approve articles.")
-        return redirect('article_detail', pk=pk)
-
     if request.method == 'POST':
-        article.is_approved = True
-        article.save()
-        emails = [
-            profile.user.email
-            for profile in article.author.subscribers.all()
-            if profile.user.email
-        ]
-        if emails:
-            send_mail(
-                f"This article has been approved: {article.title}",
-                f"Check out: {article.title} - Written by {article.author.username}",
-                settings.DEFAULT_FROM_EMAIL,
-                emails
-            )
-            
-        tweet = f"Check out: {article.title} - Written by {article.author.username}"
-        post_tweet(tweet)
-        messages.success(request, f"Article '{article.title}' has been approved!")
+        approved = approve(Article, [pk])
+        if approved:
+            messages.success(request, f"Article '{approved[0].title}' has been approved!")
+        elif Article.objects.filter(pk=pk).exists():
+            messages.info(request, "This article was already approved.")
+        else:
+            raise Http404("No Article matches the given query.")
         return redirect('article_detail', pk=pk)
 
     messages.warning(request, "Invalid request method for approval.")
     return redirect('article_detail', pk=pk)
 
 
+@role_required(Profile.Role.JOURNALIST,
+               message="You must be a journalist to create newsletters.",
+               login_message="You must be logged in to create a newsletter.")
 def newsletter_create(request):
     """
     Handles creating a new newsletter, associating it with the logged-in journalist.
     Access restricted to authenticated journalists.
     """
-    if not request.user.is_authenticated:
-        messages.error(request, "You must be logged in to create a newsletter.")
-        return redirect('login')
-
-    if not (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.JOURNALIST): # Use Profile.Role
-        messages.error(request, "You must be a journalist to create newsletters.")
-        return redirect('home')
-
     if request.method == 'POST':
         form = NewsletterForm(request.POST)
         if form.is_valid():
@@ -227,8 +277,7 @@ def newsletter_update(request, pk):
         messages.error(request, "You must be logged in to edit this newsletter.")
         return redirect('login') 
 
-    is_authorized = (request.user == newsletter.author) or \
-                    (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.EDITOR) # Use Profile.Role
+    is_authorized = newsletter.author_id == request.user.pk or request.role.is_editor
 
     if not is_authorized:
         messages.error(request, "You are not authorized to edit this newsletter.")
@@ -255,8 +304,7 @@ def newsletter_delete(request, pk):
         messages.error(request, "You must be logged in to delete this newsletter.")
         return redirect('login') 
 
-    is_authorized = (request.user == newsletter.author) or \
-                    (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.EDITOR) # Use Profile.Role
+    is_authorized = newsletter.author_id == request.user.pk or request.role.is_editor
 
     if not is_authorized:
         messages.error(request, "You are not authorized to delete this newsletter.")
@@ -272,40 +320,46 @@ def newsletter_delete(request, pk):
 
 def newsletter_list(request):
     """
-    Displays a list of all newsletters.
+    Displays a page of newsletters, newest first, with their excerpts.
     """
-    newsletters = Newsletter.objects.all()
-    return render(request, 'newsletter_list.html', {'newsletters': newsletters})
+    page = _page_number(request)
+    newsletters = list(_list_window(Newsletter, page))
+    return render(request, 'newsletter_list.html', _list_context('newsletters', newsletters, page))
 
 
-def newsletter_detail(request, pk):
+@count_views(ViewCount.Kind.NEWSLETTER, 'pk')
+@cache_anonymous_page
+@async_item_condition(Newsletter)
+async def newsletter_detail(request, pk):
     """
-    Displays the details of a specific newsletter.
+    Displays the details of a specific newsletter and its related items.
+    Answers 304 Not Modified while the newsletter and its publisher are unchanged.
     """
-    newsletter = get_object_or_404(Newsletter, pk=pk)
-    return render(request, 'newsletter_detail.html', {'newsletter': newsletter})
+    newsletter = await aget_object_or_404(Newsletter.objects.select_related('author', 'publisher'), pk=pk)
+    related_items = [item async for item in related.related_to(FeedEntry.ItemType.NEWSLETTER, pk)]
+    response = render(request, 'newsletter_detail.html', {'newsletter': newsletter, 'related_items': related_items})
+    return tag(response, *item_keys(newsletter), related.TAG, *related.page_keys(related_items))
 
 
+@role_required(Profile.Role.EDITOR,
+               message="You must be an editor to approve newsletters.",
+               login_message="You must be logged in to approve this newsletter.",
+               redirect_to='newsletter_detail')
 def newsletter_approve(request, pk):
     """
     Allows an editor to approve a newsletter.
+    Approving an already approved newsletter is a no-op.
     """
-    newsletter = get_object_or_404(Newsletter, pk=pk)
-
-    if not request.user.is_authenticated:
-        messages.error(request, "You must be logged in to approve this newsletter.")
-        return redirect('login') 
-    
-    if not (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.EDITOR): # Use Profile.Role
-        messages.error(request, "You must be an editor to approve newsletters.")
-        return redirect('newsletter_detail', pk=pk)
-    
     if request.method == 'POST':
-        newsletter.is_approved = True
-        newsletter.save()
-        messages.success(request, f"Newsletter '{newsletter.title}' has been approved!")
+        approved = approve(Newsletter, [pk])
+        if approved:
+            messages.success(request, f"Newsletter '{approved[0].title}' has been approved!")
+        elif Newsletter.objects.filter(pk=pk).exists():
+            messages.info(request, "This newsletter was already approved.")
+        else:
+            raise Http404("No Newsletter matches the given query.")
         return redirect('newsletter_detail', pk=pk)
-    
+
     messages.warning(request, "Invalid request method for approval.")
     return redirect('newsletter_detail', pk=pk)
 
@@ -319,9 +373,49 @@ def journalist_dashboard_view(request):
 
 def editor_dashboard_view(request):
     """
-    Renders the editor dashboard HTML page.
+    Renders the editor dashboard HTML page, with the oldest pending
+    articles and newsletters for bulk approval.
+    """
+    context = {}
+    if request.role.is_editor:
+        limit = settings.APPROVAL_BULK_MAX
+        context = {
+            'pending_articles': Article.objects.filter(is_approved=False).order_by('id').only('id', 'title')[:limit],
+            'pending_newsletters': Newsletter.objects.filter(is_approved=False).order_by('id').only('id', 'title')[:limit],
+        }
+    return render(request, 'editor_dashboard.html', context)
+
+
+APPROVAL_MODELS = {'article': Article, 'newsletter': Newsletter}
+
+
+@role_required(Profile.Role.EDITOR, message="You must be an editor to approve content.",
+               redirect_to='editor_dashboard')
+def bulk_approve(request):
+    """
+    Approves the selected pending articles or newsletters in one statement.
+    Their notifications are batched per journalist.
     """
-    return render(request, 'editor_dashboard.html')
+    if request.method != 'POST':
+        messages.warning(request, "Invalid request method for approval.")
+        return redirect('editor_dashboard')
+
+    model = APPROVAL_MODELS.get(request.POST.get('kind'))
+    ids = request.POST.getlist('ids')
+    if model is None or not all(pk.isdigit() for pk in ids):
+        messages.error(request, "Invalid approval request.")
+        return redirect('editor_dashboard')
+    if len(ids) > settings.APPROVAL_BULK_MAX:
+        messages.error(request, f"Approve at most {settings.APPROVAL_BULK_MAX} items at a time.")
+        return redirect('editor_dashboard')
+
+    approved = approve(model, ids)
+    noun = model._meta.verbose_name_plural if len(approved) != 1 else model._meta.verbose_name
+    messages.success(request, f"Approved {len(approved)} {noun}.")
+    skipped = len(set(ids)) - len(approved)
+    if skipped:
+        messages.info(request, f"{skipped} selected item(s) were already approved or no longer exist.")
+    return redirect('editor_dashboard')
 
 
 def admin_dashboard_view(request):
@@ -331,7 +425,21 @@ def admin_dashboard_view(request):
     return render(request, 'admin_dashboard.html')
 
 
+def _subscription_action(request, is_subscribed):
+    """
+    ``'subscribe'`` or ``'unsubscribe'``, as the form asks. The buttons
+    post the action they show, so a repeated submit does not undo itself;
+    without one the current subscription is toggled.
+    """
+    action = request.POST.get('action')
+    if action in ('subscribe', 'unsubscribe'):
+        return action
+    return 'unsubscribe' if is_subscribed else 'subscribe'
+
+
 @login_required
+@role_required(Profile.Role.READER, message="Only readers can subscribe to publishers.",
+               redirect_to='publisher_detail')
 def subscribe_publisher(request, publisher_id):
     """
     Allows a Reader to subscribe to or unsubscribe from a Publisher.
@@ -340,34 +448,32 @@ def subscribe_publisher(request, publisher_id):
         messages.error(request, "Invalid request method.")
         return redirect('publisher_detail', publisher_id=publisher_id)
 
-    if not (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.READER):
-        messages.error(request, "Only readers can subscribe to publishers.")
-        return redirect('publisher_detail', publisher_id=publisher_id)
-
     publisher = get_object_or_404(Publisher, pk=publisher_id)
-    user_profile = request.user.profile
+    user_profile = request.role.profile
 
-    if user_profile.sub_publisher.filter(pk=publisher.pk).exists():
-        user_profile.sub_publisher.remove(publisher)
+    action = _subscription_action(request, publisher.pk in subscriptions_of(user_profile.pk).publishers)
+    if action == 'unsubscribe':
+        unsubscribe(PUBLISHER, user_profile.pk, [publisher.pk])
         messages.success(request, f"You have unsubscribed from {publisher.name}.")
     else:
-        user_profile.sub_publisher.add(publisher)
+        subscribe(PUBLISHER, user_profile.pk, [publisher.pk])
         messages.success(request, f"You have subscribed to {publisher.name}.")
-        return redirect('publisher_detail', publisher_id=publisher_id)
+    return redirect('publisher_detail', publisher_id=publisher_id)
 
 
-def journalist_detail(request, user_id):
+async def journalist_detail(request, user_id):
     """
     Displays details of a specific journalist user.
     """
-    journalist = get_object_or_404(User, pk=user_id)
-    if not (hasattr(journalist, 'profile') and journalist.profile.role == Profile.Role.JOURNALIST):
+    role = await aload_role(request)
+    journalist = await aget_object_or_404(User.objects.select_related('profile__publisher'), pk=user_id)
+    if not RoleContext(journalist).is_journalist:
         messages.error(request, "User is not a journalist.")
         return redirect('home') # Redirect to home or a list of journalists
 
     is_subscribed = False
-    if request.user.is_authenticated and hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.READER:
-        is_subscribed = request.user.profile.sub_journalist.filter(pk=journalist.pk).exists()
+    if role.is_reader:
+        is_subscribed = journalist.pk in (await asubscriptions_of(role.profile.pk)).journalists
 
     return render(request, 'journalist_detail.html', {
         'journalist': journalist,
@@ -376,6 +482,8 @@ def journalist_detail(request, user_id):
 
 
 @login_required
+@role_required(Profile.Role.READER, message="Only readers can subscribe to journalists.",
+               redirect_to='journalist_detail')
 def subscribe_journalist(request, user_id):
     """
     Allows a Reader to subscribe to or unsubscribe from a Journalist.
@@ -384,23 +492,28 @@ def subscribe_journalist(request, user_id):
         messages.error(request, "Invalid request method.")
         return redirect('journalist_detail', user_id=user_id)
 
-    if not (hasattr(request.user, 'profile') and request.user.profile.role == Profile.Role.READER):
-        messages.error(request, "Only readers can subscribe to journalists.")
-        return redirect('journalist_detail', user_id=user_id)
-
-    journalist_user = get_object_or_404(User, pk=user_id)
+    journalist_user = get_object_or_404(User.objects.select_related('profile'), pk=user_id)
 
-    if not (hasattr(journalist_user, 'profile') and journalist_user.profile.role == Profile.Role.JOURNALIST):
+    if not RoleContext(journalist_user).is_journalist:
         messages.error(request, f"{journalist_user.username} is not a journalist.")
         return redirect('home')
 
-    user_profile = request.user.profile
+    user_profile = request.role.profile
 
-    if user_profile.sub_journalist.filter(pk=journalist_user.pk).exists():
-        user_profile.sub_journalist.remove(journalist_user)
+    action = _subscription_action(request, journalist_user.pk in subscriptions_of(user_profile.pk).journalists)
+    if action == 'unsubscribe':
+        unsubscribe(JOURNALIST, user_profile.pk, [journalist_user.pk])
         messages.success(request, f"You have unsubscribed from {journalist_user.username}.")
     else:
-        user_profile.sub_journalist.add(journalist_user)
+        subscribe(JOURNALIST, user_profile.pk, [journalist_user.pk])
         messages.success(request, f"You have subscribed to {journalist_user.username}.")
     
-    return redirect('journalist_detail', user_id=user_id)
\ No newline at end of file
+    return redirect('journalist_detail', user_id=user_id)
+
+
+@staff_member_required
+def metrics_view(request):
+    """
+    Returns the application counters and gauges as JSON (staff only).
+    """
+    return JsonResponse(metrics.snapshot())
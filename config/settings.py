@@ -49,15 +49,19 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'accounts',
     'bronewsapp',
+    'api',
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'bronewsapp.profiling.QueryProfileMiddleware',
+    'bronewsapp.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.roles.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,6 +85,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Resets per-process state (such as buffered view counts) around test runs.
+TEST_RUNNER = 'bronewsapp.testing.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -98,6 +105,72 @@ DATABASES = {
      }
  }
 
+# Read replicas, as comma-separated database URLs (e.g. postgres://... or
+# sqlite:////path/to/replica.sqlite3). Safe requests read from them; after a
+# write the client reads from the primary for REPLICA_PIN_SECONDS (see
+# bronewsapp.routers). Tests use the primary in their place.
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[]), start=1):
+    DATABASES[f'replica{number}'] = {**env.db_url_config(url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['bronewsapp.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", default=15)
+
+# Cache
+# Defaults to a per-process memory cache; point CACHE_URL at a shared backend
+# (e.g. redis://, memcache:// or dbcache://cache_table) in production so
+# every worker sees the same values.
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Per-request query profiling (off by default). Query shapes repeated at least
+# QUERY_PROFILE_N_PLUS_ONE_THRESHOLD times in one request are logged as N+1s.
+QUERY_PROFILE = env.bool("QUERY_PROFILE", default=False)
+QUERY_PROFILE_HEADER = env.bool("QUERY_PROFILE_HEADER", default=False)
+QUERY_PROFILE_N_PLUS_ONE_THRESHOLD = env.int("QUERY_PROFILE_N_PLUS_ONE_THRESHOLD", default=3)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'bronewsapp.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Bulk approval: ids per UPDATE statement, and the most ids one request may approve.
+APPROVAL_BATCH_SIZE = env.int("APPROVAL_BATCH_SIZE", default=500)
+APPROVAL_BULK_MAX = env.int("APPROVAL_BULK_MAX", default=1000)
+
+# Lifetime of cached publisher page fragments. They are invalidated on every
+# related write, so this only bounds how long unused versions linger.
+PUBLISHER_CACHE_TIMEOUT = env.int("PUBLISHER_CACHE_TIMEOUT", default=60 * 60)
+
+# Lifetime of anonymous full-page cache entries. Pages are purged by surrogate
+# key on every related write, so this only bounds how long unused pages linger.
+PAGE_CACHE_TIMEOUT = env.int("PAGE_CACHE_TIMEOUT", default=10 * 60)
+
+# Lifetime of each reader's cached subscribed journalist/publisher ids. They are
+# dropped on every change, so this only bounds staleness across separate caches.
+SUBSCRIPTION_CACHE_TIMEOUT = env.int("SUBSCRIPTION_CACHE_TIMEOUT", default=10 * 60)
+
+# Subscriptions inserted per statement by bulk imports, and the most one
+# request to the subscription import endpoint may list.
+SUBSCRIPTION_IMPORT_BATCH_SIZE = env.int("SUBSCRIPTION_IMPORT_BATCH_SIZE", default=500)
+SUBSCRIPTION_IMPORT_MAX = env.int("SUBSCRIPTION_IMPORT_MAX", default=5000)
+
+# Loads each user's profile together with the user (see accounts.backends).
+# ModelBackend stays listed so sessions created before ProfileBackend remain valid.
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.ProfileBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -145,6 +218,80 @@ LOGOUT_REDIRECT_URL = "login"
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Notification outbox worker (python manage.py process_outbox):
+OUTBOX_BATCH_SIZE = env.int("OUTBOX_BATCH_SIZE", default=50)
+OUTBOX_POLL_INTERVAL = env.float("OUTBOX_POLL_INTERVAL", default=2.0)
+OUTBOX_MAX_ATTEMPTS = env.int("OUTBOX_MAX_ATTEMPTS", default=8)
+OUTBOX_RETRY_BASE_DELAY = env.int("OUTBOX_RETRY_BASE_DELAY", default=30)
+OUTBOX_RETRY_MAX_DELAY = env.int("OUTBOX_RETRY_MAX_DELAY", default=3600)
+OUTBOX_LEASE_SECONDS = env.int("OUTBOX_LEASE_SECONDS", default=300)
+
+# Subscriber fan-out emails: recipients per (BCC) message, messages per
+# SMTP hand-off, and rows fetched per database round-trip.
+SUBSCRIBER_EMAIL_CHUNK_SIZE = env.int("SUBSCRIBER_EMAIL_CHUNK_SIZE", default=100)
+SUBSCRIBER_EMAIL_MESSAGES_PER_SEND = env.int("SUBSCRIBER_EMAIL_MESSAGES_PER_SEND", default=20)
+SUBSCRIBER_EMAIL_FETCH_SIZE = env.int("SUBSCRIBER_EMAIL_FETCH_SIZE", default=2000)
+
+# Reader feeds: sources with more subscribers than the threshold are merged in
+# at read time instead of being fanned out on write.
+FEED_FANOUT_THRESHOLD = env.int("FEED_FANOUT_THRESHOLD", default=10000)
+FEED_FANOUT_BATCH_SIZE = env.int("FEED_FANOUT_BATCH_SIZE", default=1000)
+FEED_BACKFILL_LIMIT = env.int("FEED_BACKFILL_LIMIT", default=200)
+FEED_AUDIENCE_CACHE_SECONDS = env.int("FEED_AUDIENCE_CACHE_SECONDS", default=600)
+
+# Results per page for full-text search (HTML and API).
+SEARCH_PAGE_SIZE = env.int("SEARCH_PAGE_SIZE", default=20)
+
+# Items per page of the article and newsletter list pages.
+LIST_PAGE_SIZE = env.int("LIST_PAGE_SIZE", default=25)
+
+# API page sizes for keyset paginated endpoints (?limit= is capped at the max).
+API_PAGE_SIZE = env.int("API_PAGE_SIZE", default=20)
+API_MAX_PAGE_SIZE = env.int("API_MAX_PAGE_SIZE", default=100)
+
+# Publisher archives: rows fetched per cursor round trip, and characters
+# gathered into each chunk of the streamed response.
+ARCHIVE_CHUNK_SIZE = env.int("ARCHIVE_CHUNK_SIZE", default=2000)
+ARCHIVE_STREAM_BUFFER = env.int("ARCHIVE_STREAM_BUFFER", default=64 * 1024)
+
+# Page views are buffered in each process and added to the stored counts by
+# a background thread every this many seconds (0 writes each view as soon as
+# the thread gets to it), sooner once this many distinct pages are waiting,
+# and at exit.
+VIEW_COUNT_FLUSH_SECONDS = env.int("VIEW_COUNT_FLUSH_SECONDS", default=10)
+VIEW_COUNT_MAX_PENDING = env.int("VIEW_COUNT_MAX_PENDING", default=1000)
+
+# Trending articles on the home page: how fast activity fades, what a view
+# and a new subscription (to each of the source's articles approved in the
+# last TRENDING_WINDOW_DAYS) are worth, the decayed score below which an
+# article leaves the ranking, how many are shown, and how often
+# compact_trending prunes the ranking and refreshes the cached home page.
+TRENDING_HALF_LIFE_HOURS = env.float("TRENDING_HALF_LIFE_HOURS", default=24.0)
+TRENDING_VIEW_WEIGHT = env.float("TRENDING_VIEW_WEIGHT", default=1.0)
+TRENDING_SUBSCRIPTION_WEIGHT = env.float("TRENDING_SUBSCRIPTION_WEIGHT", default=20.0)
+TRENDING_WINDOW_DAYS = env.int("TRENDING_WINDOW_DAYS", default=7)
+TRENDING_MIN_SCORE = env.float("TRENDING_MIN_SCORE", default=0.5)
+TRENDING_SIZE = env.int("TRENDING_SIZE", default=10)
+TRENDING_COMPACT_INTERVAL = env.int("TRENDING_COMPACT_INTERVAL", default=300)
+
+# Related items on article and newsletter pages (build_related): how many each
+# item keeps, the lowest cosine similarity that counts, words ignored for being
+# in fewer than RELATED_MIN_DF items or more than the RELATED_MAX_DF share of
+# them, rows scored per matrix product, and the saved index the outbox worker
+# adds approvals to (shared by every service that builds or approves).
+RELATED_COUNT = env.int("RELATED_COUNT", default=5)
+RELATED_MIN_SCORE = env.float("RELATED_MIN_SCORE", default=0.1)
+RELATED_MIN_DF = env.int("RELATED_MIN_DF", default=2)
+RELATED_MAX_DF = env.float("RELATED_MAX_DF", default=0.5)
+RELATED_CHUNK_SIZE = env.int("RELATED_CHUNK_SIZE", default=256)
+RELATED_INDEX_PATH = env.str("RELATED_INDEX_PATH", default=str(BASE_DIR / "related_index.npz"))
+
+# How long each process trusts a verified API token (and remembers a rejected
+# one) before checking the database again. Bounds how long a revoked token
+# keeps working in other processes.
+API_TOKEN_CACHE_SECONDS = env.int("API_TOKEN_CACHE_SECONDS", default=30)
+API_TOKEN_CACHE_SIZE = env.int("API_TOKEN_CACHE_SIZE", default=10000)
+
 # Twitter API variables:
 API_KEY = env("API_KEY")
 API_KEY_SECRET = env("API_KEY_SECRET")
@@ -152,6 +299,12 @@ ACCESS_TOKEN = env("ACCESS_TOKEN")
 ACCESS_TOKEN_SECRET = env("ACCESS_TOKEN_SECRET")
 BEARER_TOKEN = env("BEARER_TOKEN")
 
+# Posting limit applied by the tweet token bucket ("POSTS per WINDOW seconds"),
+# and the API host, which can point at a local fake server for testing.
+TWITTER_RATE_LIMIT_POSTS = env.int("TWITTER_RATE_LIMIT_POSTS", default=100)
+TWITTER_RATE_LIMIT_WINDOW = env.int("TWITTER_RATE_LIMIT_WINDOW", default=15 * 60)
+TWITTER_API_HOST = env("TWITTER_API_HOST", default="https://api.twitter.com")
+
 extensions = [
     'sphinx.ext.autodoc',
     'sphinx_rtd_theme',
@@ -0,0 +1,19 @@
+#!/bin/sh
+# Starts the web server under gunicorn.
+#   SERVER_MODE=wsgi (default): sync workers on config.wsgi.
+#   SERVER_MODE=asgi: uvicorn workers on config.asgi, which run the async
+#   read views without tying up a worker per request.
+set -e
+
+BIND="${BIND:-0.0.0.0:8000}"
+WORKERS="${WEB_WORKERS:-3}"
+
+case "${SERVER_MODE:-wsgi}" in
+  wsgi)
+    exec gunicorn --bind "$BIND" --workers "$WORKERS" config.wsgi:application ;;
+  asgi)
+    exec gunicorn --bind "$BIND" --workers "$WORKERS" --worker-class uvicorn_worker.UvicornWorker config.asgi:application ;;
+  *)
+    echo "Unknown SERVER_MODE '$SERVER_MODE' (expected wsgi or asgi)." >&2
+    exit 1 ;;
+esac